@@ -6,12 +6,14 @@
     """,
     'description': """
     """,
+    'version': '17.0.1.3.0',
     'author': 'Mario Roshdy',
     'website': "www.linkedin.com/in/mario-roshdy-ba8688169",
     'depends': ['base', 'point_of_sale'],
     'data': [
         'security/res_groups.xml',
         'security/ir.model.access.csv',
+        'data/ir_cron_data.xml',
         'views/pos_device_config_view.xml',
         'views/pos_config_view.xml',
         'views/product_template_view.xml',
@@ -3,9 +3,10 @@
 
 from odoo import api, fields, models, _
 from odoo.exceptions import ValidationError, UserError
-import json
 import hashlib
 
+from ..tools.canonical import serialize_receipt
+
 receipt = {
     "header": {
         "dateTimeIssued": "2022-06-12T00:00:00Z",
@@ -473,21 +474,7 @@ receipt = {
 # if isinstance(object, float):
 #     pass
 
-def _serialize_for_signing(eta_inv):
-    if not isinstance(eta_inv, dict):
-        return json.dumps(str(eta_inv), ensure_ascii=False)
-
-    canonical_str = []
-    for key, value in eta_inv.items():
-        if not isinstance(value, list):
-            canonical_str.append(json.dumps(key, ensure_ascii=False).upper())
-            canonical_str.append(_serialize_for_signing(value))
-        else:
-            canonical_str.append(json.dumps(key, ensure_ascii=False).upper())
-            for elem in value:
-                canonical_str.append(json.dumps(key, ensure_ascii=False).upper())
-                canonical_str.append(_serialize_for_signing(elem))
-    return ''.join(canonical_str)
+_serialize_for_signing = serialize_receipt
 
 
 ser = _serialize_for_signing(receipt)
@@ -1,7 +1,9 @@
 from odoo import fields, models, api
-import json
 import hashlib
 
+from ..tools import eta_http
+from ..tools.canonical import canonical_hash, serialize_receipt
+
 
 class POSDeviceConfig(models.Model):
     _name = 'pos.device.config'
@@ -29,6 +31,9 @@ class POSDeviceConfig(models.Model):
     access_token = fields.Text('Access Token')
     token_expiration_date = fields.Datetime('Token Expiration Date')
     production_env = fields.Boolean('Production Env')
+    eta_chain_uuid = fields.Char('Last Receipt UUID', copy=False, readonly=True,
+                                 help='UUID of the last receipt accepted by ETA, previous UUID of the next one')
+    eta_chain_sequence = fields.Integer('Chained Receipts', copy=False, readonly=True)
 
     def _set_pos_with_config(self):
         if self.pos_id:
@@ -36,22 +41,53 @@ class POSDeviceConfig(models.Model):
 
     @api.model
     def _serialize_receipt(self, receipt_dict):
-        if not isinstance(receipt_dict, dict):
-            return json.dumps(str(receipt_dict), ensure_ascii=False)
-
-        canonical_str = []
-        for key, value in receipt_dict.items():
-            if not isinstance(value, list):
-                canonical_str.append(json.dumps(key, ensure_ascii=False).upper())
-                canonical_str.append(self._serialize_receipt(value))
-            else:
-                canonical_str.append(json.dumps(key, ensure_ascii=False).upper())
-                for elem in value:
-                    canonical_str.append(json.dumps(key, ensure_ascii=False).upper())
-                    canonical_str.append(self._serialize_receipt(elem))
-        return ''.join(canonical_str)
+        return serialize_receipt(receipt_dict)
 
     @api.model
     def _hash_serialized_receipt(self, serialized):
         hashed_data = hashlib.sha256(serialized.encode()).digest().hex()
         return hashed_data
+
+    @api.model
+    def _hash_receipt(self, receipt_dict):
+        """Return the UUID of the receipt, hashing its canonical form while serializing it"""
+        return canonical_hash(receipt_dict)
+
+    def _get_eta_connection_key(self):
+        self.ensure_one()
+        return self.env.cr.dbname, self.id, self.client_id, self.production_env
+
+    def _get_eta_session(self):
+        """Keep-alive session of the current worker for the ETA calls of the device"""
+        return eta_http.get_session(self._get_eta_connection_key())
+
+    def _get_eta_chain_head(self):
+        """Return the UUID of the last receipt of the device, the previousUUID
+        of its next receipt"""
+        self.ensure_one()
+        if not self.eta_chain_uuid and self.pos_id:
+            # Devices without a chain head yet start after their last valid receipt
+            last_order = self.env['pos.order'].search(
+                [('config_id', '=', self.pos_id.id), ('eta_submit_state', '=', 'sent'), ('eta_status', '=', 'valid')],
+                order='date_order desc, id desc', limit=1)
+            return last_order.eta_uuid or ""
+        return self.eta_chain_uuid or ""
+
+    def _lock_eta_chain_head(self):
+        """Lock the chain head of the device until the end of the transaction,
+        so that concurrent submissions chain one after the other"""
+        if not self:
+            return ""
+        self.ensure_one()
+        self.env.cr.execute("SELECT id FROM pos_device_config WHERE id = %s FOR NO KEY UPDATE", [self.id])
+        self.invalidate_recordset(['eta_chain_uuid', 'eta_chain_sequence'])
+        return self._get_eta_chain_head()
+
+    def _advance_eta_chain(self, orders):
+        """Move the chain head after ``orders``, the accepted receipts in submission order"""
+        self.ensure_one()
+        if orders:
+            self.write({
+                'eta_chain_uuid': orders[-1].eta_uuid,
+                'eta_chain_sequence': self.eta_chain_sequence + len(orders),
+            })
@@ -1,3 +1,4 @@
+from collections import defaultdict
 from datetime import datetime, timedelta
 import json
 import pprint
@@ -5,13 +6,11 @@ import logging
 import psycopg2
 from odoo import api, fields, models, tools, _
 from odoo.exceptions import ValidationError
-import requests
 from odoo import api, models, _
-import urllib3
-import ssl
 import math
-from time import sleep
+import time
 from odoo.tools.float_utils import json_float_round
+from ..tools import eta_http
 
 _logger = logging.getLogger(__name__)
 
@@ -22,29 +21,24 @@ ETA_URLS = {
     'submit_receipt_pro': 'https://api.invoicing.eta.gov.eg/api/v1/receiptsubmissions',
     'get_receipt_pre': 'https://api.preprod.invoicing.eta.gov.eg/api/v1/receipts/%s/raw',
     'get_receipt_pro': 'https://api.invoicing.eta.gov.eg/api/v1/receipts/%s/raw',
+    'get_receipt_submission_pre': 'https://api.preprod.invoicing.eta.gov.eg/api/v1/receiptsubmissions/%s/details?PageNo=%s&PageSize=100',
     'get_receipt_submission_pro': 'https://api.invoicing.eta.gov.eg/api/v1/receiptsubmissions/%s/details?PageNo=%s&PageSize=100'
     # 100 receipts count per page is max
 }
 
-
-class CustomHttpAdapter(requests.adapters.HTTPAdapter):
-    '''Transport adapter" that allows us to use custom ssl_context.'''
-
-    def __init__(self, ssl_context=None, **kwargs):
-        self.ssl_context = ssl_context
-        super().__init__(**kwargs)
-
-    def init_poolmanager(self, connections, maxsize, block=False, **pool_kwargs):
-        self.poolmanager = urllib3.poolmanager.PoolManager(
-            num_pools=connections, maxsize=maxsize,
-            block=block, ssl_context=self.ssl_context)
+# Outbox: receipts per submission, retry backoff and status polling (seconds)
+ETA_MAX_BATCH_SIZE = 500
+ETA_RETRY_BACKOFF = 60
+ETA_MAX_RETRY_BACKOFF = 3600
+ETA_POLL_DELAY = 10
+ETA_MAX_POLL_ATTEMPTS = 8
 
 
 class POSOrder(models.Model):
     _inherit = 'pos.order'
 
     eta_uuid = fields.Char('ETA UUID', copy=False, index=True)
-    eta_submission_uuid = fields.Char('ETA Submission UUID')
+    eta_submission_uuid = fields.Char('ETA Submission UUID', copy=False, index=True)
     eta_submit_state = fields.Selection([('unsent', _('Unsent')),
                                          ('sent', _('Sent'))], default='unsent', copy=False)
     eta_status = fields.Selection([('invalid', 'Invalid'),
@@ -52,6 +46,13 @@ class POSOrder(models.Model):
                                    ('inprogress', 'In progress'),
                                    ('undetected', 'Undetected')], copy=False)
     invalid_reason = fields.Text('Validation Error')
+    eta_outbox_state = fields.Selection([('queued', 'Queued'),
+                                         ('polling', 'Awaiting Status')], string='ETA Outbox', copy=False, index=True)
+    eta_next_attempt = fields.Datetime('ETA Next Attempt', copy=False)
+    eta_attempts = fields.Integer('ETA Attempts', copy=False)
+    eta_last_error = fields.Text('ETA Last Error', copy=False)
+    eta_last_reconciled = fields.Datetime('ETA Last Reconciled', copy=False,
+                                          help='Last check of the submission by the reconciliation cron.')
 
     can_edit_order_date = fields.Boolean(compute='_compute_can_edit_order_date')
 
@@ -64,7 +65,7 @@ class POSOrder(models.Model):
             else:
                 order.can_edit_order_date = False
 
-    def _prepare_header_info(self, date_order=False):
+    def _prepare_header_info(self, date_order=False, previous_uuid=None):
         if not date_order:
             date_order = self.date_order
 
@@ -77,7 +78,7 @@ class POSOrder(models.Model):
             "dateTimeIssued": date_string,
             "receiptNumber": self.pos_reference,
             "uuid": "",
-            "previousUUID": self._get_previous_order(),
+            "previousUUID": self._get_previous_order() if previous_uuid is None else previous_uuid,
         }
 
         if self.amount_total < 0.0:
@@ -106,12 +107,7 @@ class POSOrder(models.Model):
         return header
 
     def _get_previous_order(self):
-        order_ids = self.search(
-            [('config_id', '=', self.config_id.id), ('eta_submit_state', '=', 'sent'), ('eta_status', '=', 'valid'),
-             ('id', '!=', self.id)], order='date_order desc')
-        if not order_ids:
-            return ""
-        return order_ids[0].eta_uuid or ""
+        return self.config_id.device_config_id._get_eta_chain_head()
 
     def _prepare_seller_info(self):
         device_config_id = self.config_id.device_config_id
@@ -221,7 +217,7 @@ class POSOrder(models.Model):
                                   partner=line.order_id.partner_id or False)['taxes']
             for tax in taxes:
                 new_tax = True
-                taxType = self.env['account.tax'].sudo().browse(tax['id']).eg_eta_code.split('_')[0].upper()
+                taxType = tax['eg_eta_code'].split('_')[0].upper()
                 for line in tax_lines:
                     if taxType and line['taxType'] == taxType:
                         line['amount'] += self._get_amount(tax['amount'])
@@ -239,10 +235,10 @@ class POSOrder(models.Model):
 
         return tax_lines
 
-    def _prepare_receipt_data(self, date_order=False):
+    def _prepare_receipt_data(self, date_order=False, previous_uuid=None):
         lines = self._prepare_item_lines()
         return {
-            "header": self._prepare_header_info(date_order),
+            "header": self._prepare_header_info(date_order, previous_uuid),
             "documentType": {
                 "receiptType": "S" if self.amount_total > 0.0 else "r",
                 "typeVersion": "1.2"
@@ -273,14 +269,12 @@ class POSOrder(models.Model):
         return sum([sum(map(lambda l: l, line.get('itemDiscountData', [0]))) for line in lines])
 
     def _action_gen_uuid(self, receipt_data):
-        DEVICE_CONFIG = self.env['pos.device.config']
-        SERIALIZED_DATA = DEVICE_CONFIG._serialize_receipt(receipt_data)
-        UUID = DEVICE_CONFIG._hash_serialized_receipt(SERIALIZED_DATA)
+        UUID = self.env['pos.device.config']._hash_receipt(receipt_data)
         self.eta_uuid = UUID
         return UUID
 
-    def _prepare_receipt_for_eta(self, date_order=False):
-        receipt_data = self._prepare_receipt_data(date_order)
+    def _prepare_receipt_for_eta(self, date_order=False, previous_uuid=None):
+        receipt_data = self._prepare_receipt_data(date_order, previous_uuid)
         uuid = self._action_gen_uuid(receipt_data)
         receipt_data['header']['uuid'] = uuid
         return receipt_data, uuid
@@ -306,11 +300,9 @@ class POSOrder(models.Model):
             'Content-Type': 'application/x-www-form-urlencoded'
         }
         try:
-            session = requests.session()
-            ctx = ssl.create_default_context(ssl.Purpose.SERVER_AUTH)
-            ctx.options |= 0x4
-            session.mount('https://', CustomHttpAdapter(ctx))
-            response = session.request("POST", url, headers=headers, data=payload)
+            DEVICE_CONFIG = self.config_id.device_config_id
+            response = DEVICE_CONFIG._get_eta_session().request("POST", url, headers=headers, data=payload,
+                                                                timeout=eta_http.TIMEOUT)
             _logger.info('Token Request: %s.' % response.text)
             response_data = response.json()
             if 'error' in response_data:
@@ -318,10 +310,11 @@ class POSOrder(models.Model):
 
             token = response_data.get('access_token')
             if token:
-                DEVICE_CONFIG = self.config_id.device_config_id
                 DEVICE_CONFIG.access_token = token
                 DEVICE_CONFIG.token_expiration_date = datetime.now() + timedelta(
                     seconds=response_data.get('expires_in'))
+                eta_http.set_token(DEVICE_CONFIG._get_eta_connection_key(), token,
+                                   time.time() + response_data.get('expires_in'))
                 return token
         except Exception as ex:
             raise ValidationError(_('%s' % ex))
@@ -338,7 +331,14 @@ class POSOrder(models.Model):
 
     def _get_exist_access_token(self):
         DEVICE_CONFIG = self.config_id.device_config_id
+        key = DEVICE_CONFIG._get_eta_connection_key()
+        token = eta_http.get_token(key)
+        if token:
+            return token
         if DEVICE_CONFIG.access_token and DEVICE_CONFIG.token_expiration_date and datetime.now() <= DEVICE_CONFIG.token_expiration_date:
+            # Token of another worker, cached for the calls of this one
+            remaining = (DEVICE_CONFIG.token_expiration_date - datetime.now()).total_seconds()
+            eta_http.set_token(key, DEVICE_CONFIG.access_token, time.time() + remaining)
             return DEVICE_CONFIG.access_token
         return False
 
@@ -377,18 +377,15 @@ class POSOrder(models.Model):
             if not get_url:
                 raise ValidationError(_('ETA receipt URL not configured for order %s') % order.name)
 
-            # Prepare headers and session for the request
+            # Prepare headers for the request, sent on the pooled session of the device
             headers = {
                 'Authorization': f'Bearer {access_token}',
                 'Content-Type': 'application/json',
             }
-            session = requests.session()
-            ctx = ssl.create_default_context(ssl.Purpose.SERVER_AUTH)
-            ctx.options |= 0x4  # Disable SSL certificate verification warnings
-            session.mount('https://', CustomHttpAdapter(ctx))
 
             # Make the GET request
-            response = session.request("GET", get_url % uuid, headers=headers, data={})
+            response = device_config._get_eta_session().request("GET", get_url % uuid, headers=headers,
+                                                                timeout=eta_http.TIMEOUT)
 
             try:
                 response_data = response.json()
@@ -427,58 +424,90 @@ class POSOrder(models.Model):
                 fetch_eta_status(order, uuid, access_token, order.config_id.device_config_id)
 
     def _action_get_eta_receipt_status(self, eta_submission_id, access_token, device_config_id):
-        page_count = math.ceil(len(self.search([('eta_submission_uuid', '=', eta_submission_id)])) / 100)
+        page_count = math.ceil(self.search_count([('eta_submission_uuid', '=', eta_submission_id)]) / 100)
         for page in range(1, page_count + 1):
             if device_config_id.production_env:
                 url = ETA_URLS['get_receipt_submission_pro'] % (eta_submission_id, page)
             else:
-                url = ETA_URLS['get_receipt_submission_pre']
+                url = ETA_URLS['get_receipt_submission_pre'] % (eta_submission_id, page)
 
             headers = {
                 'Authorization': 'Bearer %s' % access_token,
             }
 
             try:
-                session = requests.session()
-                ctx = ssl.create_default_context(ssl.Purpose.SERVER_AUTH)
-                ctx.options |= 0x4
-                ctx.check_hostname = False
-                ctx.verify_mode = ssl.CERT_NONE
-                session.mount('https://', CustomHttpAdapter(ctx))
-                response = session.request("GET", url, headers=headers, data={}, verify=False)
+                response = device_config_id._get_eta_session().request("GET", url, headers=headers,
+                                                                       timeout=eta_http.TIMEOUT)
 
                 response_data = response.json()
                 _logger.info('Receipt status response: %s.' % response.text)
 
                 if 'submissionUuid' in response_data and 'receipts' not in response_data:
-                    for receipt in self.search([('eta_submission_uuid', '=', response_data.get('submissionUuid'))]):
-                        receipt.write({
-                            'eta_status': response_data['status'].lower() if 'status' in response_data else 'undetected'
-                        })
-
-                        if 'errors' in response_data:
-                            receipt.write({
-                                'invalid_reason': response_data['errors']
-                            })
+                    self.search([('eta_submission_uuid', '=', response_data.get('submissionUuid'))]).write(
+                        self._prepare_eta_status_vals(response_data))
                 else:
-                    for receipt in response_data.get('receipts', []):
-                        rec = self.search([('eta_uuid', '=', receipt['uuid'])])
-                        rec.write({
-                            'eta_status': receipt['status'].lower() if 'status' in receipt else 'undetected'
-                        })
-
-                        if 'errors' in receipt:
-                            rec.write({
-                                'invalid_reason': receipt['errors']
-                            })
+                    self._apply_eta_receipt_statuses(response_data.get('receipts', []))
 
             except Exception as ex:
                 _logger.error('Error When Get Receipt Status: %s.' % ex)
                 raise ValidationError(_('%s' % ex))
 
+    @api.model
+    def _prepare_eta_status_vals(self, receipt):
+        vals = {'eta_status': receipt['status'].lower() if 'status' in receipt else 'undetected'}
+        if 'errors' in receipt:
+            vals['invalid_reason'] = str(receipt['errors'])
+        return vals
+
+    @api.model
+    def _apply_eta_receipt_statuses(self, receipts):
+        """Write the statuses of a page of ETA receipts on their orders, found
+        with one query and updated with one write per distinct status"""
+        uuids = [receipt['uuid'] for receipt in receipts if receipt.get('uuid')]
+        if not uuids:
+            return
+        orders_by_uuid = defaultdict(lambda: self.browse())
+        for order in self.search([('eta_uuid', 'in', uuids)]):
+            orders_by_uuid[order.eta_uuid] |= order
+        orders_by_vals = defaultdict(lambda: self.browse())
+        for receipt in receipts:
+            orders = orders_by_uuid.get(receipt.get('uuid'))
+            if orders:
+                orders_by_vals[tuple(sorted(self._prepare_eta_status_vals(receipt).items()))] |= orders
+        for vals, orders in orders_by_vals.items():
+            orders.write(dict(vals))
+
+    @api.model
+    def _cron_reconcile_eta_submissions(self):
+        """Fetch the status of the submissions whose receipts are still without a
+        final status and are no longer polled by the outbox, a page of
+        submissions per run, the least recently reconciled first"""
+        limit = int(self.env['ir.config_parameter'].sudo().get_param(
+            'eta_ereceipt_integration.reconcile_batch', 50))
+        submissions = self._read_group(
+            [('eta_submit_state', '=', 'sent'), ('eta_submission_uuid', '!=', False),
+             ('eta_status', 'not in', ('valid', 'invalid')), ('eta_outbox_state', '=', False)],
+            groupby=['eta_submission_uuid', 'config_id'], aggregates=['eta_last_reconciled:min'],
+            order='eta_last_reconciled:min ASC NULLS FIRST, eta_submission_uuid', limit=limit)
+        for eta_submission_id, config, dummy in submissions:
+            orders = self.search([('eta_submission_uuid', '=', eta_submission_id),
+                                  ('config_id', '=', config.id)])
+            device_config = config.device_config_id
+            if device_config:
+                try:
+                    access_token = orders[:1]._get_access_token()
+                    self._action_get_eta_receipt_status(eta_submission_id, access_token, device_config)
+                except ValidationError as ex:
+                    _logger.warning('Could not reconcile the ETA submission %s: %s', eta_submission_id, ex)
+                    self.env.cr.rollback()
+            # Checked or not, the submission goes after the others in the next runs
+            orders.write({'eta_last_reconciled': fields.Datetime.now()})
+            self.env.cr.commit()
+
     def action_send_eta_receipt(self):
         payload = {"receipts": []}
         main_order = False
+        previous_uuid = self[:1].config_id.device_config_id._lock_eta_chain_head()
         for order in self:
             if main_order and main_order.config_id != order.config_id:
                 raise ValidationError(_('All orders must be from one pos while send patch.'))
@@ -490,15 +519,22 @@ class POSOrder(models.Model):
             if order.eta_submit_state == 'sent' and order.eta_status == 'valid':
                 raise ValidationError(_('This receipt was already sent and valid.'))
 
-            receipt_data, uuid = order._prepare_receipt_for_eta()
+            receipt_data, previous_uuid = order._prepare_receipt_for_eta(previous_uuid=previous_uuid)
             pprint.pprint(receipt_data)
 
             payload['receipts'].append(receipt_data)
 
-        access_token = main_order._get_access_token()
+        response_data = main_order._post_eta_receipts(payload)
+        self._apply_eta_submission(response_data)
+        self._trigger_eta_outbox()
+
+    def _post_eta_receipts(self, payload):
+        """Submit ``payload`` to ETA with the credentials of the POS of the order and
+        return the response"""
+        access_token = self._get_access_token()
         _logger.info('Access Token: %s.' % access_token)
 
-        if main_order.config_id.device_config_id.production_env:
+        if self.config_id.device_config_id.production_env:
             url = ETA_URLS['submit_receipt_pro']
         else:
             url = ETA_URLS['submit_receipt_pre']
@@ -507,53 +543,204 @@ class POSOrder(models.Model):
             'Content-Type': 'application/json'
         }
 
-        data = json.dumps(payload, ensure_ascii=False, indent=4).encode('utf-8')
+        data = json.dumps(payload, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
         try:
-            session = requests.session()
-            ctx = ssl.create_default_context(ssl.Purpose.SERVER_AUTH)
-            ctx.options |= 0x4
-            session.mount('https://', CustomHttpAdapter(ctx))
-            response = session.request("POST", url, headers=headers, data=data)
+            DEVICE_CONFIG = self.config_id.device_config_id
+            response = DEVICE_CONFIG._get_eta_session().request("POST", url, headers=headers, data=data,
+                                                                timeout=eta_http.TIMEOUT)
             _logger.info('Submit URL: %s.' % url)
             _logger.info('Returned Response: %s.' % response.text)
+            if response.status_code == 401:
+                # Revoked or expired early, the next attempt asks for a new token
+                eta_http.discard_token(DEVICE_CONFIG._get_eta_connection_key())
+                DEVICE_CONFIG.write({'access_token': False, 'token_expiration_date': False})
+            return response.json()
+        except Exception as ex:
+            _logger.error('Error When Send: %s.' % ex)
+            raise ValidationError(_('%s' % ex))
 
-            response_data = response.json()
-
-            eta_submission_id = response_data.get('submissionId', False)
-
-            if 'acceptedDocuments' in response_data:
-                for acc_receipt in response_data['acceptedDocuments']:
-                    rec = self.search([('eta_uuid', '=', acc_receipt['uuid'])])
-                    if rec:
-                        rec.eta_submission_uuid = eta_submission_id
-                        rec.eta_submit_state = 'sent'
+    def _apply_eta_submission(self, response_data):
+        """Update the submitted orders from the response of ETA, the accepted receipts
+        wait for their status and the rejected ones leave the outbox.
 
-                # Wait 3 sec then check the status
-                sleep(3)
-                self.action_get_eta_receipt_details(eta_submission_id, access_token,
-                                                    main_order.config_id.device_config_id)
+        :return: the orders missing from the response
+        """
+        eta_submission_id = response_data.get('submissionId', False)
+        orders_by_uuid = {order.eta_uuid: order for order in self if order.eta_uuid}
+        answered = self.browse()
+        if 'acceptedDocuments' in response_data:
+            accepted = self.browse()
+            for acc_receipt in response_data['acceptedDocuments']:
+                accepted |= orders_by_uuid.get(acc_receipt['uuid'], self.browse())
+            accepted.write({
+                'eta_submission_uuid': eta_submission_id,
+                'eta_submit_state': 'sent',
+                'eta_outbox_state': 'polling',
+                'eta_next_attempt': fields.Datetime.now() + timedelta(seconds=ETA_POLL_DELAY),
+                'eta_attempts': 0,
+                'eta_last_error': False,
+            })
+            answered |= accepted
+            for device_config, orders in self._group_by_device_config(self & accepted).items():
+                device_config._advance_eta_chain(orders)
+
+        if 'rejectedDocuments' in response_data:
+            for rej_receipt in response_data['rejectedDocuments']:
+                rec = orders_by_uuid.get(rej_receipt['uuid'])
+                if rec:
+                    rec.write({
+                        'eta_submission_uuid': eta_submission_id,
+                        'eta_submit_state': 'sent',
+                        'eta_status': 'invalid',
+                        'eta_outbox_state': False,
+                    })
+                    if 'error' in rej_receipt and 'details' in rej_receipt['error']:
+                        errors = []
+                        for error in rej_receipt['error']['details']:
+                            errors.append('Message: %s, Target: %s,  Property Path: %s' % (
+                                error['message'], error['target'], error['propertyPath']))
+
+                        text_error = '\n'.join(errors)
+                        rec.invalid_reason = text_error
+                    answered |= rec
+        return self - answered
+
+    # Outbox: the orders are queued when synced and submitted by a cron, so that
+    # the checkout never waits for ETA
+
+    def _group_by_device_config(self, orders):
+        orders_by_device = defaultdict(lambda: self.browse())
+        for order in orders:
+            orders_by_device[order.config_id.device_config_id] |= order
+        return orders_by_device
+
+    def _trigger_eta_outbox(self, at=None):
+        cron = self.env.ref('eta_ereceipt_integration.ir_cron_eta_receipt_outbox', raise_if_not_found=False)
+        if cron:
+            cron._trigger(at)
+
+    def _enqueue_eta_receipt(self):
+        self.write({
+            'eta_outbox_state': 'queued',
+            'eta_next_attempt': fields.Datetime.now(),
+            'eta_attempts': 0,
+            'eta_last_error': False,
+        })
+        self._trigger_eta_outbox()
 
-            if 'rejectedDocuments' in response_data:
-                for rej_receipt in response_data['rejectedDocuments']:
-                    rec = self.search([('eta_uuid', '=', rej_receipt['uuid'])])
-                    if rec:
-                        rec.eta_submission_uuid = eta_submission_id
-                        rec.eta_submit_state = 'sent'
-                        rec.eta_status = 'invalid'
-                        if 'error' in rej_receipt and 'details' in rej_receipt['error']:
-                            errors = []
-                            for error in rej_receipt['error']['details']:
-                                errors.append('Message: %s, Target: %s,  Property Path: %s' % (
-                                    error['message'], error['target'], error['propertyPath']))
+    def _postpone_eta_outbox(self, error):
+        """Schedule the next attempt of the orders with an exponential backoff"""
+        now = fields.Datetime.now()
+        for order in self:
+            delay = min(ETA_RETRY_BACKOFF * 2 ** order.eta_attempts, ETA_MAX_RETRY_BACKOFF)
+            order.write({
+                'eta_attempts': order.eta_attempts + 1,
+                'eta_next_attempt': now + timedelta(seconds=delay),
+                'eta_last_error': error,
+            })
 
-                            text_error = '\n'.join(errors)
-                            rec.invalid_reason = text_error
+    @api.model
+    def _get_eta_batch_size(self):
+        batch_size = int(self.env['ir.config_parameter'].sudo().get_param(
+            'eta_ereceipt_integration.batch_size', 100))
+        return max(1, min(batch_size, ETA_MAX_BATCH_SIZE))
 
+    @api.model
+    def _cron_process_eta_outbox(self):
+        now = fields.Datetime.now()
+        self._process_eta_queued(now)
+        self._process_eta_polling(now)
+        next_attempt = self.search([('eta_outbox_state', '!=', False)], order='eta_next_attempt', limit=1)
+        if next_attempt.eta_next_attempt:
+            self._trigger_eta_outbox(max(next_attempt.eta_next_attempt, fields.Datetime.now()))
 
+    @api.model
+    def _process_eta_queued(self, now):
+        orders = self.search([('eta_outbox_state', '=', 'queued'), ('eta_next_attempt', '<=', now)],
+                             order='date_order, id')
+        orders_by_device = self._group_by_device_config(orders)
+        batch_size = self._get_eta_batch_size()
+        for device_config, device_orders in orders_by_device.items():
+            if not device_config:
+                device_orders.write({'eta_outbox_state': False,
+                                     'eta_last_error': _('Create ETA configuration for this POS.')})
+                continue
+            for index in range(0, len(device_orders), batch_size):
+                try:
+                    device_orders[index:index + batch_size]._submit_eta_batch()
+                except psycopg2.errors.SerializationFailure:
+                    # Submitted by a concurrent transaction since the batch was read
+                    _logger.info('ETA outbox batch changed concurrently, it is read again on the next run.')
+                    self.env.cr.rollback()
+                    continue
+                self.env.cr.commit()
+
+    def _lock_eta_queued(self):
+        """Lock the orders of ``self`` still queued in the outbox, the ones being
+        submitted by another transaction are skipped"""
+        self.flush_recordset(['eta_outbox_state'])
+        self.env.cr.execute("""
+            SELECT id FROM pos_order
+             WHERE id = ANY(%s) AND eta_outbox_state = 'queued'
+               FOR NO KEY UPDATE SKIP LOCKED
+        """, [self.ids])
+        queued_ids = {row[0] for row in self.env.cr.fetchall()}
+        return self.filtered(lambda order: order.id in queued_ids)
+
+    def _submit_eta_batch(self):
+        payload = {"receipts": []}
+        ready = self.browse()
+        # The receipts of the batch are chained in memory from the head of the device
+        previous_uuid = self.config_id.device_config_id._lock_eta_chain_head()
+        # A manual send may have submitted some of them while waiting for the head
+        for order in self._lock_eta_queued():
+            try:
+                receipt_data, uuid = order._prepare_receipt_for_eta(previous_uuid=previous_uuid)
+            except Exception as ex:
+                # A receipt that cannot be built must not hold the queue
+                _logger.exception('Could not prepare the ETA receipt of %s.', order.name)
+                order.write({'eta_outbox_state': False, 'eta_last_error': str(ex)})
+                continue
+            payload['receipts'].append(receipt_data)
+            ready |= order
+            previous_uuid = uuid
+        if not ready:
+            return
+        try:
+            response_data = ready[0]._post_eta_receipts(payload)
+        except ValidationError as ex:
+            ready._postpone_eta_outbox(str(ex))
+            return
+        unanswered = ready._apply_eta_submission(response_data)
+        if unanswered:
+            unanswered._postpone_eta_outbox(json.dumps(response_data, ensure_ascii=False))
 
-        except Exception as ex:
-            _logger.error('Error When Send: %s.' % ex)
-            raise ValidationError(_('%s' % ex))
+    @api.model
+    def _process_eta_polling(self, now):
+        orders = self.search([('eta_outbox_state', '=', 'polling'), ('eta_next_attempt', '<=', now)])
+        orders_by_submission = defaultdict(lambda: self.browse())
+        for order in orders:
+            orders_by_submission[order.eta_submission_uuid] |= order
+        for eta_submission_id, submission_orders in orders_by_submission.items():
+            main_order = submission_orders[0]
+            try:
+                access_token = main_order._get_access_token()
+                self._action_get_eta_receipt_status(eta_submission_id, access_token,
+                                                    main_order.config_id.device_config_id)
+            except ValidationError as ex:
+                submission_orders._postpone_eta_polling(str(ex))
+                self.env.cr.commit()
+                continue
+            done = submission_orders.filtered(lambda order: order.eta_status in ('valid', 'invalid'))
+            done.write({'eta_outbox_state': False, 'eta_last_error': False})
+            (submission_orders - done)._postpone_eta_polling(False)
+            self.env.cr.commit()
+
+    def _postpone_eta_polling(self, error):
+        """Poll the orders again later, until ETA_MAX_POLL_ATTEMPTS"""
+        expired = self.filtered(lambda order: order.eta_attempts + 1 >= ETA_MAX_POLL_ATTEMPTS)
+        expired.write({'eta_outbox_state': False, 'eta_last_error': error})
+        (self - expired)._postpone_eta_outbox(error)
 
     @api.model
     def _process_order(self, order, draft, existing_order):
@@ -598,7 +785,7 @@ class POSOrder(models.Model):
         if pos_order.to_invoice and pos_order.state == 'paid':
             pos_order._generate_pos_order_invoice()
         if not pos_order.config_id.dont_send_e_receipt:
-            pos_order.action_send_eta_receipt()
+            pos_order._enqueue_eta_receipt()
 
         return pos_order.id
 
@@ -0,0 +1,100 @@
+# -*- coding: utf-8 -*-
+"""ETA canonical form of a receipt and its SHA-256 UUID.
+
+The canonical string puts every key upper-cased and quoted before its
+value; a list repeats its key before each element:
+
+    {"a": "x", "b": [{"c": 1}, {"c": 2}]}  ->  "A""x""B""B""C""1""B""C""2"
+
+The receipt is walked with an explicit stack of (key token, value)
+iterators. The key tokens and the quoted strings are cached, so the
+serialization only calls json.dumps for strings needing escapes, and
+canonical_hash() feeds the hash while serializing.
+"""
+import hashlib
+import json
+import re
+from itertools import repeat
+
+# Characters json.dumps(..., ensure_ascii=False) escapes
+_NEEDS_ESCAPE = re.compile(r'[\x00-\x1f\\"]')
+# Parts serialized before feeding the hash
+_HASH_BLOCK = 2048
+_CACHE_SIZE = 50000
+
+
+class _Tokens(dict):
+    """Cache of the canonical tokens of strings"""
+
+    def __init__(self, tokenize):
+        super().__init__()
+        self.tokenize = tokenize
+
+    def __missing__(self, value):
+        if len(self) >= _CACHE_SIZE:
+            self.clear()
+        token = self[value] = self.tokenize(value)
+        return token
+
+
+def _quote(value):
+    if _NEEDS_ESCAPE.search(value):
+        return json.dumps(value, ensure_ascii=False)
+    return '"' + value + '"'
+
+
+_key_tokens = _Tokens(lambda key: json.dumps(key, ensure_ascii=False).upper())
+_string_tokens = _Tokens(_quote)
+
+
+def iter_canonical(receipt, block_size=_HASH_BLOCK):
+    """Yield the canonical form of ``receipt`` in blocks of about
+    ``block_size`` tokens.
+
+    Lists are expected to hold dictionaries or scalars, as in ETA
+    documents.
+    """
+    if not isinstance(receipt, dict):
+        yield json.dumps(str(receipt), ensure_ascii=False)
+        return
+    key_tokens = _key_tokens.__getitem__
+    string_tokens = _string_tokens.__getitem__
+    parts = []
+    append = parts.append
+    stack = [zip(map(key_tokens, receipt), receipt.values())]
+    while stack:
+        for token, value in stack[-1]:
+            append(token)
+            cls = value.__class__
+            if cls is str:
+                append(string_tokens(value))
+            elif cls is dict:
+                stack.append(zip(map(key_tokens, value), value.values()))
+                break
+            elif cls is list:
+                stack.append(zip(repeat(token, len(value)), value))
+                break
+            else:
+                append(string_tokens(str(value)))
+        else:
+            stack.pop()
+            continue
+        if len(parts) >= block_size:
+            yield ''.join(parts)
+            parts.clear()
+    if parts:
+        yield ''.join(parts)
+
+
+def serialize_receipt(receipt):
+    """Return the canonical string of ``receipt``"""
+    return ''.join(iter_canonical(receipt))
+
+
+def canonical_hash(receipt):
+    """Return the hexadecimal SHA-256 of the canonical string of ``receipt``,
+    that is its ETA UUID"""
+    digest = hashlib.sha256()
+    for block in iter_canonical(receipt):
+        digest.update(block.encode())
+    return digest.hexdigest()
@@ -0,0 +1,101 @@
+# -*- coding: utf-8 -*-
+"""Benchmark of the ETA canonical serializer against the recursive one.
+
+    python3 canonical_benchmark.py [repeat]
+
+Runs without Odoo, on synthetic receipts of 1 to 500 lines.
+"""
+import hashlib
+import json
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from canonical import canonical_hash, serialize_receipt  # noqa: E402
+
+LINE_COUNTS = (1, 10, 50, 100, 500)
+
+
+def legacy_serialize(receipt_dict):
+    if not isinstance(receipt_dict, dict):
+        return json.dumps(str(receipt_dict), ensure_ascii=False)
+
+    canonical_str = []
+    for key, value in receipt_dict.items():
+        if not isinstance(value, list):
+            canonical_str.append(json.dumps(key, ensure_ascii=False).upper())
+            canonical_str.append(legacy_serialize(value))
+        else:
+            canonical_str.append(json.dumps(key, ensure_ascii=False).upper())
+            for elem in value:
+                canonical_str.append(json.dumps(key, ensure_ascii=False).upper())
+                canonical_str.append(legacy_serialize(elem))
+    return ''.join(canonical_str)
+
+
+def legacy_hash(receipt):
+    return hashlib.sha256(legacy_serialize(receipt).encode()).digest().hex()
+
+
+def make_receipt(line_count):
+    lines = [{
+        "internalCode": "ITEM-%s" % index,
+        "description": 'Product "%s" \\ 1 kg' % index,
+        "itemType": "EGS",
+        "itemCode": "EG-123456789-%s" % index,
+        "unitType": "EA",
+        "quantity": 2.0,
+        "unitPrice": 12.5,
+        "netSale": 25.0,
+        "totalSale": 25.0,
+        "total": 28.5,
+        "valueDifference": 0.0,
+        "taxableItems": [{"taxType": "T1", "amount": 3.5, "subType": "V009", "rate": 14.0}],
+        "commercialDiscountData": [{"amount": 1.0, "description": "1.0"}],
+    } for index in range(line_count)]
+    return {
+        "header": {
+            "dateTimeIssued": "2024-01-01T10:00:00Z",
+            "receiptNumber": "Order 00001-001-0001",
+            "uuid": "",
+            "previousUUID": "",
+            "referenceOldUUID": "",
+            "currency": "EGP",
+            "exchangeRate": 0,
+            "sOrderNameCode": "Shop/0001",
+            "orderdeliveryMode": "FC",
+            "grossWeight": 0.0,
+            "netWeight": 0.0,
+        },
+        "documentType": {"receiptType": "S", "typeVersion": "1.2"},
+        "seller": {"rin": "123456789", "companyTradeName": "Company", "branchCode": "0",
+                   "branchAddress": {"country": "EG", "governate": "Cairo", "regionCity": "Nasr City",
+                                     "street": "Street", "buildingNumber": "1"},
+                   "deviceSerialNumber": "SN-1", "activityCode": "4620"},
+        "buyer": {"type": "P", "id": "", "name": "", "mobileNumber": "", "paymentNumber": ""},
+        "itemData": lines,
+        "totalSales": 25.0 * line_count,
+        "totalCommercialDiscount": 1.0 * line_count,
+        "totalItemsDiscount": 0,
+        "extraReceiptDiscountData": [{"amount": 0.0, "description": "Global Discount"}],
+        "netAmount": 25.0 * line_count,
+        "totalAmount": 28.5 * line_count,
+        "taxTotals": [{"amount": 3.5 * line_count, "taxType": "T1"}],
+        "paymentMethod": "C",
+    }
+
+
+def main(repeat=200):
+    print('%6s %14s %14s %8s' % ('lines', 'legacy (us)', 'canonical (us)', 'speedup'))
+    for line_count in LINE_COUNTS:
+        receipt = make_receipt(line_count)
+        assert serialize_receipt(receipt) == legacy_serialize(receipt)
+        assert canonical_hash(receipt) == legacy_hash(receipt)
+        legacy = min(timeit.repeat(lambda: legacy_hash(receipt), number=repeat, repeat=3)) / repeat
+        current = min(timeit.repeat(lambda: canonical_hash(receipt), number=repeat, repeat=3)) / repeat
+        print('%6s %14.1f %14.1f %7.1fx' % (line_count, legacy * 1e6, current * 1e6, legacy / current))
+
+
+if __name__ == '__main__':
+    main(*map(int, sys.argv[1:2]))
@@ -0,0 +1,77 @@
+# -*- coding: utf-8 -*-
+"""Pooled HTTPS sessions and access tokens of the ETA API.
+
+Each thread keeps one keep-alive requests session per device
+configuration, so consecutive calls of a worker reuse the TLS
+connections instead of shaking hands again. The access tokens are cached
+in the process until shortly before their expiration.
+"""
+import ssl
+import threading
+import time
+
+import requests
+import urllib3
+
+# Connections kept per host and session
+POOL_SIZE = 4
+# (connect, read) timeouts of the ETA calls, in seconds
+TIMEOUT = (10, 60)
+# Tokens are renewed this many seconds before they expire
+TOKEN_MARGIN = 60
+
+_local = threading.local()
+_tokens = {}
+_tokens_lock = threading.Lock()
+
+
+class CustomHttpAdapter(requests.adapters.HTTPAdapter):
+    '''Transport adapter" that allows us to use custom ssl_context.'''
+
+    def __init__(self, ssl_context=None, **kwargs):
+        self.ssl_context = ssl_context
+        super().__init__(**kwargs)
+
+    def init_poolmanager(self, connections, maxsize, block=False, **pool_kwargs):
+        self.poolmanager = urllib3.poolmanager.PoolManager(
+            num_pools=connections, maxsize=maxsize,
+            block=block, ssl_context=self.ssl_context)
+
+
+def _create_session():
+    ctx = ssl.create_default_context(ssl.Purpose.SERVER_AUTH)
+    ctx.options |= 0x4  # OP_LEGACY_SERVER_CONNECT
+    session = requests.Session()
+    session.mount('https://', CustomHttpAdapter(ctx, pool_connections=POOL_SIZE, pool_maxsize=POOL_SIZE))
+    return session
+
+
+def get_session(key):
+    """Return the session of the current thread for the connection ``key``"""
+    sessions = getattr(_local, 'sessions', None)
+    if sessions is None:
+        sessions = _local.sessions = {}
+    session = sessions.get(key)
+    if session is None:
+        session = sessions[key] = _create_session()
+    return session
+
+
+def get_token(key):
+    """Return the cached token of ``key`` if it is still valid, else None"""
+    with _tokens_lock:
+        token, expiration = _tokens.get(key, (None, 0))
+    if token and time.time() < expiration - TOKEN_MARGIN:
+        return token
+    return None
+
+
+def set_token(key, token, expiration):
+    """Cache ``token`` until ``expiration``, a timestamp"""
+    with _tokens_lock:
+        _tokens[key] = (token, expiration)
+
+
+def discard_token(key):
+    with _tokens_lock:
+        _tokens.pop(key, None)
@@ -5,7 +5,7 @@
 {
     "name": "Stock Date",
     "summary": "Set posting date for stock move",
-    "version": "18.0.1.0.0",
+    "version": "18.0.1.1.0",
     "author": "Terrabit, Dorin Hongu",
     "website": "https://www.terrabit.ro",
     "category": "Warehouse",
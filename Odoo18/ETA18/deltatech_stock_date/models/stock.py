@@ -4,6 +4,7 @@
 
 
 from odoo import api, fields, models
+from odoo.tools.misc import groupby
 
 
 class StockQuant(models.Model):
@@ -23,24 +24,55 @@ class StockQuant(models.Model):
 class StockMove(models.Model):
     _inherit = "stock.move"
 
+    def _get_effective_date(self):
+        """Return the date the move is posted at, False for the current date.
+
+        The date is set on the move, its move lines, its valuation layers and
+        its journal entries when they are created or validated, extend this
+        method to force the date of other moves.
+        """
+        self.ensure_one()
+        return self.env.context.get("force_period_date", False)
+
+    def _action_done(self, cancel_backorder=False):
+        # the moves are validated in one batch per effective date
+        moves_todo = self.env["stock.move"]
+        for date, moves in groupby(self, key=lambda move: move._get_effective_date()):
+            moves = self.concat(*moves)
+            if date:
+                moves = moves.with_context(force_period_date=date)
+            moves_todo |= super(StockMove, moves)._action_done(cancel_backorder=cancel_backorder).with_env(self.env)
+        return moves_todo
+
     def write(self, vals):
-        date_fields = {"date", "date_expected"}
+        if not vals.get("date"):
+            return super(StockMove, self).write(vals)
         use_date = self.env.context.get("force_period_date", False)
-        if date_fields.intersection(vals):
-            if not use_date:
-                for move in self:
-                    today = fields.Date.today()
-                    if "date" in vals:
-                        date = fields.Date.to_date(vals["date"])
-                        move_date = fields.Date.to_date(move.date)
-                        if move_date < today and move_date < date:
-                            vals["date"] = move_date
-                        move.move_line_ids.write({"date": vals["date"]})
-            else:
-                if "date" in vals:
-                    vals["date"] = use_date
-
-        return super(StockMove, self).write(vals)
+        if use_date:
+            return super(StockMove, self).write(dict(vals, date=use_date))
+        # the moves dated in the past keep their date
+        date = min(fields.Date.to_date(vals["date"]), fields.Date.today())
+        past_moves = self.filtered(lambda m: m.date and m.date.date() < date)
+        if not past_moves:
+            return super(StockMove, self).write(vals)
+        other_vals = dict(vals)
+        del other_vals["date"]
+        res = super(StockMove, self - past_moves).write(vals)
+        if other_vals:
+            super(StockMove, past_moves).write(other_vals)
+        for move_date, moves in groupby(past_moves, key=lambda m: m.date):
+            self.concat(*moves).move_line_ids.write({"date": move_date})
+        return res
+
+
+class StockMoveLine(models.Model):
+    _inherit = "stock.move.line"
+
+    def write(self, vals):
+        use_date = self.env.context.get("force_period_date", False)
+        if use_date and "date" in vals:
+            vals = dict(vals, date=use_date)
+        return super(StockMoveLine, self).write(vals)
 
 
 class StockPicking(models.Model):
@@ -50,15 +82,8 @@ class StockPicking(models.Model):
         # se suprascrie metoda standard petnru a nu mai permite editarea
         return False
 
-    # def button_validate(self):
-    #     if len(self) == 1:
-    #         return super(StockPicking, self.with_context(force_period_date=self.scheduled_date)).button_validate()
-    #     return super(StockPicking, self).button_validate()
-
-    def _action_done(self):
-        super(StockPicking, self)._action_done()
+    def write(self, vals):
         use_date = self.env.context.get("force_period_date", False)
-        if use_date:
-            self.write({"date": use_date, "date_done": use_date})
-            self.move_lines.write({"date": use_date})  # 'date_expected': use_date,
-            self.move_line_ids.write({"date": use_date})
+        if use_date and "date_done" in vals:
+            vals = dict(vals, date=use_date, date_done=use_date)
+        return super(StockPicking, self).write(vals)
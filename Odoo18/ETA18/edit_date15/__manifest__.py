@@ -17,10 +17,10 @@
     # Check https://github.com/odoo/odoo/blob/15.0/odoo/addons/base/data/ir_module_category_data.xml
     # for the full list
     'category': 'Uncategorized',
-    'version': '18.0.1.0.0',
+    'version': '18.0.1.1.0',
 
     # any module necessary for this one to work correctly
-    'depends': ['base','sale','stock', 'purchase','account','stock_account','sale_stock','sales_team','mrp'],
+    'depends': ['base','sale','stock', 'purchase','account','stock_account','sale_stock','sales_team','mrp','deltatech_stock_date'],
 
     # always loaded
     'data': [
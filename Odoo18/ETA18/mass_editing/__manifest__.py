@@ -2,7 +2,7 @@
 # License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl).
 {
     "name": "Mass Editing",
-    "version": "18.0.1.0.0",
+    "version": "18.0.1.2.0",
     "author": "Serpent Consulting Services Pvt. Ltd., "
     "Tecnativa, "
     "GRAP, "
@@ -17,7 +17,10 @@
     ],
     "data": [
         "security/ir.model.access.csv",
+        "security/mass_editing_security.xml",
+        "data/ir_cron_data.xml",
         "views/ir_actions_server.xml",
+        "views/mass_editing_job.xml",
         "wizard/mass_editing_wizard.xml",
     ],
     "demo": ["demo/mass_editing.xml"],
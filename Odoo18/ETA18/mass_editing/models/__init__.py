@@ -1,2 +1,3 @@
 from . import ir_actions_server
+from . import mass_editing_job
 from . import mass_editing_line
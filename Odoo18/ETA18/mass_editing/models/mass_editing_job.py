@@ -0,0 +1,163 @@
+# License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl).
+
+import logging
+
+from odoo import _, api, fields, models
+
+_logger = logging.getLogger(__name__)
+
+# Context keys kept to apply the edit in the background
+JOB_CONTEXT_KEYS = ("lang", "tz", "allowed_company_ids")
+
+
+class MassEditingJob(models.Model):
+    _name = "mass.editing.job"
+    _description = "Mass Editing Job"
+    _order = "id desc"
+
+    server_action_id = fields.Many2one(
+        "ir.actions.server",
+        string="Server Action",
+        ondelete="set null",
+    )
+    model = fields.Char(required=True)
+    user_id = fields.Many2one(
+        "res.users",
+        string="User",
+        required=True,
+        ondelete="cascade",
+        default=lambda self: self.env.user,
+        help="The edit is applied with the access rights of this user.",
+    )
+    context = fields.Json()
+    res_ids = fields.Json(string="Records", required=True)
+    values = fields.Json()
+    translated_fields = fields.Json(
+        help="Removed translatable fields, their translations are removed too.",
+    )
+    chunk_size = fields.Integer(required=True, default=1000)
+    state = fields.Selection(
+        [
+            ("pending", "Pending"),
+            ("running", "Running"),
+            ("done", "Done"),
+            ("failed", "Failed"),
+        ],
+        default="pending",
+        required=True,
+        index=True,
+    )
+    total_count = fields.Integer(readonly=True)
+    processed_count = fields.Integer(
+        readonly=True,
+        help="Number of records already edited, the job resumes after them.",
+    )
+    progress = fields.Float(compute="_compute_progress")
+    error = fields.Text(readonly=True)
+    date_done = fields.Datetime(readonly=True)
+
+    @api.depends("server_action_id", "total_count")
+    def _compute_display_name(self):
+        for job in self:
+            job.display_name = _(
+                "%(action)s on %(count)d record(s)",
+                action=job.server_action_id.name or job.model,
+                count=job.total_count,
+            )
+
+    @api.depends("processed_count", "total_count")
+    def _compute_progress(self):
+        for job in self:
+            job.progress = (
+                100.0 * job.processed_count / job.total_count
+                if job.total_count
+                else 100.0
+            )
+
+    @api.model_create_multi
+    def create(self, vals_list):
+        for vals in vals_list:
+            vals.setdefault("total_count", len(vals.get("res_ids") or []))
+        return super().create(vals_list)
+
+    @api.model
+    def _get_job_context(self, context):
+        return {key: context[key] for key in JOB_CONTEXT_KEYS if key in context}
+
+    @api.model
+    def _apply(self, records, values, translated_fields):
+        """Write ``values`` on ``records`` and remove the translations of
+        ``translated_fields``"""
+        if translated_fields and "ir.translation" in self.env:
+            self.env["ir.translation"].search(
+                [
+                    ("res_id", "in", records.ids),
+                    ("type", "=", "model"),
+                    (
+                        "name",
+                        "in",
+                        [
+                            "{},{}".format(records._name, field_name)
+                            for field_name in translated_fields
+                        ],
+                    ),
+                ]
+            ).unlink()
+        if values:
+            records.write(values)
+
+    def action_resume(self):
+        # The users may resume the jobs they can read, i.e. their own jobs
+        self.check_access("read")
+        self.sudo().filtered(lambda job: job.state == "failed").write(
+            {"state": "pending", "error": False}
+        )
+        self.env.ref("mass_editing.ir_cron_mass_editing_job")._trigger()
+
+    @api.model
+    def _cron_process_jobs(self):
+        # Running jobs were interrupted, they resume after the last chunk
+        self.search([("state", "in", ["pending", "running"])], order="id")._process()
+
+    def _process(self, auto_commit=True):
+        for job in self:
+            try:
+                job._process_chunks(auto_commit)
+            except Exception as error:
+                if not auto_commit:
+                    raise
+                self.env.cr.rollback()
+                _logger.exception("Mass editing job %s failed", job.id)
+                job.write({"state": "failed", "error": str(error)})
+                self.env.cr.commit()
+
+    def _process_chunks(self, auto_commit):
+        """Apply the edit by chunks of ``chunk_size`` records, committing
+        the progress after each chunk"""
+        self.ensure_one()
+        self.state = "running"
+        TargetModel = (
+            self.env[self.model]
+            .with_user(self.user_id)
+            .with_context(**(self.context or {}))
+        )
+        res_ids = self.res_ids
+        values = self.values
+        translated_fields = self.translated_fields
+        chunk_size = max(self.chunk_size, 1)
+        while self.processed_count < self.total_count:
+            chunk = res_ids[self.processed_count : self.processed_count + chunk_size]
+            self._apply(TargetModel.browse(chunk).exists(), values, translated_fields)
+            self.processed_count += len(chunk)
+            _logger.info(
+                "Mass editing job %s: %s/%s records",
+                self.id,
+                self.processed_count,
+                self.total_count,
+            )
+            if auto_commit:
+                self.env.cr.commit()
+                self.env.invalidate_all()
+        self.write({"state": "done", "date_done": fields.Datetime.now()})
+        if auto_commit:
+            self.env.cr.commit()
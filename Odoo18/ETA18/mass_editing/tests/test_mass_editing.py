@@ -304,6 +304,84 @@ class TestMassEditing(common.TransactionCase):
             "User's category should be removed.",
         )
 
+    def test_mass_edit_background(self):
+        """Test that large selections are edited by a chunked background job"""
+        IrConfigParameter = self.env["ir.config_parameter"].sudo()
+        IrConfigParameter.set_param("mass_editing.background_threshold", 2)
+        IrConfigParameter.set_param("mass_editing.chunk_size", 1)
+        users = self.user | new_test_user(
+            self.env, login="test-mass_editing-user-2"
+        )
+        vals = {"selection__email": "set", "email": "bulk@mycompany.com"}
+        wizard = self._create_wizard_and_apply_values(
+            self.mass_editing_user, users, vals
+        )
+        job = wizard.job_id
+        self.assertEqual(job.state, "pending")
+        self.assertEqual(job.total_count, 2)
+        self.assertNotIn("bulk@mycompany.com", users.mapped("email"))
+        job._process(auto_commit=False)
+        self.assertEqual(job.state, "done")
+        self.assertEqual(job.processed_count, 2)
+        self.assertEqual(job.progress, 100.0)
+        self.assertEqual(users.mapped("email"), ["bulk@mycompany.com"] * 2)
+
+    def test_mass_edit_background_resume(self):
+        """Test that an interrupted job resumes after its last chunk"""
+        IrConfigParameter = self.env["ir.config_parameter"].sudo()
+        IrConfigParameter.set_param("mass_editing.background_threshold", 2)
+        IrConfigParameter.set_param("mass_editing.chunk_size", 1)
+        user_2 = new_test_user(self.env, login="test-mass_editing-user-2")
+        users = self.user | user_2
+        vals = {"selection__email": "set", "email": "bulk@mycompany.com"}
+        wizard = self._create_wizard_and_apply_values(
+            self.mass_editing_user, users, vals
+        )
+        job = wizard.job_id
+        # The first chunk was committed before the worker was killed
+        job.write({"state": "running", "processed_count": 1})
+        self.env["mass.editing.job"].search(
+            [("id", "=", job.id), ("state", "in", ["pending", "running"])]
+        )._process(auto_commit=False)
+        self.assertEqual(job.state, "done")
+        self.assertNotEqual(self.user.email, "bulk@mycompany.com")
+        self.assertEqual(user_2.email, "bulk@mycompany.com")
+
+    def test_mass_edit_background_feedback(self):
+        """Test that the user is told about the queued job and only sees
+        their own jobs"""
+        IrConfigParameter = self.env["ir.config_parameter"].sudo()
+        IrConfigParameter.set_param("mass_editing.background_threshold", 2)
+        users = self.user | new_test_user(
+            self.env, login="test-mass_editing-user-2"
+        )
+        vals = {"selection__email": "set", "email": "bulk@mycompany.com"}
+        wizard = self._create_wizard_and_apply_values(
+            self.mass_editing_user, users, vals
+        )
+        action = wizard.button_apply()
+        self.assertEqual(action["tag"], "display_notification")
+        self.assertIn(str(wizard.job_id.id), action["params"]["links"][0]["url"])
+        basic_user = new_test_user(
+            self.env, login="test-mass_editing-basic", groups="base.group_user"
+        )
+        Job = self.env["mass.editing.job"].with_user(basic_user)
+        self.assertFalse(Job.search([("id", "=", wizard.job_id.id)]))
+        wizard.job_id.user_id = basic_user
+        self.assertEqual(Job.search([("id", "=", wizard.job_id.id)]), wizard.job_id)
+
+    def test_mass_edit_below_background_threshold(self):
+        """Test that small selections are edited right away"""
+        self.env["ir.config_parameter"].sudo().set_param(
+            "mass_editing.background_threshold", 2
+        )
+        vals = {"selection__email": "set", "email": "direct@mycompany.com"}
+        wizard = self._create_wizard_and_apply_values(
+            self.mass_editing_user, self.user, vals
+        )
+        self.assertFalse(wizard.job_id)
+        self.assertEqual(self.user.email, "direct@mycompany.com")
+
     def test_check_field_model_constraint(self):
         """Test that it's not possible to create inconsistent mass edit actions"""
         with self.assertRaises(ValidationError):
@@ -17,6 +17,11 @@ class MassEditingWizard(models.TransientModel):
     operation_description_warning = fields.Text(readonly=True)
     operation_description_danger = fields.Text(readonly=True)
     message = fields.Text(readonly=True)
+    job_id = fields.Many2one(
+        "mass.editing.job",
+        readonly=True,
+        help="Background job applying the edit, for large selections.",
+    )
 
     @api.model
     def default_get(self, fields, active_ids=None):
@@ -153,68 +158,87 @@ class MassEditingWizard(models.TransientModel):
         field_info["domain"] = "[]"
         return field_info
 
+    @api.model
+    def _prepare_write_values(self, TargetModel, vals):
+        """Return the values to write on the records and the removed
+        translatable fields, whose translations are removed too"""
+        values = {}
+        translated_fields = []
+        for key, val in vals.items():
+            if key.startswith("selection_"):
+                split_key = key.split("__", 1)[1]
+                if val == "set":
+                    values.update({split_key: vals.get(split_key, False)})
+
+                elif val == "remove":
+                    values.update({split_key: False})
+
+                    # If field to remove is translatable,
+                    # its translations have to be removed
+                    if TargetModel._fields[split_key].translate:
+                        translated_fields.append(split_key)
+
+                elif val == "remove_m2m":
+                    m2m_list = []
+                    if vals.get(split_key):
+                        for m2m_id in vals.get(split_key)[0][2]:
+                            m2m_list.append((3, m2m_id))
+                    if m2m_list:
+                        values.update({split_key: m2m_list})
+                    else:
+                        values.update({split_key: [(5, 0, [])]})
+
+                elif val == "add":
+                    m2m_list = []
+                    for m2m_id in vals.get(split_key, False)[0][2]:
+                        m2m_list.append((4, m2m_id))
+                    values.update({split_key: m2m_list})
+        return values, translated_fields
+
+    @api.model
+    def _get_background_threshold(self):
+        """Number of records from which the edit is applied by a background
+        job, 0 to always apply it right away"""
+        return int(
+            self.env["ir.config_parameter"]
+            .sudo()
+            .get_param("mass_editing.background_threshold", 5000)
+        )
+
+    @api.model
+    def _get_chunk_size(self):
+        return int(
+            self.env["ir.config_parameter"]
+            .sudo()
+            .get_param("mass_editing.chunk_size", 1000)
+        )
+
     @api.model
     def create(self, vals):
         server_action_id = self.env.context.get("server_action_id")
         server_action = self.env["ir.actions.server"].sudo().browse(server_action_id)
         active_ids = self.env.context.get("active_ids", [])
+        job = self.env["mass.editing.job"]
         if server_action and active_ids:
             TargetModel = self.env[server_action.model_id.model]
-            IrModelFields = self.env["ir.model.fields"].sudo()
-            IrTranslation = self.env["ir.translation"]
-
-            values = {}
-            for key, val in vals.items():
-                if key.startswith("selection_"):
-                    split_key = key.split("__", 1)[1]
-                    if val == "set":
-                        values.update({split_key: vals.get(split_key, False)})
-
-                    elif val == "remove":
-                        values.update({split_key: False})
-
-                        # If field to remove is translatable,
-                        # its translations have to be removed
-                        model_field = IrModelFields.search(
-                            [
-                                ("model", "=", server_action.model_id.model),
-                                ("name", "=", split_key),
-                            ]
-                        )
-                        if model_field and model_field.translate:
-                            translations = IrTranslation.search(
-                                [
-                                    ("res_id", "in", active_ids),
-                                    ("type", "=", "model"),
-                                    (
-                                        "name",
-                                        "=",
-                                        "{},{}".format(
-                                            server_action.model_id.model, split_key
-                                        ),
-                                    ),
-                                ]
-                            )
-                            translations.unlink()
-
-                    elif val == "remove_m2m":
-                        m2m_list = []
-                        if vals.get(split_key):
-                            for m2m_id in vals.get(split_key)[0][2]:
-                                m2m_list.append((3, m2m_id))
-                        if m2m_list:
-                            values.update({split_key: m2m_list})
-                        else:
-                            values.update({split_key: [(5, 0, [])]})
-
-                    elif val == "add":
-                        m2m_list = []
-                        for m2m_id in vals.get(split_key, False)[0][2]:
-                            m2m_list.append((4, m2m_id))
-                        values.update({split_key: m2m_list})
-            if values:
-                TargetModel.browse(active_ids).write(values)
-        return super().create({})
+            values, translated_fields = self._prepare_write_values(TargetModel, vals)
+            threshold = self._get_background_threshold()
+            if (values or translated_fields) and 0 < threshold <= len(active_ids):
+                job = job.sudo().create(
+                    {
+                        "server_action_id": server_action.id,
+                        "model": TargetModel._name,
+                        "context": job._get_job_context(self.env.context),
+                        "res_ids": list(active_ids),
+                        "values": values,
+                        "translated_fields": translated_fields,
+                        "chunk_size": self._get_chunk_size(),
+                    }
+                )
+                self.env.ref("mass_editing.ir_cron_mass_editing_job")._trigger()
+            elif values or translated_fields:
+                job._apply(TargetModel.browse(active_ids), values, translated_fields)
+        return super().create({"job_id": job.id})
 
     def read(self, fields, load="_classic_read"):
         """Without this call, dynamic fields build by fields_view_get()
@@ -234,3 +258,28 @@ class MassEditingWizard(models.TransientModel):
 
     def button_apply(self):
         self.ensure_one()
+        if not self.job_id:
+            return True
+        # The edit is applied in the background, tell the user where to follow it
+        return {
+            "type": "ir.actions.client",
+            "tag": "display_notification",
+            "params": {
+                "type": "info",
+                "title": _("Mass editing queued"),
+                "message": _(
+                    "The %(count)d record(s) will be edited in the background. "
+                    "Follow the progress of the edit in %%s.",
+                    count=self.job_id.total_count,
+                ),
+                "links": [
+                    {
+                        "label": self.job_id.display_name,
+                        "url": "/odoo/action-mass_editing.action_mass_editing_job/%s"
+                        % self.job_id.id,
+                    }
+                ],
+                "sticky": True,
+                "next": {"type": "ir.actions.act_window_close"},
+            },
+        }
@@ -1,10 +1,8 @@
 # -*- coding: utf-8 -*-
 
-import time
 from odoo import api, fields, models, _
-from odoo.tools import DEFAULT_SERVER_DATETIME_FORMAT
-from odoo.tools.float_utils import float_compare, float_is_zero
-from odoo.exceptions import UserError, ValidationError
+from odoo.tools.misc import groupby
+from odoo.exceptions import UserError
 
 
 class StockQuant(models.Model):
@@ -75,36 +73,13 @@ class StockQuant(models.Model):
         return res
 
     def _apply_inventory(self):
-        move_vals = []
-        if not self.user_has_groups('stock.group_stock_manager'):
-            raise UserError(_('Only a stock manager can validate an inventory adjustment.'))
-        for quant in self:
-            # Create and validate a move so that the quant matches its `inventory_quantity`.
-            if float_compare(quant.inventory_diff_quantity, 0, precision_rounding=quant.product_uom_id.rounding) > 0:
-                move_vals.append(
-                    quant._get_inventory_move_values(quant.inventory_diff_quantity,
-                                                     quant.product_id.with_company(
-                                                         quant.company_id).property_stock_inventory,
-                                                     quant.location_id))
-            else:
-                move_vals.append(
-                    quant._get_inventory_move_values(-quant.inventory_diff_quantity,
-                                                     quant.location_id,
-                                                     quant.product_id.with_company(
-                                                         quant.company_id).property_stock_inventory,
-                                                     out=True))
-        moves = self.env['stock.move'].with_context(inventory_mode=False).create(move_vals)
-        if self.env.user.has_group('stock_force_date_app.group_stock_force_date'):
-            for quant in self:
-                moves = self.env['stock.move'].with_context(inventory_mode=False, force_date=quant.force_date).create(
-                    move_vals)
-        moves._action_done()
-        self.location_id.write({'last_inventory_date': fields.Date.today()})
-        date_by_location = {loc: loc._get_next_inventory_date() for loc in self.mapped('location_id')}
-        for quant in self:
-            quant.inventory_date = date_by_location[quant.location_id]
-        self.write({'inventory_quantity': 0, 'user_id': False})
-        self.write({'inventory_diff_quantity': 0})
+        if not self.env.user.has_group('stock_force_date_app.group_stock_force_date'):
+            return super(StockQuant, self)._apply_inventory()
+        for force_date, quants in groupby(self, key=lambda quant: quant.force_date):
+            quants = self.concat(*quants)
+            if force_date:
+                quants = quants.with_context(force_period_date=force_date)
+            super(StockQuant, quants)._apply_inventory()
 
 
 class StockPicking(models.Model):
@@ -116,51 +91,10 @@ class StockPicking(models.Model):
 class StockMove(models.Model):
     _inherit = 'stock.move'
 
-    def _action_done(self, cancel_backorder=False):
-        force_date = time.strftime(DEFAULT_SERVER_DATETIME_FORMAT)
-        if self.env.user.has_group('stock_force_date_app.group_stock_force_date'):
-            for move in self:
-                if self._context.get('force_date'):
-                    force_date = self._context.get('force_date')
-                if move.picking_id:
-                    if move.picking_id.force_date:
-                        force_date = move.picking_id.force_date
-                    else:
-                        force_date = move.picking_id.scheduled_date
-        res = super(StockMove, self)._action_done(cancel_backorder=cancel_backorder)
+    def _get_effective_date(self):
+        date = super(StockMove, self)._get_effective_date()
         if self.env.user.has_group('stock_force_date_app.group_stock_force_date'):
-            if force_date:
-                for move in res:
-                    move.write({'date': force_date})
-                    if move.move_line_ids:
-                        for move_line in move.move_line_ids:
-                            move_line.write({'date': force_date})
-                    if move.account_move_ids:
-                        for account_move in move.account_move_ids:
-                            self.env.cr.execute(
-                                "UPDATE account_move SET date = %s WHERE id = %s",
-                                [force_date, account_move.id])
-                        # account_move.write({'date':force_date})
-        return res
-
-    def _create_account_move_line(self, credit_account_id, debit_account_id, journal_id, qty, description, svl_id,
-                                  cost):
-        self.ensure_one()
-        AccountMove = self.env['account.move'].with_context(default_journal_id=journal_id)
-
-        move_lines = self._prepare_account_move_line(qty, cost, credit_account_id, debit_account_id, description)
-        if move_lines:
-            date = self._context.get('force_period_date', fields.Date.context_today(self))
-            if self.env.user.has_group('stock_force_date_app.group_stock_force_date'):
-                if self.picking_id.force_date:
-                    date = self.picking_id.force_date.date()
-            new_account_move = AccountMove.sudo().create({
-                'journal_id': journal_id,
-                'line_ids': move_lines,
-                'date': date,
-                'ref': description,
-                'stock_move_id': self.id,
-                'stock_valuation_layer_ids': [(6, None, [svl_id])],
-                'move_type': 'entry',
-            })
-            new_account_move._post()
+            if self.picking_id:
+                return self.picking_id.force_date or self.picking_id.scheduled_date
+            return self._context.get('force_date') or date
+        return date
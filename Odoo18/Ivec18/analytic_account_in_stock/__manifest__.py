@@ -12,9 +12,9 @@
 
     'author': "Mohamed0halim",
     'website': "linkedin.com/in/mo-halim",
-    'version': '18.0.0.1',
+    'version': '18.0.0.2',
 
-    'depends': ['base', 'stock', 'account_asset'],
+    'depends': ['base', 'stock_account', 'account_asset'],
     # always loaded
     'data': [
         'security/security.xml',
@@ -1,8 +1,12 @@
 # -*- coding: utf-8 -*-
+import logging
+from collections import defaultdict
 
 from odoo import api, fields, models
 from odoo.exceptions import UserError
 
+_logger = logging.getLogger(__name__)
+
 
 class CustomStockPickingInherit(models.Model):
     _inherit = 'stock.picking'
@@ -12,45 +16,6 @@ class CustomStockPickingInherit(models.Model):
                                           states={'done': [('readonly', True)], 'cancel': [('readonly', True)]})
     # is_updated = fields.Boolean(string="Is Updated")
 
-    def button_validate(self):
-        picking = super(CustomStockPickingInherit, self).button_validate()
-        for rec in self:
-            if rec.analytic_account_id:
-                account_move = self.env['account.move'].search(
-                    ['|', '|', ('name', '=', rec.name), ('ref', 'ilike', rec.name),
-                     ('partner_id', '=', rec.name)])
-                if account_move:
-                    # Check if this is a dropship delivery
-                    if rec.is_dropship:
-                        sorted_moves = account_move.sorted('id')
-
-                        # Get the number of move lines in the picking to determine the pattern
-                        move_line_count = len(rec.move_line_ids)
-
-                        # Assign analytic to every other journal entry 2nd, 4th, 6th, etc
-                        # This corresponds to the second journal entry of each product
-                        for index in range(1, len(sorted_moves), 2):
-                            if index < len(sorted_moves):
-                                move_to_update = sorted_moves[index]
-                                if move_to_update.line_ids:
-                                    for l in move_to_update.line_ids:
-                                        l.analytic_distribution = {
-                                            rec.analytic_account_id.id: 100,
-                                        } if l.debit > 0 and not rec.picking_type_id.is_return or l.credit > 0 and rec.picking_type_id.is_return else False
-                                move_to_update.button_draft()
-                                move_to_update.action_post()
-                    else:
-                        # For non-dropship: keep existing logic (assign to all journal entries)
-                        for acc in account_move:
-                            if acc.line_ids:
-                                for l in acc.line_ids:
-                                    l.analytic_distribution = {
-                                        rec.analytic_account_id.id: 100,
-                                    } if l.debit > 0 and not rec.picking_type_id.is_return or l.credit > 0 and rec.picking_type_id.is_return else False
-                            acc.button_draft()
-                            acc.action_post()
-        return picking
-
     is_updated = fields.Boolean()
 
     # def button_validate(self):
@@ -86,27 +51,89 @@ class CustomStockPickingInherit(models.Model):
     # is_updated = fields.Boolean()
 
     def button_update_analytic_account(self):
-        for rec in self:
-            if rec.analytic_account_id:
-                account_move = self.env['account.move'].search(
-                    ['|', '|', ('name', 'ilike', rec.name), ('ref', 'ilike', rec.name),
-                     ('partner_id', 'ilike', rec.name)])
-                print("#######################  ", account_move)
-
-                if account_move:
-                    # print('account_move', account_move)
-                    for acc in account_move:
-                        if acc.line_ids:
-                            for l in acc.line_ids:
-                                if l.debit > 0:
-                                    # l.analytic_account_id = rec.analytic_account_id.id
-                                    l.analytic_distribution = {rec.analytic_account_id.id: 100, }
-
-                    account_move.button_draft()
-                    account_move.action_post()
-                    rec.is_updated = True
-                else:
-                    raise UserError('there is no journal entry for this Delivery.!')
+        account_moves = self._apply_stock_analytic_distribution()
+        if not account_moves:
+            raise UserError('there is no journal entry for this Delivery.!')
+        self.is_updated = True
+
+    def _apply_stock_analytic_distribution(self):
+        """Set the analytic account of the pickings on the lines of their stock
+        valuation entries, found through their stock moves. The lines are
+        written in place, posted entries stay posted.
+
+        :return: the valuation entries of the pickings
+        """
+        pickings = self.filtered('analytic_account_id')
+        if not pickings:
+            return self.env['account.move']
+        lines = self.env['account.move.line'].search([
+            ('move_id.stock_move_id.picking_id', 'in', pickings.ids),
+        ])
+        to_write = defaultdict(list)
+        for line in lines:
+            analytic_account = line.move_id.stock_move_id._get_stock_analytic_account(
+                line.account_id.id, line.debit > 0)
+            if analytic_account and line.analytic_distribution != {str(analytic_account.id): 100}:
+                to_write[analytic_account.id].append(line.id)
+        for analytic_account_id, line_ids in to_write.items():
+            self.env['account.move.line'].browse(line_ids).write({
+                'analytic_distribution': {str(analytic_account_id): 100},
+            })
+        return lines.move_id
+
+    @api.model
+    def _backfill_stock_analytic_distribution(self, batch_size=200, auto_commit=False):
+        """Set the analytic account of the done pickings that were not updated
+        yet on their stock valuation entries, by chunks of ``batch_size``
+        pickings. From an Odoo shell:
+
+            env['stock.picking']._backfill_stock_analytic_distribution(auto_commit=True)
+        """
+        picking_ids = self.search([
+            ('state', '=', 'done'),
+            ('analytic_account_id', '!=', False),
+            ('is_updated', '=', False),
+        ], order='id').ids
+        for index in range(0, len(picking_ids), batch_size):
+            pickings = self.browse(picking_ids[index:index + batch_size])
+            account_moves = pickings._apply_stock_analytic_distribution()
+            pickings.is_updated = True
+            if auto_commit:
+                self.env.cr.commit()
+            self.env.invalidate_all()
+            _logger.info('Analytic backfill: %s/%s pickings, %s entries',
+                         min(index + batch_size, len(picking_ids)), len(picking_ids), len(account_moves))
+        return len(picking_ids)
+
+
+class StockMove(models.Model):
+    _inherit = 'stock.move'
+
+    def _get_stock_analytic_account(self, account_id, debit):
+        """Return the analytic account of the valuation line of the move on
+        ``account_id``: the debit lines get the analytic account of the
+        picking, or the credit lines for a return operation type. A dropship
+        is valued with two entries per move, only the one leaving the
+        valuation account is tagged."""
+        picking = self.picking_id
+        if not picking.analytic_account_id or debit == picking.picking_type_id.is_return:
+            return self.env['account.analytic.account']
+        if self._is_dropshipped() or self._is_dropshipped_returned():
+            accounts = self.product_id.product_tmpl_id.get_product_accounts()
+            if account_id == accounts['stock_valuation'].id:
+                return self.env['account.analytic.account']
+        return picking.analytic_account_id
+
+    def _generate_valuation_lines_data(self, partner_id, qty, debit_value, credit_value, debit_account_id,
+                                       credit_account_id, svl_id, description):
+        rslt = super()._generate_valuation_lines_data(partner_id, qty, debit_value, credit_value, debit_account_id,
+                                                      credit_account_id, svl_id, description)
+        for key, account_id, debit in (('debit_line_vals', debit_account_id, True),
+                                       ('credit_line_vals', credit_account_id, False)):
+            analytic_account = self._get_stock_analytic_account(account_id, debit)
+            if analytic_account and key in rslt:
+                rslt[key]['analytic_distribution'] = {str(analytic_account.id): 100}
+        return rslt
 
 
 class AccountAsset(models.Model):
@@ -0,0 +1,62 @@
+# -*- coding: utf-8 -*-
+###############################################################################
+#
+#    Cybrosys Technologies Pvt. Ltd.
+#
+#    Copyright (C) 2024-TODAY Cybrosys Technologies(<https://www.cybrosys.com>)
+#    Author: Cybrosys Techno Solutions (odoo@cybrosys.com)
+#
+#    You can modify it under the terms of the GNU LESSER
+#    GENERAL PUBLIC LICENSE (LGPL v3), Version 3.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU LESSER GENERAL PUBLIC LICENSE (LGPL v3) for more details.
+#
+#    You should have received a copy of the GNU LESSER GENERAL PUBLIC LICENSE
+#    (LGPL v3) along with this program.
+#    If not, see <http://www.gnu.org/licenses/>.
+#
+###############################################################################
+from odoo import fields, models
+
+
+class DbBackupLog(models.Model):
+    """DbBackupLog keeps the outcome and the duration of each stage of the
+       backups of a backup configuration"""
+    _name = 'db.backup.log'
+    _description = 'Database Backup Log'
+    _order = 'date desc, id desc'
+
+    config_id = fields.Many2one('db.backup.configure', string='Configuration',
+                                required=True, ondelete='cascade', index=True,
+                                help='Backup configuration')
+    date = fields.Datetime(string='Date', required=True,
+                           default=fields.Datetime.now,
+                           help='Date of the backup')
+    backup_filename = fields.Char(string='Backup Filename',
+                                  help='Name of the generated backup')
+    state = fields.Selection([
+        ('success', 'Success'),
+        ('failed', 'Failed'),
+    ], string='Status', required=True, help='Outcome of the backup')
+    attempts = fields.Integer(string='Attempts',
+                              help='Number of upload attempts')
+    error = fields.Char(string='Error', help='Error of the last attempt')
+    dump_time = fields.Float(string='Dump (s)',
+                             help='Duration of pg_dump, in seconds')
+    compress_time = fields.Float(string='Compress (s)',
+                                 help='Duration of the archiving and '
+                                      'compression, in seconds')
+    upload_time = fields.Float(string='Upload (s)',
+                               help='Duration of the upload of the archive, '
+                                    'in seconds')
+    filestore_time = fields.Float(string='Filestore (s)',
+                                  help='Duration of the incremental filestore '
+                                       'upload, in seconds')
+    retention_time = fields.Float(string='Retention Cleanup (s)',
+                                  help='Duration of the removal of the old '
+                                       'backups, in seconds')
+    total_time = fields.Float(string='Total (s)',
+                              help='Duration of the last attempt, in seconds')
@@ -0,0 +1,563 @@
+# -*- coding: utf-8 -*-
+###############################################################################
+#
+#    Cybrosys Technologies Pvt. Ltd.
+#
+#    Copyright (C) 2024-TODAY Cybrosys Technologies(<https://www.cybrosys.com>)
+#    Author: Cybrosys Techno Solutions (odoo@cybrosys.com)
+#
+#    You can modify it under the terms of the GNU LESSER
+#    GENERAL PUBLIC LICENSE (LGPL v3), Version 3.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU LESSER GENERAL PUBLIC LICENSE (LGPL v3) for more details.
+#
+#    You should have received a copy of the GNU LESSER GENERAL PUBLIC LICENSE
+#    (LGPL v3) along with this program.
+#    If not, see <http://www.gnu.org/licenses/>.
+#
+###############################################################################
+"""Streaming uploaders of the backup destinations.
+
+A destination is built from a ``db.backup.configure`` record but only keeps
+plain values, it never touches the record's environment once built. Every
+destination uploads a binary stream of unknown size chunk by chunk, using
+the multipart / resumable API of the storage when it has one.
+"""
+import errno
+import ftplib
+import json
+import os
+import shutil
+import stat
+import tempfile
+from datetime import datetime, timezone
+
+import boto3
+import dropbox
+import nextcloud_client
+import paramiko
+import requests
+from boto3.s3.transfer import TransferConfig
+
+from .backup_incremental import BLOB_FOLDER
+from .backup_stream import CHUNK_SIZE, iter_chunks, iter_chunks_with_last
+
+MICROSOFT_GRAPH_END_POINT = "https://graph.microsoft.com"
+GOOGLE_API_BASE_URL = 'https://www.googleapis.com'
+GOOGLE_FOLDER_MIMETYPE = 'application/vnd.google-apps.folder'
+# OneDrive upload session fragments must be multiples of 320 KiB
+ONEDRIVE_CHUNK_SIZE = 32 * 320 * 1024
+
+
+def _to_naive_utc(value):
+    """Convert an aware datetime returned by a storage API to naive UTC"""
+    if value.tzinfo:
+        value = value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
+
+
+class BackupDestination:
+    """Base class of the backup destinations, used as a context manager
+    holding the connection to the storage."""
+
+    def __init__(self, config):
+        self.code = config.backup_destination
+        # Identifies the storage location, see get_location()
+        self.location = ()
+        self.subfolders = set()
+
+    def __enter__(self):
+        self.connect()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def connect(self):
+        pass
+
+    def close(self):
+        pass
+
+    def get_location(self):
+        """Return a string identifying the storage location of the backups"""
+        return ':'.join([self.code] + [str(value) for value in self.location])
+
+    def ensure_subfolder(self, subfolder):
+        """Create ``subfolder`` in the backup folder once per connection"""
+        if subfolder and subfolder not in self.subfolders:
+            self._create_subfolder(subfolder)
+            self.subfolders.add(subfolder)
+
+    def _create_subfolder(self, subfolder):
+        pass
+
+    def upload(self, stream, filename, subfolder=None):
+        """Upload the binary ``stream`` as ``filename``, in ``subfolder`` of
+        the backup folder if given"""
+        raise NotImplementedError()
+
+    def list_backups(self):
+        """Return the stored backups as a list of (reference, name, creation datetime)"""
+        raise NotImplementedError()
+
+    def delete(self, reference):
+        """Delete the backup returned as ``reference`` by list_backups"""
+        raise NotImplementedError()
+
+    def remove_old_backups(self, days_to_remove, keep=()):
+        """Delete the backups older than ``days_to_remove`` days, except ``keep``"""
+        now = datetime.utcnow()
+        for reference, name, create_time in self.list_backups():
+            if name not in keep and (now - create_time).days >= days_to_remove:
+                self.delete(reference)
+
+
+class LocalDestination(BackupDestination):
+
+    def __init__(self, config):
+        super().__init__(config)
+        self.path = config.backup_path
+        self.location = (self.path,)
+
+    def connect(self):
+        os.makedirs(self.path, exist_ok=True)
+
+    def _create_subfolder(self, subfolder):
+        os.makedirs(os.path.join(self.path, subfolder), exist_ok=True)
+
+    def upload(self, stream, filename, subfolder=None):
+        self.ensure_subfolder(subfolder)
+        with open(os.path.join(self.path, subfolder or '', filename), 'wb') as backup_file:
+            shutil.copyfileobj(stream, backup_file, CHUNK_SIZE)
+
+    def list_backups(self):
+        backups = []
+        for entry in os.scandir(self.path):
+            if entry.is_file():
+                create_time = datetime.utcfromtimestamp(entry.stat().st_ctime)
+                backups.append((entry.path, entry.name, create_time))
+        return backups
+
+    def delete(self, reference):
+        os.remove(reference)
+
+
+class FtpDestination(BackupDestination):
+
+    def __init__(self, config):
+        super().__init__(config)
+        self.host = config.ftp_host
+        self.port = int(config.ftp_port)
+        self.user = config.ftp_user
+        self.password = config.ftp_password
+        self.path = config.ftp_path
+        self.location = (self.host, self.port, self.path)
+        self.ftp = None
+
+    def connect(self):
+        self.ftp = ftplib.FTP()
+        self.ftp.connect(self.host, self.port)
+        self.ftp.login(self.user, self.password)
+        self.ftp.encoding = "utf-8"
+        try:
+            self.ftp.cwd(self.path)
+        except ftplib.error_perm:
+            self.ftp.mkd(self.path)
+            self.ftp.cwd(self.path)
+
+    def close(self):
+        if self.ftp:
+            try:
+                self.ftp.quit()
+            except ftplib.all_errors:
+                self.ftp.close()
+
+    def _create_subfolder(self, subfolder):
+        try:
+            self.ftp.mkd(subfolder)
+        except ftplib.error_perm:
+            # Already exists
+            pass
+
+    def upload(self, stream, filename, subfolder=None):
+        self.ensure_subfolder(subfolder)
+        path = '%s/%s' % (subfolder, filename) if subfolder else filename
+        self.ftp.storbinary('STOR %s' % path, stream, blocksize=CHUNK_SIZE)
+
+    def list_backups(self):
+        try:
+            entries = list(self.ftp.mlsd(facts=['type', 'modify']))
+        except ftplib.error_perm:
+            # MLSD is not supported, only the files have a modification time
+            return self._list_backups_nlst()
+        return [
+            (name, name, datetime.strptime(facts['modify'][:14], "%Y%m%d%H%M%S"))
+            for name, facts in entries
+            if facts.get('type') == 'file' and name != BLOB_FOLDER
+        ]
+
+    def _list_backups_nlst(self):
+        backups = []
+        for name in self.ftp.nlst():
+            if name == BLOB_FOLDER or name in self.subfolders:
+                continue
+            try:
+                modify = self.ftp.sendcmd('MDTM ' + name)[4:]
+            except ftplib.error_perm:
+                # Not a file
+                continue
+            backups.append((name, name, datetime.strptime(modify[:14], "%Y%m%d%H%M%S")))
+        return backups
+
+    def delete(self, reference):
+        self.ftp.delete(reference)
+
+
+class SftpDestination(BackupDestination):
+
+    def __init__(self, config):
+        super().__init__(config)
+        self.host = config.sftp_host
+        self.port = int(config.sftp_port)
+        self.user = config.sftp_user
+        self.password = config.sftp_password
+        self.path = config.sftp_path
+        self.location = (self.host, self.port, self.path)
+        self.client = self.sftp = None
+
+    def connect(self):
+        self.client = paramiko.SSHClient()
+        self.client.set_missing_host_key_policy(paramiko.AutoAddPolicy())
+        self.client.connect(hostname=self.host, username=self.user,
+                            password=self.password, port=self.port)
+        self.sftp = self.client.open_sftp()
+        try:
+            self.sftp.chdir(self.path)
+        except IOError as e:
+            if e.errno != errno.ENOENT:
+                raise
+            self.sftp.mkdir(self.path)
+            self.sftp.chdir(self.path)
+
+    def close(self):
+        if self.sftp:
+            self.sftp.close()
+        if self.client:
+            self.client.close()
+
+    def _create_subfolder(self, subfolder):
+        try:
+            self.sftp.stat(subfolder)
+        except IOError as e:
+            if e.errno != errno.ENOENT:
+                raise
+            self.sftp.mkdir(subfolder)
+
+    def upload(self, stream, filename, subfolder=None):
+        self.ensure_subfolder(subfolder)
+        self.sftp.putfo(stream, '%s/%s' % (subfolder, filename) if subfolder else filename)
+
+    def list_backups(self):
+        return [
+            (attr.filename, attr.filename, datetime.utcfromtimestamp(attr.st_mtime))
+            for attr in self.sftp.listdir_attr()
+            if stat.S_ISREG(attr.st_mode)
+        ]
+
+    def delete(self, reference):
+        self.sftp.unlink(reference)
+
+
+class GoogleDriveDestination(BackupDestination):
+
+    def __init__(self, config):
+        super().__init__(config)
+        self.folder_key = config.google_drive_folder_key
+        self.location = (self.folder_key,)
+        self.headers = {"Authorization": "Bearer %s" % config.gdrive_access_token}
+        self.session = None
+        self.subfolder_keys = {}
+
+    def connect(self):
+        self.session = requests.Session()
+        self.session.headers.update(self.headers)
+
+    def close(self):
+        if self.session:
+            self.session.close()
+
+    def _create_subfolder(self, subfolder):
+        """Drive has no paths, look the subfolder up by name and keep its id"""
+        response = self.session.get("%s/drive/v3/files" % GOOGLE_API_BASE_URL, params={
+            'q': "'%s' in parents and name = '%s' and mimeType = '%s' and trashed = false" % (
+                self.folder_key, subfolder, GOOGLE_FOLDER_MIMETYPE),
+            'fields': 'files(id)',
+        })
+        response.raise_for_status()
+        files = response.json().get('files')
+        if files:
+            self.subfolder_keys[subfolder] = files[0]['id']
+            return
+        response = self.session.post("%s/drive/v3/files" % GOOGLE_API_BASE_URL, json={
+            'name': subfolder, 'mimeType': GOOGLE_FOLDER_MIMETYPE, 'parents': [self.folder_key]})
+        response.raise_for_status()
+        self.subfolder_keys[subfolder] = response.json()['id']
+
+    def upload(self, stream, filename, subfolder=None):
+        """Upload through a resumable upload session, one chunk per request"""
+        self.ensure_subfolder(subfolder)
+        parent = self.subfolder_keys[subfolder] if subfolder else self.folder_key
+        response = self.session.post(
+            "%s/upload/drive/v3/files?uploadType=resumable" % GOOGLE_API_BASE_URL,
+            headers={'Content-Type': 'application/json; charset=UTF-8'},
+            data=json.dumps({"name": filename, "parents": [parent]}))
+        response.raise_for_status()
+        session_url = response.headers['Location']
+        offset = 0
+        for chunk, is_last in iter_chunks_with_last(stream):
+            end = offset + len(chunk) - 1
+            total = str(end + 1) if is_last else '*'
+            response = self.session.put(session_url, data=chunk, headers={
+                'Content-Range': 'bytes %s-%s/%s' % (offset, end, total)})
+            # 308 Resume Incomplete acknowledges an intermediate chunk
+            if is_last or response.status_code != 308:
+                response.raise_for_status()
+            offset = end + 1
+
+    def list_backups(self):
+        backups = []
+        params = {
+            'q': "'%s' in parents and trashed = false" % self.folder_key,
+            'fields': 'nextPageToken, files(id, name, createdTime, mimeType)',
+        }
+        while True:
+            response = self.session.get("%s/drive/v3/files" % GOOGLE_API_BASE_URL, params=params)
+            response.raise_for_status()
+            result = response.json()
+            for file in result.get('files', []):
+                if file.get('mimeType') == GOOGLE_FOLDER_MIMETYPE:
+                    continue
+                create_time = datetime.strptime(file['createdTime'][:19], '%Y-%m-%dT%H:%M:%S')
+                backups.append((file['id'], file['name'], create_time))
+            if not result.get('nextPageToken'):
+                return backups
+            params['pageToken'] = result['nextPageToken']
+
+    def delete(self, reference):
+        self.session.delete("%s/drive/v3/files/%s" % (GOOGLE_API_BASE_URL, reference)).raise_for_status()
+
+
+class DropboxDestination(BackupDestination):
+
+    def __init__(self, config):
+        super().__init__(config)
+        self.client_key = config.dropbox_client_key
+        self.client_secret = config.dropbox_client_secret
+        self.refresh_token = config.dropbox_refresh_token
+        self.folder = config.dropbox_folder
+        self.location = (self.folder,)
+        self.dbx = None
+
+    def connect(self):
+        self.dbx = dropbox.Dropbox(app_key=self.client_key,
+                                   app_secret=self.client_secret,
+                                   oauth2_refresh_token=self.refresh_token)
+
+    def close(self):
+        if self.dbx:
+            self.dbx.close()
+
+    def upload(self, stream, filename, subfolder=None):
+        """Upload through an upload session, one chunk per request. Dropbox
+        creates the missing folders of the path."""
+        path = '/'.join(filter(None, [self.folder, subfolder, filename]))
+        session = self.dbx.files_upload_session_start(b'')
+        cursor = dropbox.files.UploadSessionCursor(session_id=session.session_id, offset=0)
+        for chunk in iter_chunks(stream):
+            self.dbx.files_upload_session_append_v2(chunk, cursor)
+            cursor.offset += len(chunk)
+        self.dbx.files_upload_session_finish(
+            b'', cursor, dropbox.files.CommitInfo(path=path))
+
+    def list_backups(self):
+        backups = []
+        result = self.dbx.files_list_folder(self.folder)
+        while True:
+            for entry in result.entries:
+                if isinstance(entry, dropbox.files.FileMetadata):
+                    backups.append((entry.path_display, entry.name, entry.client_modified))
+            if not result.has_more:
+                return backups
+            result = self.dbx.files_list_folder_continue(result.cursor)
+
+    def delete(self, reference):
+        self.dbx.files_delete_v2(reference)
+
+
+class OnedriveDestination(BackupDestination):
+    """OneDrive upload sessions need the total size with every fragment, the
+    stream is spooled to a temporary file before being uploaded in chunks."""
+
+    def __init__(self, config):
+        super().__init__(config)
+        self.folder_key = config.onedrive_folder_key
+        self.location = (self.folder_key,)
+        self.headers = {'Authorization': 'Bearer %s' % config.onedrive_access_token}
+        self.session = None
+
+    def connect(self):
+        self.session = requests.Session()
+        self.session.headers.update(self.headers)
+
+    def close(self):
+        if self.session:
+            self.session.close()
+
+    def upload(self, stream, filename, subfolder=None):
+        """Path based upload sessions create the missing folders of the path"""
+        path = '%s/%s' % (subfolder, filename) if subfolder else filename
+        with tempfile.TemporaryFile() as spool:
+            shutil.copyfileobj(stream, spool, CHUNK_SIZE)
+            file_size = spool.tell()
+            spool.seek(0)
+            response = self.session.post(
+                "%s/v1.0/me/drive/items/%s:/%s:/createUploadSession" % (
+                    MICROSOFT_GRAPH_END_POINT, self.folder_key, path))
+            response.raise_for_status()
+            upload_url = response.json().get('uploadUrl')
+            if not upload_url:
+                raise ValueError("Failed to get upload URL from OneDrive")
+            offset = 0
+            for chunk in iter_chunks(spool, ONEDRIVE_CHUNK_SIZE):
+                end = offset + len(chunk) - 1
+                # The upload URL is pre-authenticated and rejects the Authorization header
+                requests.put(upload_url, data=chunk, headers={
+                    'Content-Length': str(len(chunk)),
+                    'Content-Range': 'bytes %s-%s/%s' % (offset, end, file_size),
+                }).raise_for_status()
+                offset = end + 1
+
+    def list_backups(self):
+        backups = []
+        url = "%s/v1.0/me/drive/items/%s/children" % (MICROSOFT_GRAPH_END_POINT, self.folder_key)
+        while url:
+            response = self.session.get(url)
+            response.raise_for_status()
+            result = response.json()
+            for file in result.get('value', []):
+                if 'file' in file:
+                    create_time = datetime.strptime(file['createdDateTime'][:19], '%Y-%m-%dT%H:%M:%S')
+                    backups.append((file['id'], file['name'], create_time))
+            url = result.get('@odata.nextLink')
+        return backups
+
+    def delete(self, reference):
+        self.session.delete(
+            "%s/v1.0/me/drive/items/%s" % (MICROSOFT_GRAPH_END_POINT, reference)).raise_for_status()
+
+
+class NextcloudDestination(BackupDestination):
+    """Uploads are streamed to the WebDAV endpoint with a chunked request body."""
+
+    def __init__(self, config):
+        super().__init__(config)
+        self.domain = config.domain.rstrip('/')
+        self.user = config.next_cloud_user_name
+        self.password = config.next_cloud_password
+        self.folder = config.nextcloud_folder_key
+        self.location = (self.domain, self.folder)
+        self.client = None
+
+    def connect(self):
+        self.client = nextcloud_client.Client(self.domain)
+        self.client.login(self.user, self.password)
+        try:
+            self.client.file_info('/' + self.folder)
+        except nextcloud_client.HTTPResponseError as error:
+            if error.status_code != 404:
+                raise
+            self.client.mkdir(self.folder)
+
+    def close(self):
+        if self.client:
+            self.client.logout()
+
+    def _create_subfolder(self, subfolder):
+        try:
+            self.client.file_info('/%s/%s' % (self.folder, subfolder))
+        except nextcloud_client.HTTPResponseError as error:
+            if error.status_code != 404:
+                raise
+            self.client.mkdir('%s/%s' % (self.folder, subfolder))
+
+    def upload(self, stream, filename, subfolder=None):
+        self.ensure_subfolder(subfolder)
+        path = '/'.join(filter(None, [self.folder, subfolder, filename]))
+        response = requests.put(
+            "%s/remote.php/webdav/%s" % (self.domain, path),
+            data=iter_chunks(stream), auth=(self.user, self.password))
+        response.raise_for_status()
+
+    def list_backups(self):
+        return [
+            (item.path, item.get_name(), item.get_last_modified())
+            for item in self.client.list('/' + self.folder)
+            if not item.is_dir()
+        ]
+
+    def delete(self, reference):
+        self.client.delete(reference)
+
+
+class AmazonS3Destination(BackupDestination):
+    """Uploads use the boto3 managed multipart transfer, which reads the
+    stream one part at a time."""
+
+    def __init__(self, config):
+        super().__init__(config)
+        self.access_key = config.aws_access_key
+        self.secret_access_key = config.aws_secret_access_key
+        self.bucket = config.bucket_file_name
+        self.folder = config.aws_folder_name
+        self.location = (self.bucket, self.folder)
+        self.s3 = None
+
+    def connect(self):
+        self.s3 = boto3.client('s3', aws_access_key_id=self.access_key,
+                               aws_secret_access_key=self.secret_access_key)
+
+    def upload(self, stream, filename, subfolder=None):
+        key = '/'.join(filter(None, [self.folder, subfolder, filename]))
+        self.s3.upload_fileobj(
+            stream, self.bucket, key,
+            Config=TransferConfig(multipart_chunksize=CHUNK_SIZE, max_concurrency=4))
+
+    def list_backups(self):
+        backups = []
+        paginator = self.s3.get_paginator('list_objects_v2')
+        # The delimiter keeps the objects of the subfolders out of the listing
+        for page in paginator.paginate(Bucket=self.bucket, Prefix=self.folder + '/', Delimiter='/'):
+            for file in page.get('Contents', []):
+                if not file['Key'].endswith('/'):
+                    name = file['Key'].rsplit('/', 1)[-1]
+                    backups.append((file['Key'], name, _to_naive_utc(file['LastModified'])))
+        return backups
+
+    def delete(self, reference):
+        self.s3.delete_object(Bucket=self.bucket, Key=reference)
+
+
+BACKUP_DESTINATIONS = {
+    'local': LocalDestination,
+    'ftp': FtpDestination,
+    'sftp': SftpDestination,
+    'google_drive': GoogleDriveDestination,
+    'dropbox': DropboxDestination,
+    'onedrive': OnedriveDestination,
+    'next_cloud': NextcloudDestination,
+    'amazon_s3': AmazonS3Destination,
+}
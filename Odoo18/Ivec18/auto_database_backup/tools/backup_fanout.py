@@ -0,0 +1,178 @@
+# -*- coding: utf-8 -*-
+###############################################################################
+#
+#    Cybrosys Technologies Pvt. Ltd.
+#
+#    Copyright (C) 2024-TODAY Cybrosys Technologies(<https://www.cybrosys.com>)
+#    Author: Cybrosys Techno Solutions (odoo@cybrosys.com)
+#
+#    You can modify it under the terms of the GNU LESSER
+#    GENERAL PUBLIC LICENSE (LGPL v3), Version 3.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU LESSER GENERAL PUBLIC LICENSE (LGPL v3) for more details.
+#
+#    You should have received a copy of the GNU LESSER GENERAL PUBLIC LICENSE
+#    (LGPL v3) along with this program.
+#    If not, see <http://www.gnu.org/licenses/>.
+#
+###############################################################################
+"""Fan-out of one backup stream to several destinations.
+
+The chunks of the backup stream are read once and handed to one upload
+worker per destination through small bounded queues, so a single dump feeds
+all the destinations and the slowest one sets the pace. Failed destinations
+are retried with an exponential backoff, all the destinations failing in
+the same round sharing a new dump.
+"""
+import contextlib
+import io
+import logging
+import queue
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+
+from .backup_stream import CHUNK_SIZE, iter_chunks
+
+_logger = logging.getLogger(__name__)
+
+_EOF = object()
+# Number of chunks buffered per destination
+QUEUE_SIZE = 2
+
+
+@contextlib.contextmanager
+def measure(timings, stage):
+    """Add the duration of the block to ``timings[stage]``, in seconds"""
+    start = time.monotonic()
+    try:
+        yield
+    finally:
+        timings[stage] = timings.get(stage, 0.0) + time.monotonic() - start
+
+
+class QueueStream(io.RawIOBase):
+    """Readable stream fed with chunks by the distributing thread"""
+
+    def __init__(self):
+        super().__init__()
+        self.queue = queue.Queue(QUEUE_SIZE)
+        self.view = memoryview(b'')
+        self.done = False
+        self.abandoned = False
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        while not len(self.view):
+            if self.done:
+                return 0
+            item = self.queue.get()
+            if item is _EOF:
+                self.done = True
+                return 0
+            if isinstance(item, Exception):
+                # Fail the upload rather than storing a truncated backup
+                self.done = True
+                raise IOError("The backup stream failed: %s" % item) from item
+            self.view = memoryview(item)
+        size = min(len(buffer), len(self.view))
+        buffer[:size] = self.view[:size]
+        self.view = self.view[size:]
+        return size
+
+    def feed(self, item):
+        """Hand ``item`` to the reader, unless it gave up"""
+        while not self.abandoned:
+            try:
+                self.queue.put(item, timeout=1)
+                return
+            except queue.Full:
+                continue
+
+    def abandon(self):
+        self.abandoned = True
+
+
+class BackupResult:
+    """Outcome of the backup of one destination"""
+
+    def __init__(self):
+        self.state = 'failed'
+        self.attempts = 0
+        self.error = None
+        self.timings = {}
+
+
+def _run_job(job, stream, result):
+    result.attempts += 1
+    result.timings = {}
+    try:
+        with measure(result.timings, 'total'):
+            job(io.BufferedReader(stream, CHUNK_SIZE), result.timings)
+        result.state = 'success'
+        result.error = None
+    except Exception as error:
+        _logger.warning('Backup upload failed (attempt %s): %s', result.attempts, error)
+        result.state = 'failed'
+        result.error = error
+    finally:
+        stream.abandon()
+
+
+def _run_batch(pool, open_stream, batch, results):
+    """Dump once and upload to every job of ``batch`` concurrently"""
+    streams = [QueueStream() for dummy in batch]
+    futures = [
+        pool.submit(_run_job, job, stream, results[key])
+        for (key, job), stream in zip(batch, streams)
+    ]
+    stage_timings = {}
+    try:
+        with open_stream(stage_timings) as source:
+            for chunk in iter_chunks(source):
+                alive = [stream for stream in streams if not stream.abandoned]
+                if not alive:
+                    break
+                for stream in alive:
+                    stream.feed(chunk)
+    except Exception as error:
+        for stream in streams:
+            stream.feed(error)
+    else:
+        for stream in streams:
+            stream.feed(_EOF)
+    wait(futures)
+    for key, dummy in batch:
+        results[key].timings.update(stage_timings)
+
+
+def run_fanout(open_stream, jobs, max_workers=4, retries=2, backoff=60):
+    """Upload one backup stream to several destinations.
+
+    :param open_stream: callable(timings) returning a context manager that
+        yields a new backup stream and adds its stage timings to ``timings``
+    :param jobs: list of (key, callable(stream, timings)) uploading the
+        stream to a destination; they run in worker threads
+    :param max_workers: maximum number of concurrent uploads, the jobs are
+        processed in batches of that size, each batch sharing one dump
+    :param retries: number of retries of the failed jobs
+    :param backoff: seconds to wait before the first retry, doubled after
+        each round
+    :return: dict {key: BackupResult}
+    """
+    results = {key: BackupResult() for key, dummy in jobs}
+    pending = list(jobs)
+    with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='backup-upload') as pool:
+        for attempt in range(retries + 1):
+            if attempt:
+                time.sleep(backoff * 2 ** (attempt - 1))
+            for index in range(0, len(pending), max_workers):
+                _run_batch(pool, open_stream, pending[index:index + max_workers], results)
+            pending = [(key, job) for key, job in pending if results[key].state == 'failed']
+            if not pending:
+                break
+    return results
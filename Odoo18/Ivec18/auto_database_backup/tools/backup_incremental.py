@@ -0,0 +1,136 @@
+# -*- coding: utf-8 -*-
+###############################################################################
+#
+#    Cybrosys Technologies Pvt. Ltd.
+#
+#    Copyright (C) 2024-TODAY Cybrosys Technologies(<https://www.cybrosys.com>)
+#    Author: Cybrosys Techno Solutions (odoo@cybrosys.com)
+#
+#    You can modify it under the terms of the GNU LESSER
+#    GENERAL PUBLIC LICENSE (LGPL v3), Version 3.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU LESSER GENERAL PUBLIC LICENSE (LGPL v3) for more details.
+#
+#    You should have received a copy of the GNU LESSER GENERAL PUBLIC LICENSE
+#    (LGPL v3) along with this program.
+#    If not, see <http://www.gnu.org/licenses/>.
+#
+###############################################################################
+"""Incremental filestore backups.
+
+The Odoo filestore is content addressed: its files are named after the
+sha1 of their content and are never modified in place. Incremental backups
+upload each file once to the BLOB_FOLDER subfolder of the destination and,
+for every run, a small filestore manifest next to the database archive:
+
+    {"db_name": ..., "blob_folder": "filestore_blobs",
+     "files": {"<path in the filestore>": "<blob name>", ...}}
+
+A run's filestore is rebuilt by copying the blobs listed in its manifest,
+see restore_filestore().
+
+The files already uploaded to a destination are recorded in an append-only
+index in the Odoo data directory, one line per file. Files whose size or
+modification time changed are uploaded again.
+"""
+import hashlib
+import io
+import json
+import logging
+import os
+import shutil
+
+import odoo
+
+from .backup_stream import iter_filestore
+
+_logger = logging.getLogger(__name__)
+
+BLOB_FOLDER = 'filestore_blobs'
+
+
+def get_blob_name(relpath):
+    """Return the name of the blob of the filestore file ``relpath``"""
+    return relpath.replace(os.sep, '_')
+
+
+def get_manifest_filename(backup_filename):
+    """Return the name of the filestore manifest of a backup archive"""
+    return '%s.filestore.json' % backup_filename
+
+
+class FilestoreIndex:
+    """Append-only index of the filestore files uploaded to a destination"""
+
+    def __init__(self, config_id, location):
+        fingerprint = hashlib.sha1(location.encode()).hexdigest()[:16]
+        self.path = os.path.join(
+            odoo.tools.config['data_dir'], 'auto_database_backup',
+            'filestore_index_%s_%s.txt' % (config_id, fingerprint))
+        self.entries = set()
+        if os.path.exists(self.path):
+            with open(self.path, encoding='utf-8') as index_file:
+                self.entries = set(index_file.read().splitlines())
+
+    @staticmethod
+    def get_entry(relpath, path):
+        file_stat = os.stat(path)
+        return '%s\t%s\t%s' % (relpath, file_stat.st_size, int(file_stat.st_mtime))
+
+    def __contains__(self, entry):
+        return entry in self.entries
+
+    def __enter__(self):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        self.index_file = open(self.path, 'a', encoding='utf-8')
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.index_file.close()
+
+    def add(self, entry):
+        # Flushed right away, a run that fails halfway keeps its uploads
+        self.index_file.write(entry + '\n')
+        self.index_file.flush()
+        self.entries.add(entry)
+
+
+def upload_filestore_increment(destination, index, db_name, backup_filename):
+    """Upload the filestore files missing from ``destination`` and the
+    filestore manifest of ``backup_filename``.
+
+    :return: (number of uploaded files, number of files in the filestore)
+    """
+    files = {}
+    uploaded = 0
+    with index:
+        for path, relpath in iter_filestore(db_name):
+            blob_name = get_blob_name(relpath)
+            files[relpath] = blob_name
+            entry = index.get_entry(relpath, path)
+            if entry in index:
+                continue
+            with open(path, 'rb') as blob:
+                destination.upload(blob, blob_name, subfolder=BLOB_FOLDER)
+            index.add(entry)
+            uploaded += 1
+    manifest = {'db_name': db_name, 'blob_folder': BLOB_FOLDER, 'files': files}
+    destination.upload(io.BytesIO(json.dumps(manifest).encode()),
+                       get_manifest_filename(backup_filename))
+    _logger.info('Filestore of %s: %s files uploaded, %s already stored',
+                 db_name, uploaded, len(files) - uploaded)
+    return uploaded, len(files)
+
+
+def restore_filestore(manifest_path, blob_folder, filestore):
+    """Rebuild ``filestore`` from a filestore manifest and a local copy of
+    the blob folder of the destination"""
+    with open(manifest_path, encoding='utf-8') as manifest_file:
+        manifest = json.load(manifest_file)
+    for relpath, blob_name in manifest['files'].items():
+        target = os.path.join(filestore, relpath)
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        shutil.copyfile(os.path.join(blob_folder, blob_name), target)
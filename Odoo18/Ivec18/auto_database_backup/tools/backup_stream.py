@@ -0,0 +1,250 @@
+# -*- coding: utf-8 -*-
+###############################################################################
+#
+#    Cybrosys Technologies Pvt. Ltd.
+#
+#    Copyright (C) 2024-TODAY Cybrosys Technologies(<https://www.cybrosys.com>)
+#    Author: Cybrosys Techno Solutions (odoo@cybrosys.com)
+#
+#    You can modify it under the terms of the GNU LESSER
+#    GENERAL PUBLIC LICENSE (LGPL v3), Version 3.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU LESSER GENERAL PUBLIC LICENSE (LGPL v3) for more details.
+#
+#    You should have received a copy of the GNU LESSER GENERAL PUBLIC LICENSE
+#    (LGPL v3) along with this program.
+#    If not, see <http://www.gnu.org/licenses/>.
+#
+###############################################################################
+"""Streaming backup pipeline.
+
+The backup archive is produced on the fly from the pg_dump output and the
+filestore and read by the destination uploaders as a plain binary stream.
+Nothing is staged on disk and memory usage does not depend on the size of
+the database:
+
+- ``dump``: the pg_dump custom format output, as is;
+- ``zip``: the Odoo restorable zip (dump.sql, filestore, manifest.json),
+  written through a pipe by a producer thread;
+- ``tar``: a tar archive piped through a multithreaded ``zstd`` or ``pigz``
+  compressor. As tar members need their size upfront, the SQL dump is
+  stored as ``dump/dump.sql.NNNN`` parts of DUMP_PART_SIZE bytes which are
+  restored with ``cat dump/dump.sql.* | psql``.
+"""
+import contextlib
+import gzip
+import io
+import json
+import logging
+import os
+import shutil
+import subprocess
+import tarfile
+import tempfile
+import threading
+import time
+import zipfile
+
+import odoo
+from odoo.tools.misc import find_pg_tool, exec_pg_environ
+
+_logger = logging.getLogger(__name__)
+
+# Size of the chunks read from the backup stream by the uploaders
+CHUNK_SIZE = 8 * 1024 * 1024
+# Size of the SQL dump parts stored in tar archives, held in memory once
+DUMP_PART_SIZE = 64 * 1024 * 1024
+
+
+def resolve_compression(compression):
+    """Return the compression actually available for ``compression``"""
+    if compression == 'zstd' and not shutil.which('zstd'):
+        _logger.warning("zstd is not installed, tar backups are compressed with gzip")
+        return 'gzip'
+    return compression
+
+
+def get_extension(backup_format, compression):
+    """Return the file extension of a backup"""
+    if backup_format == 'tar':
+        return 'tar.zst' if resolve_compression(compression) == 'zstd' else 'tar.gz'
+    return backup_format
+
+
+def _get_compressor_command(compression, threads):
+    """Return the command compressing stdin to stdout, None to compress in Python"""
+    if resolve_compression(compression) == 'zstd':
+        return ['zstd', '-q', '-c', '-T%d' % threads]
+    if shutil.which('pigz'):
+        return ['pigz', '-c'] + (['-p', str(threads)] if threads else [])
+    if shutil.which('gzip'):
+        return ['gzip', '-c']
+    return None
+
+
+def iter_chunks(stream, size=CHUNK_SIZE):
+    """Yield the chunks of ``stream`` until its end"""
+    while True:
+        chunk = stream.read(size)
+        if not chunk:
+            return
+        yield chunk
+
+
+def iter_chunks_with_last(stream, size=CHUNK_SIZE):
+    """Yield (chunk, is_last) for uploaders that must flag the last chunk"""
+    chunk = stream.read(size)
+    while chunk:
+        next_chunk = stream.read(size)
+        yield chunk, not next_chunk
+        chunk = next_chunk
+
+
+@contextlib.contextmanager
+def _measure(timings, stage):
+    """Store the duration of the block in ``timings[stage]``, in seconds"""
+    start = time.monotonic()
+    try:
+        yield
+    finally:
+        if timings is not None:
+            timings[stage] = time.monotonic() - start
+
+
+@contextlib.contextmanager
+def _pg_dump(db_name, *args, timings=None):
+    """Run pg_dump on ``db_name`` and yield its standard output"""
+    cmd = [find_pg_tool('pg_dump'), '--no-owner', *args, db_name]
+    with tempfile.TemporaryFile() as errors, _measure(timings, 'dump'):
+        process = subprocess.Popen(cmd, env=exec_pg_environ(),
+                                   stdout=subprocess.PIPE, stderr=errors)
+        try:
+            yield process.stdout
+        finally:
+            process.stdout.close()
+            returncode = process.wait()
+        if returncode:
+            errors.seek(0)
+            raise subprocess.CalledProcessError(returncode, cmd, stderr=errors.read())
+
+
+def iter_filestore(db_name):
+    """Yield (path, path relative to the filestore) of every file of the
+    filestore of ``db_name``"""
+    filestore = odoo.tools.config.filestore(db_name)
+    for root, dirs, files in os.walk(filestore):
+        dirs.sort()
+        for name in sorted(files):
+            path = os.path.join(root, name)
+            yield path, os.path.relpath(path, filestore)
+
+
+def _write_zip(fileobj, db_name, manifest, filestore=True, timings=None):
+    """Write the Odoo restorable zip archive of ``db_name`` to ``fileobj``"""
+    with zipfile.ZipFile(fileobj, 'w', compression=zipfile.ZIP_DEFLATED, allowZip64=True) as archive:
+        with _pg_dump(db_name, timings=timings) as dump, archive.open('dump.sql', 'w', force_zip64=True) as member:
+            shutil.copyfileobj(dump, member, CHUNK_SIZE)
+        if filestore:
+            for path, relpath in iter_filestore(db_name):
+                archive.write(path, os.path.join('filestore', relpath))
+        archive.writestr('manifest.json', json.dumps(manifest, indent=4))
+
+
+def _add_tar_member(archive, name, data):
+    info = tarfile.TarInfo(name)
+    info.size = len(data)
+    info.mtime = int(time.time())
+    archive.addfile(info, io.BytesIO(data))
+
+
+def _write_tar(fileobj, db_name, manifest, filestore=True, timings=None):
+    """Write the tar archive of ``db_name`` to ``fileobj``"""
+    with tarfile.open(fileobj=fileobj, mode='w|') as archive:
+        _add_tar_member(archive, 'manifest.json', json.dumps(manifest, indent=4).encode())
+        with _pg_dump(db_name, timings=timings) as dump:
+            for part, data in enumerate(iter_chunks(dump, DUMP_PART_SIZE)):
+                _add_tar_member(archive, 'dump/dump.sql.%04d' % part, data)
+        if filestore:
+            for path, relpath in iter_filestore(db_name):
+                archive.add(path, os.path.join('filestore', relpath), recursive=False)
+
+
+@contextlib.contextmanager
+def _produce(write, command=None, timings=None):
+    """Run ``write(fileobj)`` in a thread and yield the stream it produces.
+
+    Without ``command`` the producer writes into a pipe whose read end is
+    yielded, otherwise it writes into the standard input of ``command``
+    (a compressor) whose standard output is yielded. Errors of the
+    producer are raised once the stream has been consumed. The duration of
+    the producer is stored as the 'compress' stage of ``timings``.
+    """
+    if command:
+        process = subprocess.Popen(command, stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+        reader, writer = process.stdout, process.stdin
+    else:
+        process = None
+        read_fd, write_fd = os.pipe()
+        reader, writer = os.fdopen(read_fd, 'rb'), os.fdopen(write_fd, 'wb')
+    errors = []
+
+    def run():
+        try:
+            with _measure(timings, 'compress'), writer:
+                write(writer)
+        except Exception as error:
+            errors.append(error)
+
+    thread = threading.Thread(target=run, name='backup-producer', daemon=True)
+    thread.start()
+    try:
+        yield reader
+    finally:
+        # Closing the read end unblocks a producer whose consumer failed
+        reader.close()
+        thread.join()
+        returncode = process.wait() if process else 0
+    if errors:
+        raise errors[0]
+    if returncode:
+        raise subprocess.CalledProcessError(returncode, command)
+
+
+@contextlib.contextmanager
+def open_backup_stream(db_name, backup_format, manifest=None, compression='zstd', threads=0,
+                       filestore=True, timings=None):
+    """Yield a readable binary stream of the backup of ``db_name``.
+
+    The stream must be read until its end inside the ``with`` block; the
+    pg_dump and compressor processes are reaped, and their errors raised,
+    when the block exits.
+
+    :param manifest: dict written as manifest.json in zip and tar archives
+    :param compression: 'zstd' or 'gzip', only used by tar archives
+    :param threads: compressor threads, 0 to use every core
+    :param filestore: whether zip and tar archives embed the filestore
+    :param timings: dict receiving the duration of the 'dump' and, for zip
+                    and tar archives, 'compress' stages, in seconds
+    """
+    if backup_format == 'dump':
+        with _pg_dump(db_name, '--format=c', timings=timings) as dump:
+            yield dump
+    elif backup_format == 'zip':
+        def write(fileobj):
+            _write_zip(fileobj, db_name, manifest, filestore, timings)
+        with _produce(write, timings=timings) as stream:
+            yield stream
+    else:
+        command = _get_compressor_command(compression, threads)
+        if command:
+            def write(fileobj):
+                _write_tar(fileobj, db_name, manifest, filestore, timings)
+        else:
+            def write(fileobj):
+                with gzip.GzipFile(fileobj=fileobj, mode='wb') as compressed:
+                    _write_tar(compressed, db_name, manifest, filestore, timings)
+        with _produce(write, command, timings) as stream:
+            yield stream
@@ -11,7 +11,7 @@
     'author': "Capstone Solutions",
     'website': "http://www.capstone-solutions.com",
     'category': 'account',
-    'version': '18.0.0.2',
+    'version': '18.0.0.3',
 
     # any module necessary for this one to work correctly
     'depends': ['base', 'account', 'accountant'],
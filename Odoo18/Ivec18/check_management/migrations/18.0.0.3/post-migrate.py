@@ -0,0 +1,24 @@
+# -*- coding: utf-8 -*-
+
+
+def migrate(cr, version):
+    """Link the existing payments to their cheque book leaf and flag the
+    used leaves"""
+    cr.execute("""
+        UPDATE account_payment p
+           SET cheque_id = c.id
+          FROM account_cheque c
+         WHERE p.cheque_id IS NULL
+           AND p.document_id = c.document_id
+           AND p.cheque_no = c.name
+    """)
+    cr.execute("""
+        UPDATE account_cheque c
+           SET payment_id = p.payment_id,
+               is_used = p.payment_id IS NOT NULL
+          FROM (SELECT c2.id, MIN(pay.id) AS payment_id
+                  FROM account_cheque c2
+                  LEFT JOIN account_payment pay ON pay.cheque_id = c2.id
+                 GROUP BY c2.id) p
+         WHERE c.id = p.id
+    """)
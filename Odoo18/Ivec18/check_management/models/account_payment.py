@@ -1,8 +1,9 @@
 from odoo import models, fields, api, _
 from odoo.exceptions import UserError, ValidationError
+from collections import defaultdict
 from datetime import date, datetime
+from odoo.tools import create_unique_index
 from num2words import num2words
-import calendar
 
 INTEGRITY_HASH_MOVE_FIELDS = ('date', 'journal_id', 'company_id')
 INTEGRITY_HASH_LINE_FIELDS = ('debit', 'credit', 'account_id', 'partner_id')
@@ -13,7 +14,7 @@ INTEGRITY_HASH_LINE_FIELDS = ('debit', 'credit', 'account_id', 'partner_id')
 
 class AccountMove(models.Model):
     _inherit = 'account.move'
-    cheque_number = fields.Char(string="Cheque Number")
+    cheque_number = fields.Char(string="Cheque Number", index=True)
 
 
 class AccountMoveLine(models.Model):
@@ -147,25 +148,14 @@ class AccountPayment(models.Model):
             self.journal_collection = self.document_id.journal_id.id
 
         if self.document_id:
-            cheques_dcument = self.env['account.cheque'].search([('document_id', '=', self.document_id.id), \
-                                                                 ('name', '=', self.cheque_no)])
-            ids = []
-            for rec in self.document_id.cheques_ids:
-                find_check = self.env['account.payment'].search([('cheque_no', '=', rec.name)])
-                if not find_check:
-                    ids.append(rec.id)
-
-            domain = {'cheque_id': [('document_id', '=', self.document_id.id), ('id', 'in', ids)]}
+            domain = {'cheque_id': [('document_id', '=', self.document_id.id), ('is_used', '=', False)]}
             return {'domain': domain}
 
     @api.onchange('cheque_id', 'document_id')
     def set_cheque_no(self):
-        if self.document_id and self.document_id.gap == False:
-            for rec in self.document_id.cheques_ids:
-                cheques = self.env['account.payment'].search([('cheque_no', '=', rec.name)], limit=1)
-                if not cheques and not self.cheque_id:
-                    self.cheque_id = rec.id
-                    break
+        if self.document_id and self.document_id.gap == False and not self.cheque_id:
+            self.cheque_id = self.env['account.cheque'].search(
+                [('document_id', '=', self.document_id.id), ('is_used', '=', False)], limit=1)
         # if self.document_id.gap == True and self.cheque_id:
         #     for rec in self.document_id.cheques_ids:
         #         cheques = self.env['account.payment'].search([('cheque_no', '=', rec.name)], limit=1)
@@ -198,9 +188,25 @@ class AccountPayment(models.Model):
     #             {'code': 'check', 'name': 'Checks', 'payment_type': 'inbound'})
     #     return self.env['account.payment.method'].search([], limit=1).id
 
-    _sql_constraints = [
-        ('cheque_no', 'UNIQUE (cheque_no)', 'Cheque Number must be unique')
-    ]
+    def init(self):
+        super().init()
+        # Cheque key: a cheque number is unique per company and bank
+        create_unique_index(self.env.cr, 'account_payment_cheque_key_uniq', self._table,
+                            ['cheque_no', 'company_id', 'COALESCE(cheque_bank, 0)'])
+
+    @api.constrains('cheque_no', 'cheque_bank', 'company_id')
+    def _check_cheque_key(self):
+        for rec in self.filtered('cheque_no'):
+            if self.search_count([('cheque_no', '=', rec.cheque_no), ('company_id', '=', rec.company_id.id),
+                                  ('cheque_bank', '=', rec.cheque_bank.id), ('id', '!=', rec.id)], limit=1):
+                raise ValidationError("Cheque Number must be unique per company and bank")
+
+    def _link_cheque_leaf(self):
+        """Link the payments typed with the number of a cheque book leaf to that leaf"""
+        for rec in self:
+            if rec.document_id and rec.cheque_no and not rec.cheque_id:
+                rec.cheque_id = self.env['account.cheque'].search(
+                    [('document_id', '=', rec.document_id.id), ('name', '=', rec.cheque_no)], limit=1)
 
     # @api.onchange('journal_cheque')
     # def onchnage_journal_cheque(self):
@@ -371,12 +377,14 @@ class AccountPayment(models.Model):
 
     def write(self, vals):
         res = super(AccountPayment, self).write(vals)
+        if 'document_id' in vals or 'cheque_no' in vals:
+            self._link_cheque_leaf()
         if 'journal_cheque' in vals:
             for rec in self:
                 rec.journal_last = rec.journal_cheque
                 rec.move_id.journal_id = rec.journal_cheque
         for rec in self:
-            if rec.cheque_no:
+            if rec.cheque_no and rec.move_id.cheque_number != rec.cheque_no:
                 rec.move_id.cheque_number = rec.cheque_no
             # self.move_id.ref=self.cheque_no
 
@@ -430,6 +438,7 @@ class AccountPayment(models.Model):
         #     vals['journal_id']=vals.get('journal_cheque')
 
         res = super(AccountPayment, self).create(vals)
+        res._link_cheque_leaf()
         if res.is_cheque == True:
             res.name = res._get_payment_name(res.journal_cheque, res.date)
             res.journal_cheque = res.journal_id.id
@@ -539,23 +548,8 @@ class AccountPayment(models.Model):
 
         return line_vals_list
     def _get_payment_name(self, journal, date):
-
-        date_from = "1-" + str(date.month) + "-" + str(date.year)
-        date_to = str(calendar.monthrange(date.year, date.month)[1]) + "-" + str(date.month) + "-" + str(date.year)
-        sequ = self.env['account.move'].search(
-            [('journal_id', '=', journal.id), ('date', '>=', datetime.strptime(date_from, "%d-%m-%Y")),
-             ('date', '<=', datetime.strptime(date_to, "%d-%m-%Y"))])
-        if not sequ:
-            sequ = [1]
         if journal and date:
-            name = journal.code + "/" + str(date.year) + "/" \
-                   + str(date.month) + "/" + str(len(sequ) + 1).zfill(5)
-
-            if self.env['account.move'].search([('name', '=', name)]):
-                name = journal.code + "/" + str(date.year) + "/" \
-                       + str(date.month) + "/" + str(len(sequ) + 2).zfill(5)
-
-            return name
+            return journal._next_cheque_entry_name(fields.Date.to_date(date))
         else:
             return ''
 
@@ -963,70 +957,173 @@ class AccountPayment(models.Model):
     #             })
 
     def _get_reconsile(self, credit_account):
-        movee_line = self.env['account.move.line'].search(
-            [('cheque_number', '=', self.cheque_no), ('account_id', '=', credit_account.id)]
-        )
-
-        if len(movee_line) > 1:
-            amls = [rec.id for rec in movee_line if not rec.full_reconcile_id]
-            if amls:
-                movee_line = self.env['account.move.line'].search([('id', 'in', amls)])
-
-                # Ensure partial_reconcile_ids is in the correct format (empty list if not used)
-                self.env['account.full.reconcile'].create({
-                    'reconciled_line_ids': [(6, 0, movee_line.ids)],
-                    'partial_reconcile_ids': [(6, 0, movee_line.ids)]  # Adjust if needed
-                })
-
-    def get_under_collection_journal(self):
-        move2 = []
-        if self.state_cheque == 'posted':
-            move2 = self.env['account.move'].create({'date': self.date_under_collection,
-                                                     'ref': "Cheque Num/" + (self.cheque_no or ''),
-                                                     'partner_id': self.partner_id.id or '',
-                                                     'name': self._get_payment_name(self.journal_under_collection,
-                                                                                    self.date_under_collection),
-                                                     'company_id': self.company_id.id,
-                                                     'journal_id': self.journal_under_collection.id,
-                                                     'line_ids': self.create_journal_receive_state(
-                                                         self.journal_under_collection,
-                                                         self.journal_id.default_account_id),
-                                                     'cheque_number': self.cheque_no,
-                                                     'currency_id': self.currency_id.id
+        self._reconcile_cheque_lines([(self.cheque_no, credit_account)])
 
-                                                     })
-            self.journal_collection = self.journal_under_collection.collection_journal.id if self.journal_under_collection.collection_journal else False
+    def _reconcile_cheque_lines(self, cheque_accounts):
+        """Reconcile the open entry lines of each (cheque number, account) pair, in one search"""
+        cheque_accounts = {(cheque_no, account.id) for cheque_no, account in cheque_accounts if cheque_no and account}
+        if not cheque_accounts:
+            return
+        lines = self.env['account.move.line'].search([
+            ('cheque_number', 'in', list({cheque_no for cheque_no, account_id in cheque_accounts})),
+            ('account_id', 'in', list({account_id for cheque_no, account_id in cheque_accounts})),
+            ('reconciled', '=', False),
+        ])
+        groups = defaultdict(list)
+        for line in lines:
+            key = (line.cheque_number, line.account_id.id)
+            if key in cheque_accounts:
+                groups[key].append(line.id)
+        for line_ids in groups.values():
+            amls = self.env['account.move.line'].browse(line_ids)
+            # The debit of a cheque against its credit, the partials and the
+            # full reconcile are created by the ORM
+            if len(amls) > 1 and amls.filtered(lambda line: line.debit) and amls.filtered(lambda line: line.credit):
+                amls.reconcile()
+
+    def _prepare_cheque_move_vals(self, journal, move_date, line_ids):
+        return {'date': move_date,
+                'ref': "Cheque Num/" + (self.cheque_no or ''),
+                'partner_id': self.partner_id.id or '',
+                'name': self._get_payment_name(journal, move_date),
+                'company_id': self.company_id.id,
+                'journal_id': journal.id,
+                'line_ids': line_ids,
+                'cheque_number': self.cheque_no,
+                'currency_id': self.currency_id.id,
+                }
 
-            # if not self.journal_id.post_at_bank_rec:
-            move2.action_post()
-            self.state_cheque = 'under_collect'
-            # self.get_employee_recieve()
-            self._get_reconsile(self.journal_id.default_account_id)
+    def _get_transition_value(self, values, field_name):
+        """Return the value of ``field_name`` for a transition: the one given in
+        ``values`` by the wizard, else the cheque's own"""
+        if field_name not in values:
+            return self[field_name]
+        field = self._fields[field_name]
+        return field.convert_to_record(field.convert_to_cache(values[field_name], self), self)
+
+    def _prepare_under_collection_transition(self, values):
+        journal = self._get_transition_value(values, 'journal_under_collection')
+        move_date = self._get_transition_value(values, 'date_under_collection')
+        if self.state_cheque == 'posted':
+            credit_account = self.journal_id.default_account_id
+            payment_vals = {'state_cheque': 'under_collect',
+                            'journal_collection': journal.collection_journal.id}
         elif self.state_cheque == 'cancelled':
+            credit_account = self.journal_reject.default_account_id
+            payment_vals = {'state_cheque': 'under_collect'}
+        else:
+            return False
+        move_vals = self._prepare_cheque_move_vals(
+            journal, move_date, self.create_journal_receive_state(journal, credit_account))
+        return move_vals, credit_account, dict(values, **payment_vals)
+
+    def _prepare_collection_transition(self, values):
+        journal = self._get_transition_value(values, 'journal_collection')
+        move_date = self._get_transition_value(values, 'date_collection')
+        credit_account = self.journal_under_collection.default_account_id
+        move_vals = self._prepare_cheque_move_vals(
+            journal, move_date, self.create_journal_receive_state(journal, credit_account))
+        return move_vals, credit_account, dict(values, state_cheque='reconciled')
+
+    def _prepare_transfer_transition(self, values):
+        journal = self._get_journal_to_transfer()
+        if not journal:
+            return False
+        journal_transfer = self._get_transition_value(values, 'journal_transfer')
+        move_vals = self._prepare_cheque_move_vals(
+            journal_transfer, self._get_transition_value(values, 'transfer_date'),
+            self.create_journal_send_state(journal, journal_transfer.default_account_id))
+        payment_vals = dict(values, journal_last=journal_transfer.id, state_cheque2=self.state_cheque)
+        return move_vals, journal.default_account_id, payment_vals
+
+    def _cheque_transition(self, prepare, values=None):
+        """Move the cheques of ``self`` to their next state in batch.
+
+        ``prepare`` names a method returning the entry values, the account to
+        reconcile and the payment values of one cheque, or False to skip it.
+        ``values`` are the cheque fields set by the wizard, they are only
+        written on the cheques moved. The entries are created and posted
+        together, then the cheques are written and reconciled; the cheques
+        failing are left untouched.
+
+        :return: dict with the posted ``moves``, the ``done`` payments and the
+            ``failed`` list of (payment, error message)
+        """
+        values = values or {}
+        failed = []
+        prepared = []
+        for rec in self:
+            try:
+                transition = getattr(rec, prepare)(values)
+            except (UserError, ValidationError) as error:
+                failed.append((rec, str(error)))
+                continue
+            if transition:
+                prepared.append((rec,) + tuple(transition))
+
+        posted = self._create_cheque_moves(prepared, failed)
+
+        done = self.browse().union(*[rec for rec, dummy, dummy2, dummy3 in posted])
+        moves = self.env['account.move'].union(*[move for dummy, move, dummy2, dummy3 in posted])
+        return {'moves': moves, 'done': done, 'failed': failed}
+
+    def _apply_cheque_transitions(self, prepared):
+        """Create and post the entries of ``prepared``, write the cheques and
+        reconcile them"""
+        moves = self.env['account.move'].create([move_vals for dummy, move_vals, dummy2, dummy3 in prepared])
+        moves.action_post()
+        payments_by_vals = defaultdict(list)
+        for rec, dummy, dummy2, payment_vals in prepared:
+            payments_by_vals[tuple(sorted(payment_vals.items()))].append(rec.id)
+        for payment_vals, payment_ids in payments_by_vals.items():
+            self.browse(payment_ids).write(dict(payment_vals))
+        self._reconcile_cheque_lines([(rec.cheque_no, credit_account)
+                                      for rec, dummy, credit_account, dummy2 in prepared])
+        return [(rec, move, credit_account, payment_vals)
+                for (rec, dummy, credit_account, payment_vals), move in zip(prepared, moves)]
+
+    def _create_cheque_moves(self, prepared, failed):
+        """Apply the transitions of ``prepared`` in one savepoint; when the batch
+        fails, retry each half of it to isolate the failing cheques"""
+        if not prepared:
+            return []
+        try:
+            with self.env.cr.savepoint():
+                return self._apply_cheque_transitions(prepared)
+        except (UserError, ValidationError) as error:
+            if len(prepared) == 1:
+                failed.append((prepared[0][0], str(error)))
+                return []
+        half = len(prepared) // 2
+        return self._create_cheque_moves(prepared[:half], failed) + self._create_cheque_moves(prepared[half:], failed)
+
+    def _cheque_transition_summary(self, result, title):
+        """Notification summing up a bulk transition"""
+        message = _("%s cheque(s) processed.", len(result['done']))
+        if result['failed']:
+            message += "\n" + _("%s cheque(s) failed:", len(result['failed']))
+            for rec, error in result['failed']:
+                message += "\n- %s: %s" % (rec.cheque_no or rec.name, error)
+        return {
+            'type': 'ir.actions.client',
+            'tag': 'display_notification',
+            'params': {
+                'title': title,
+                'message': message,
+                'type': 'warning' if result['failed'] else 'success',
+                'sticky': bool(result['failed']),
+                'next': {'type': 'ir.actions.act_window_close'},
+            },
+        }
 
-            move2 = self.env['account.move'].create({'date': self.date_under_collection,
-                                                     'ref': "Cheque Num/" + self.cheque_no or '',
-                                                     'partner_id': self.partner_id.id or '',
-
-                                                     'company_id': self.company_id.id,
-                                                     'journal_id': self.journal_under_collection.id,
-                                                     'name': self._get_payment_name(self.journal_under_collection,
-                                                                                    self.date_under_collection),
-                                                     'line_ids': self.create_journal_receive_state(
-                                                         self.journal_under_collection,
-                                                         self.journal_reject.default_account_id),
-                                                     'cheque_number': self.cheque_no,
-                                                     'currency_id': self.currency_id.id
-
-                                                     })
-
-            # if not self.journal_id.post_at_bank_rec:
-            move2.action_post()
-            self.state_cheque = 'under_collect'
-            # self.get_employee_recieve()
-            self._get_reconsile(self.journal_reject.default_account_id)
+    def _raise_if_cheque_transition_failed(self, result):
+        if result['failed']:
+            raise UserError(result['failed'][0][1])
+        return result['moves']
 
-        return move2
+    def get_under_collection_journal(self):
+        result = self._cheque_transition('_prepare_under_collection_transition')
+        return self._raise_if_cheque_transition_failed(result) or []
 
     def _get_payment_vendor(self):
         move2 = []
@@ -1080,28 +1177,8 @@ class AccountPayment(models.Model):
         return move2
 
     def get_collect_form_bank(self):
-
-        move2 = self.env['account.move'].create({'date': self.date_collection,
-                                                 'ref': "Cheque Num/" + (self.cheque_no or ''),
-                                                 'partner_id': self.partner_id.id or '',
-                                                 'name': self._get_payment_name(self.journal_collection,
-                                                                                self.date_collection),
-                                                 'company_id': self.company_id.id,
-                                                 'journal_id': self.journal_collection.id,
-                                                 'line_ids': self.create_journal_receive_state(
-                                                     self.journal_collection,
-                                                     self.journal_under_collection.default_account_id),
-                                                 'cheque_number': self.cheque_no,
-                                                 'currency_id': self.currency_id.id,
-
-                                                 })
-
-        # if not self.journal_id.post_at_bank_rec:
-        move2.action_post()
-        self.state_cheque = 'reconciled'
-        # self.get_employee_recieve()
-        self._get_reconsile(self.journal_under_collection.default_account_id)
-        return move2
+        result = self._cheque_transition('_prepare_collection_transition')
+        return self._raise_if_cheque_transition_failed(result)
 
     def get_collect_form_bank_send_cheque(self):
 
@@ -1666,54 +1743,31 @@ class AccountPayment(models.Model):
         }
 
     def transfer_journal_check(self):
+        result = self._cheque_transition('_prepare_transfer_transition')
+        moves = self._raise_if_cheque_transition_failed(result)
+        if moves:
+            return moves
 
-        journal = self.get_journal_to_transfer()
-        if journal:
-            move2 = self.env['account.move'].create({'date': self.transfer_date,
-                                                     'ref': "Cheque Num/" + self.cheque_no or '',
-                                                     'partner_id': self.partner_id.id or '',
-
-                                                     'company_id': self.company_id.id,
-                                                     'name': self._get_payment_name(self.journal_transfer,
-                                                                                    self.transfer_date),
-                                                     'journal_id': self.journal_transfer.id,
-                                                     'line_ids': self.create_journal_send_state(
-                                                         journal,
-                                                         self.journal_transfer.default_account_id),
-                                                     'cheque_number': self.cheque_no,
-                                                     'currency_id': self.currency_id.id
-
-                                                     })
-
-            # if not self.journal_id.post_at_bank_rec:
-            move2.action_post()
-            self.journal_last = self.journal_transfer.id
-            self.state_cheque2 = self.state_cheque
-            # self.get_employee_recieve()
-            self._get_reconsile(journal.default_account_id)
-            return move2
+    def _get_journal_to_transfer(self):
+        """Return the journal the cheque is transferred from, without writing it"""
+        self.ensure_one()
+        journals = {
+            'posted': self.journal_cheque,
+            'draft': self.journal_cheque,
+            'sent': self.journal_cheque,
+            'under_collect': self.journal_under_collection,
+            'reconciled': self.journal_collection,
+            'return': self.journal_return,
+            'cancelled': self.journal_reject,
+            'close': self.journal_close,
+            'payment_vendor': self.journal_vendor,
+        }
+        return journals.get(self.state_cheque, self.journal_last) or self.journal_cheque
 
     def get_journal_to_transfer(self):
         for rec in self:
-            if rec.state_cheque == 'posted' or rec.state_cheque == 'draft' or rec.state_cheque == 'sent':
-                # rec.journal_last = rec.journal_id.id
-                rec.journal_last = rec.journal_cheque.id
-            elif rec.state_cheque == 'under_collect':
-                rec.journal_last = rec.journal_under_collection.id
-            elif rec.state_cheque == 'reconciled':
-                rec.journal_last = rec.journal_collection.id
-            elif rec.state_cheque == 'return':
-                rec.journal_last = rec.journal_return.id
-            elif rec.state_cheque == 'cancelled':
-                rec.journal_last = rec.journal_reject.id
-            elif rec.state_cheque == 'close':
-                rec.journal_last = rec.journal_close.id
-            elif rec.state_cheque == 'payment_vendor':
-                rec.journal_last = rec.journal_vendor.id
-            if not rec.journal_last:
-                rec.journal_last = rec.journal_cheque.id
-
-        return journal_last
+            rec.journal_last = rec._get_journal_to_transfer()
+        return self.journal_last
 
     def unlink(self):
         if self.cheque_no and (self.state_cheque != 'draft' or self.state == 'posted'):
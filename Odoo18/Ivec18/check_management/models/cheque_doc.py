@@ -13,6 +13,20 @@ class AccountCheque(models.Model):
 
     document_id = fields.Many2one(comodel_name="cheque.document", string="", required=False, )
     is_select_ed = fields.Boolean()
+    payment_ids = fields.One2many(comodel_name="account.payment", inverse_name="cheque_id")
+    payment_id = fields.Many2one(comodel_name="account.payment", string="Payment",
+                                 compute='_compute_payment_id', store=True, index=True)
+    is_used = fields.Boolean(string="Used", compute='_compute_payment_id', store=True)
+
+    _sql_constraints = [
+        ('document_name_uniq', 'unique (document_id, name)', 'Cheque Number must be unique per cheque book !')
+    ]
+
+    @api.depends('payment_ids')
+    def _compute_payment_id(self):
+        for rec in self:
+            rec.payment_id = rec.payment_ids.sorted('id')[:1]
+            rec.is_used = bool(rec.payment_ids)
 
 
 class ChequesDocs(models.Model):
@@ -1,6 +1,7 @@
 from odoo import models, fields, api,_
 from odoo.exceptions import UserError, ValidationError
 from datetime import date, datetime
+import calendar
 class Bank (models.Model):
     _inherit = 'res.bank'
     journal_collection = fields.Many2one('account.journal', string=" Collection Journal",
@@ -19,4 +20,57 @@ class Journal (models.Model):
     cheque_cash= fields.Boolean("Cash Cheque", default=False)
     cheque_vendor = fields.Boolean("Vendor Cheque", default=False)
     transfer = fields.Boolean("Transfer Cheque", default=False)
-    collection_journal = fields.Many2one("account.journal")
\ No newline at end of file
+    collection_journal = fields.Many2one("account.journal")
+
+    cheque_sequence_id = fields.Many2one("ir.sequence", string="Cheque Entries Sequence", copy=False,
+                                         help="Monthly numbering of the cheque entries of the journal")
+
+    def _get_cheque_sequence(self):
+        self.ensure_one()
+        if not self.cheque_sequence_id:
+            self.sudo().cheque_sequence_id = self.env['ir.sequence'].sudo().create({
+                'name': _("Cheque Entries %s", self.code),
+                'implementation': 'standard',
+                'padding': 5,
+                'use_date_range': True,
+                'company_id': self.company_id.id,
+            })
+        return self.cheque_sequence_id.sudo()
+
+    def _get_cheque_date_range(self, sequence, entry_date):
+        """Return the monthly range of ``sequence`` containing ``entry_date``, the
+        first one of the month continues the entries already named"""
+        date_range = self.env['ir.sequence.date_range'].sudo().search(
+            [('sequence_id', '=', sequence.id), ('date_from', '<=', entry_date), ('date_to', '>=', entry_date)], limit=1)
+        if date_range:
+            return date_range
+        # Serialize the creation of the range, a concurrent transaction fails and is retried
+        self.env.cr.execute("UPDATE ir_sequence SET write_date = now() WHERE id = %s", [sequence.id])
+        date_from = entry_date.replace(day=1)
+        date_to = entry_date.replace(day=calendar.monthrange(entry_date.year, entry_date.month)[1])
+        prefix = self._get_cheque_name_prefix(entry_date)
+        self.env['account.move'].flush_model(['name', 'journal_id'])
+        self.env.cr.execute("""
+            SELECT MAX(SUBSTRING(name FROM '\\d+$')::int)
+              FROM account_move
+             WHERE journal_id = %s AND name LIKE %s
+        """, [self.id, prefix.replace('%', r'\%').replace('_', r'\_') + '%'])
+        last_number = self.env.cr.fetchone()[0] or 0
+        date_range = self.env['ir.sequence.date_range'].sudo().create({
+            'sequence_id': sequence.id,
+            'date_from': date_from,
+            'date_to': date_to,
+        })
+        if last_number:
+            date_range.write({'number_next': last_number + 1})
+        return date_range
+
+    def _get_cheque_name_prefix(self, entry_date):
+        return "%s/%s/%s/" % (self.code, entry_date.year, entry_date.month)
+
+    def _next_cheque_entry_name(self, entry_date):
+        """Return the next ``CODE/YYYY/M/00001`` name of the journal for the month of ``entry_date``"""
+        self.ensure_one()
+        sequence = self._get_cheque_sequence()
+        self._get_cheque_date_range(sequence, entry_date)
+        return self._get_cheque_name_prefix(entry_date) + sequence.next_by_id(sequence_date=entry_date)
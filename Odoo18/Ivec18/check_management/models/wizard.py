@@ -47,24 +47,38 @@ class wizard(models.Model):
                 })
 
                 # 'default_communication': self.cheque_bank.name + "/" + self.cheque_no
-            if rec.state_cheque=='posted' and self.is_transfer==True:
+        payments = self.payment_id
+        results = []
+        # The cheques are only written when their entry is created
+        if self.is_transfer == True:
+            to_transfer = payments.filtered(lambda rec: rec.state_cheque == 'posted')
+            results.append(to_transfer._cheque_transition('_prepare_transfer_transition', {
+                'journal_transfer': self.journal_transfer.id,
+                'transfer_date': self.transfer_date,
+                'is_transfer': False,
+            }))
 
-                rec.journal_transfer=self.journal_transfer
-                rec.transfer_date=self.transfer_date
-                rec.transfer_journal_check()
-                rec.is_transfer = False
+        if self.state_cheque2 == 'under_collect':
+            to_collect = payments.filtered(lambda rec: rec.state_cheque == 'posted')
+            results.append(to_collect._cheque_transition('_prepare_under_collection_transition', {
+                'journal_under_collection': self.journal_under_collection.id,
+                'date_under_collection': self.date_under_collection,
+            }))
 
-            if self.state_cheque2 == 'under_collect' and rec.state_cheque=='posted':
-                rec.journal_under_collection=self.journal_under_collection.id
-                rec.date_under_collection=self.date_under_collection
-                rec.get_under_collection_journal()
-
-            elif self.state_cheque2 == 'reconciled' and rec.state_cheque=='under_collect':
-                rec.date_collection = self.date_collection
-                rec.journal_collection = self.journal_collection.id
-                if rec.type_cheq == 'recieve_chq':
-
-                    rec.get_collect_form_bank()
-                # if rec.type_cheq == 'send_che':
-                #     rec.get_collect_form_bank_send_cheque()
+        elif self.state_cheque2 == 'reconciled':
+            to_collect = payments.filtered(lambda rec: rec.state_cheque == 'under_collect'
+                                           and rec.type_cheq == 'recieve_chq')
+            results.append(to_collect._cheque_transition('_prepare_collection_transition', {
+                'date_collection': self.date_collection,
+                'journal_collection': self.journal_collection.id,
+            }))
+            # if rec.type_cheq == 'send_che':
+            #     rec.get_collect_form_bank_send_cheque()
 
+        if results:
+            result = {
+                'moves': self.env['account.move'].union(*[res['moves'] for res in results]),
+                'done': self.env['account.payment'].union(*[res['done'] for res in results]),
+                'failed': [failure for res in results for failure in res['failed']],
+            }
+            return payments._cheque_transition_summary(result, _("Cheques"))
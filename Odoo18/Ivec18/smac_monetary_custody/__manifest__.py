@@ -11,7 +11,7 @@
 
     'author': "SMAC",
     'website': "https://www.yourcompany.com",
-    'version': '18.0.0.1',
+    'version': '18.0.0.2',
     'depends': ['base', 'account_accountant'],
     'data': [
         'security/ir.model.access.csv',
@@ -64,25 +64,18 @@ class ReconcileCustody(models.Model):
         for reconcile in self:
             if reconcile.requester_id:
                 reconcile.reconcile_custody_lines_ids = [(5, 0, 0)]
-                requested_custody_ids = self.env['request.cash.custody'].search(
-                    [('requester_id', '=', reconcile.requester_id.id), ('state', 'in', ['confirm', 'paid'])])
-                if requested_custody_ids:
-                    requested_lines = []
-                    for request in requested_custody_ids:
-                        for line in request.request_custody_lines_ids:
-                            reconciled_amount = sum(self.env['reconcile.cash.custody.lines'].search([
-                                ('reconcile_custody_id.state', 'in', ['confirm', 'reconciled']),
-                                ('reconcile_custody_id.requester_id', '=', request.requester_id.id)
-                            ]).mapped('reconciled_amount'))
-                            print("!!!!!!!!!!!!!!!!!!!!", reconciled_amount)
-                            if line.amount > reconciled_amount:
-                                requested_lines.append([0, 0, {
-                                    'account_id': line.request_custody_id.request_custody_lines_ids[0].account_id.id,
-                                    'amount': line.amount - reconciled_amount,
-                                    'project_id': line.request_custody_id.project_id.id,
-                                    'request_custody_line_id': line.id,
-                                }])
-                    reconcile.reconcile_custody_lines_ids = requested_lines
+                # The amount reconciled so far is stored on the request lines
+                request_lines = self.env['request.cash.custody.lines'].search([
+                    ('request_custody_id.requester_id', '=', reconcile.requester_id.id),
+                    ('request_custody_id.state', 'in', ['confirm', 'paid']),
+                    ('remaining_amount', '>', 0),
+                ], order='request_custody_id, id')
+                reconcile.reconcile_custody_lines_ids = [[0, 0, {
+                    'account_id': line.request_custody_id.request_custody_lines_ids[0].account_id.id,
+                    'amount': line.remaining_amount,
+                    'project_id': line.request_custody_id.project_id.id,
+                    'request_custody_line_id': line.id,
+                }] for line in request_lines]
 
     @api.depends("reconcile_custody_lines_ids", "reconcile_custody_lines_ids.reconciled_amount")
     def get_total_reconciled_amount(self):
@@ -182,7 +175,8 @@ class ReconcileCashCustodyLInes(models.Model):
     reconciled_amount = fields.Float(
         string='Reconciled Amount',
         required=True)
-    request_custody_line_id = fields.Many2one('request.cash.custody.lines', string='Request Cash Custody Line')
+    request_custody_line_id = fields.Many2one('request.cash.custody.lines', string='Request Cash Custody Line',
+                                              index=True)
 
     @api.onchange("partner_id")
     def get_payable_account(self):
@@ -145,6 +145,24 @@ class RequestCashCustodyLInes(models.Model):
     amount = fields.Float(
         string='Amount',
         required=True)
+    reconcile_line_ids = fields.One2many(
+        comodel_name='reconcile.cash.custody.lines',
+        inverse_name='request_custody_line_id',
+        string='Reconcile Lines')
+    reconciled_amount = fields.Float(
+        string='Reconciled Amount',
+        compute="get_reconciled_amount", store=True)
+    remaining_amount = fields.Float(
+        string='Remaining Amount',
+        compute="get_reconciled_amount", store=True)
+
+    @api.depends("amount", "reconcile_line_ids.reconciled_amount", "reconcile_line_ids.reconcile_custody_id.state")
+    def get_reconciled_amount(self):
+        for line in self:
+            line.reconciled_amount = sum(line.reconcile_line_ids.filtered(
+                lambda reconcile_line: reconcile_line.reconcile_custody_id.state in ['confirm', 'reconciled']
+            ).mapped('reconciled_amount'))
+            line.remaining_amount = line.amount - line.reconciled_amount
 
     @api.constrains("amount")
     def get_positive_amount(self):
@@ -3,7 +3,7 @@
 
 {
     'name': 'Blanket Sales Order | Sales Blanket Order',
-    'version': '18.0.0.0',
+    'version': '18.0.0.1',
     'category': 'Sales',
     'summary': 'Create blanket sales order manage blanket order sale blanket orders for sales process sales agreement blanket sale order sales blanket orders blanket sale orders from from blanket order quotation blanket order sale order for blanket order',
     'description': """Sales Blanket Order Odoo App is a versatile tool designed to streamline and optimize the sales order management process for businesses. This app allows businesses to create blanket sales orders and add products with different quantities and set expiry dates. Users can create sales quotations with different customers and quantities from blanket sale order.""",
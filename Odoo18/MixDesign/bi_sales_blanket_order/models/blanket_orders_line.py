@@ -111,11 +111,34 @@ class BlanketOrderLine(models.Model):
         help='The quantity delivered for this blanket order line'
     )
 
-    @api.depends('sale_lines.qty_delivered')
+    @api.depends('sale_lines.order_id.state', 'sale_lines.qty_delivered')
     def _compute_delivered_qty(self):
+        sale_quantities = self._get_sale_line_quantities()
         for line in self:
             # Calculate the delivered quantity by summing the delivered quantities from related sale order lines
-            line.delivered_qty = sum(sl.qty_delivered for sl in line.sale_lines if sl.order_id.state != 'cancel')
+            line.delivered_qty = sum(
+                delivered_qty for product, uom, ordered_qty, delivered_qty in sale_quantities[line._origin.id]
+            )
+
+    def _get_sale_line_quantities(self):
+        """Ordered and delivered quantities of the sale lines of the blanket
+        lines that are not cancelled, summed with one grouped query.
+
+        :return: {blanket line id: [(product, uom, ordered qty, delivered qty)]}
+        """
+        result = defaultdict(list)
+        line_ids = [id_ for id_ in self._origin.ids if id_]
+        if not line_ids:
+            return result
+        groups = self.env['sale.order.line'].sudo()._read_group(
+            [('blanket_order_line', 'in', line_ids), ('order_id.state', '!=', 'cancel')],
+            ['blanket_order_line', 'product_id', 'product_uom'],
+            ['product_uom_qty:sum', 'qty_delivered:sum'],
+        )
+        for blanket_line, product, uom, ordered_qty, delivered_qty in groups:
+            result[blanket_line.id].append((product.with_env(self.env), uom.with_env(self.env),
+                                            ordered_qty, delivered_qty))
+        return result
 
     @api.depends('product_id', 'company_id')
     def _compute_tax_id(self):
@@ -357,20 +380,20 @@ class BlanketOrderLine(models.Model):
     @api.depends(
         "sale_lines.order_id.state",
         "sale_lines.blanket_order_line",
+        "sale_lines.product_id",
         "sale_lines.product_uom_qty",
         "sale_lines.product_uom",
-        "sale_lines.qty_delivered",
-        "sale_lines.qty_invoiced",
         "product_uom_qty",
         "product_uom",
     )
     def _compute_quantities(self):
+        sale_quantities = self._get_sale_line_quantities()
         for line in self:
-            sale_lines = line.sale_lines
+            # One conversion per unit of measure of the sale lines
             line.ordered_uom_qty = sum(
-                sl.product_uom._compute_quantity(sl.product_uom_qty, line.product_uom)
-                for sl in sale_lines
-                if sl.order_id.state != "cancel" and sl.product_id == line.product_id
+                uom._compute_quantity(ordered_qty, line.product_uom)
+                for product, uom, ordered_qty, delivered_qty in sale_quantities[line._origin.id]
+                if product == line.product_id
             )
             line.remaining_uom_qty = line.product_uom_qty - line.ordered_uom_qty
             line.remaining_qty = line.product_uom._compute_quantity(
@@ -0,0 +1,10 @@
+# -*- coding: utf-8 -*-
+###############################################################################
+#
+#    Digital Integrated Transformation Solutions (DigitsCode)
+#    Copyright (C) 2025-TODAY Digital Integrated Transformation Solutions (<https://www.digitscode.com>).
+#    Author: Digital Integrated Transformation Solutions (<https://www.digitscode.com>)
+#
+###############################################################################
+
+from . import models
@@ -0,0 +1,39 @@
+# -*- coding: utf-8 -*-
+{
+    'name': 'Ledger Balance Snapshots',
+    'summary': 'Monthly materialized balances for the multi currency ledgers',
+    'description': """
+Ledger Balance Snapshots
+========================
+Materialized cumulative balances per company, account, partner, currency and
+month, used by the multi currency ledgers to compute opening balances without
+scanning the whole journal item history.
+
+Technical Features
+-----------------
+* Snapshot table filled by a scheduled action
+* Posting or resetting journal entries only logs their keys as changed, a
+  scheduled action refreshes the snapshots of the changed keys
+* The ledgers read the journal items of the changed keys until then
+* Opening balance = last snapshot row before the period + the lines of the
+  first month of the period
+    """,
+    'version': '18.0.1.1.0',
+    'author': 'Digital Integrated Transformation Solutions (DigitsCode)',
+    'maintainer': 'Digital Integrated Transformation Solutions (DigitsCode)',
+    'website': 'https://www.digitscode.com',
+    'email': 'info@digitscode.com',
+    'company': 'Digital Integrated Transformation Solutions (DigitsCode)',
+    'license': 'OPL-1',
+    'category': 'Accounting/Accounting',
+    'depends': [
+        'account',
+    ],
+    'data': [
+        'security/ir.model.access.csv',
+        'data/ir_cron_data.xml',
+    ],
+    'installable': True,
+    'auto_install': False,
+    'application': False,
+}
@@ -0,0 +1,25 @@
+# -*- coding: utf-8 -*-
+###############################################################################
+#
+#    Digital Integrated Transformation Solutions (DigitsCode)
+#    Copyright (C) 2025-TODAY Digital Integrated Transformation Solutions (<https://www.digitscode.com>).
+#    Author: Digital Integrated Transformation Solutions (<https://www.digitscode.com>)
+#
+###############################################################################
+
+from odoo import models
+
+
+class AccountMove(models.Model):
+    _inherit = 'account.move'
+
+    def _post(self, soft=True):
+        posted = super()._post(soft=soft)
+        self.env['digits.ledger.balance.snapshot']._refresh_moves(posted)
+        return posted
+
+    def button_draft(self):
+        posted = self.filtered(lambda move: move.state == 'posted')
+        res = super().button_draft()
+        self.env['digits.ledger.balance.snapshot']._refresh_moves(posted)
+        return res
@@ -0,0 +1,342 @@
+# -*- coding: utf-8 -*-
+###############################################################################
+#
+#    Digital Integrated Transformation Solutions (DigitsCode)
+#    Copyright (C) 2025-TODAY Digital Integrated Transformation Solutions (<https://www.digitscode.com>).
+#    Author: Digital Integrated Transformation Solutions (<https://www.digitscode.com>)
+#
+###############################################################################
+
+from odoo import api, fields, models
+from odoo.tools import create_unique_index
+import logging
+
+_logger = logging.getLogger(__name__)
+
+SNAPSHOT_AMOUNT_FIELDS = [
+    'debit', 'credit', 'balance',
+    'amount_currency', 'amount_currency_debit', 'amount_currency_credit',
+]
+
+# Monthly sums of posted journal items, grouped by snapshot key
+MONTHLY_AMOUNTS = """
+    SUM(aml.debit) AS debit,
+    SUM(aml.credit) AS credit,
+    SUM(aml.balance) AS balance,
+    SUM(aml.amount_currency) AS amount_currency,
+    SUM(GREATEST(aml.amount_currency, 0)) AS amount_currency_debit,
+    SUM(GREATEST(-aml.amount_currency, 0)) AS amount_currency_credit
+"""
+
+
+class LedgerBalanceSnapshot(models.Model):
+    """Cumulative posted balances at the end of each month with activity.
+
+    A row (company, account, partner, currency, month) holds the balances of
+    all posted journal items of that key dated up to the end of ``month``.
+    Rows only exist for months in which the key moved, so the balance of a
+    key before a date is the last row before that date's month.
+    """
+    _name = 'digits.ledger.balance.snapshot'
+    _description = 'Ledger Balance Snapshot'
+    _log_access = False
+    _order = 'company_id, account_id, partner_id, currency_id, month'
+
+    company_id = fields.Many2one('res.company', required=True, readonly=True, ondelete='cascade')
+    account_id = fields.Many2one('account.account', required=True, readonly=True, ondelete='cascade')
+    partner_id = fields.Many2one('res.partner', readonly=True, ondelete='cascade')
+    currency_id = fields.Many2one('res.currency', required=True, readonly=True, ondelete='cascade')
+    month = fields.Date(required=True, readonly=True, help="First day of the month")
+    debit = fields.Float(readonly=True)
+    credit = fields.Float(readonly=True)
+    balance = fields.Float(readonly=True)
+    amount_currency = fields.Float(readonly=True)
+    amount_currency_debit = fields.Float(readonly=True)
+    amount_currency_credit = fields.Float(readonly=True)
+
+    def init(self):
+        create_unique_index(
+            self._cr, 'digits_ledger_balance_snapshot_key_uniq', self._table,
+            ['company_id', 'account_id', 'COALESCE(partner_id, 0)', 'currency_id', 'month'])
+
+    # ------------------------------------------------------------------
+    # Reading
+    # ------------------------------------------------------------------
+
+    @api.model
+    def _is_available(self, company):
+        """Return whether the snapshots of ``company`` can be used by the ledgers"""
+        return bool(company.sudo().ledger_snapshot_date)
+
+    @api.model
+    def _get_opening_query(self, company, date_from, where=None):
+        """Return the SQL selecting the opening rows of every key at ``date_from``.
+
+        The query returns, per key, the last snapshot row before the month of
+        ``date_from`` and the posted journal items between the first day of
+        that month and ``date_from``, both with the columns
+        account_id, partner_id, currency_id and SNAPSHOT_AMOUNT_FIELDS.
+        Callers sum them per the key they need. The keys waiting for a
+        refresh use their last snapshot row before their first changed month
+        and the journal items from that month.
+
+        :param where: extra conditions on the ``src`` alias, which exposes
+                      company_id, account_id, partner_id and currency_id
+        :return: (query, params)
+        """
+        month_start = date_from.replace(day=1)
+        conditions = " AND ".join(["TRUE"] + (where or []))
+        # Keys changed since their last refresh: their snapshot rows from the
+        # first changed month are stale, their lines are read from that month
+        stale_keys = """
+            SELECT dirty.company_id, dirty.account_id, dirty.partner_id, dirty.currency_id,
+                   MIN(dirty.month) AS month
+            FROM digits_ledger_balance_snapshot_dirty dirty
+            WHERE dirty.company_id = %(snapshot_company_id)s
+            AND dirty.month < %(snapshot_month)s
+            GROUP BY 1, 2, 3, 4
+        """
+        line_columns = """
+            aml.company_id, aml.account_id, aml.partner_id,
+            COALESCE(aml.currency_id, aml.company_currency_id) AS currency_id,
+            aml.debit, aml.credit, aml.balance, aml.amount_currency,
+            GREATEST(aml.amount_currency, 0) AS amount_currency_debit,
+            GREATEST(-aml.amount_currency, 0) AS amount_currency_credit
+        """
+        query = """
+            SELECT latest.account_id, latest.partner_id, latest.currency_id, {latest_amounts}
+            FROM (
+                SELECT DISTINCT ON (src.account_id, src.partner_id, src.currency_id) src.*
+                FROM digits_ledger_balance_snapshot src
+                LEFT JOIN ({stale_keys}) stale
+                    ON stale.account_id = src.account_id
+                    AND stale.partner_id IS NOT DISTINCT FROM src.partner_id
+                    AND stale.currency_id = src.currency_id
+                WHERE src.company_id = %(snapshot_company_id)s
+                AND src.month < COALESCE(stale.month, %(snapshot_month)s)
+                AND {conditions}
+                ORDER BY src.account_id, src.partner_id, src.currency_id, src.month DESC
+            ) latest
+            UNION ALL
+            SELECT src.account_id, src.partner_id, src.currency_id, {line_amounts}
+            FROM (
+                SELECT {line_columns}
+                FROM account_move_line aml
+                WHERE aml.company_id = %(snapshot_company_id)s
+                AND aml.parent_state = 'posted'
+                AND aml.date >= %(snapshot_month)s
+                AND aml.date < %(snapshot_date_from)s
+                UNION ALL
+                SELECT {line_columns}
+                FROM ({stale_keys}) stale
+                JOIN account_move_line aml
+                    ON aml.company_id = stale.company_id AND aml.account_id = stale.account_id
+                    AND aml.partner_id IS NOT DISTINCT FROM stale.partner_id
+                    AND COALESCE(aml.currency_id, aml.company_currency_id) = stale.currency_id
+                    AND aml.date >= stale.month
+                    AND aml.date < %(snapshot_month)s
+                    AND aml.parent_state = 'posted'
+            ) src
+            WHERE {conditions}
+        """.format(
+            conditions=conditions,
+            stale_keys=stale_keys,
+            line_columns=line_columns,
+            latest_amounts=", ".join("latest.%s" % name for name in SNAPSHOT_AMOUNT_FIELDS),
+            line_amounts=", ".join("src.%s" % name for name in SNAPSHOT_AMOUNT_FIELDS),
+        )
+        params = {
+            'snapshot_company_id': company.id,
+            'snapshot_month': month_start,
+            'snapshot_date_from': date_from,
+        }
+        return query, params
+
+    # ------------------------------------------------------------------
+    # Maintenance
+    # ------------------------------------------------------------------
+
+    @api.model
+    def _lock_maintenance(self):
+        """Return whether the snapshot maintenance lock could be taken.
+
+        The snapshot rows are only rewritten by the scheduled actions under
+        this lock, never by the transactions posting journal entries.
+        """
+        self.env.cr.execute("SELECT pg_try_advisory_xact_lock(hashtext(%s))", [self._table])
+        return self.env.cr.fetchone()[0]
+
+    @api.model
+    def _cron_materialize_snapshots(self):
+        """Rebuild the snapshots of every company from the posted journal items"""
+        for company in self.env['res.company'].search([]):
+            if not self._lock_maintenance():
+                _logger.info("Ledger balance snapshots are being refreshed, materialization postponed")
+                return
+            self._materialize_company(company)
+            self.env.cr.commit()
+
+    @api.model
+    def _materialize_company(self, company):
+        """Rebuild all the snapshot rows of ``company`` in one pass"""
+        self.env['account.move.line'].flush_model()
+        self.env.cr.execute("DELETE FROM digits_ledger_balance_snapshot_dirty WHERE company_id = %s", [company.id])
+        self.env.cr.execute("DELETE FROM digits_ledger_balance_snapshot WHERE company_id = %s", [company.id])
+        self.env.cr.execute("""
+            WITH monthly AS (
+                SELECT aml.company_id, aml.account_id, aml.partner_id,
+                       COALESCE(aml.currency_id, aml.company_currency_id) AS currency_id,
+                       date_trunc('month', aml.date)::date AS month,
+                       {amounts}
+                FROM account_move_line aml
+                WHERE aml.company_id = %(company_id)s
+                AND aml.parent_state = 'posted'
+                GROUP BY 1, 2, 3, 4, 5
+            )
+            INSERT INTO digits_ledger_balance_snapshot
+                (company_id, account_id, partner_id, currency_id, month, {columns})
+            SELECT m.company_id, m.account_id, m.partner_id, m.currency_id, m.month, {cumulated}
+            FROM monthly m
+            WINDOW w AS (PARTITION BY m.company_id, m.account_id, m.partner_id, m.currency_id ORDER BY m.month)
+        """.format(
+            amounts=MONTHLY_AMOUNTS,
+            columns=", ".join(SNAPSHOT_AMOUNT_FIELDS),
+            cumulated=", ".join("SUM(m.%s) OVER w" % name for name in SNAPSHOT_AMOUNT_FIELDS),
+        ), {'company_id': company.id})
+        _logger.info("Materialized %s ledger balance snapshots for company %s", self.env.cr.rowcount, company.name)
+        company.sudo().ledger_snapshot_date = fields.Datetime.now()
+        self.invalidate_model()
+
+    @api.model
+    def _refresh_moves(self, moves):
+        """Mark the snapshot keys changed by a change of state of ``moves``.
+
+        The keys of the moves' lines are appended to the dirty keys, from the
+        month of their earliest line, and refreshed by a scheduled action.
+        The ledgers read the journal items of the dirty keys until then.
+        """
+        moves = moves.filtered(lambda move: self._is_available(move.company_id))
+        if not moves:
+            return
+        self.env['account.move.line'].flush_model()
+        self.env.cr.execute("""
+            INSERT INTO digits_ledger_balance_snapshot_dirty
+                (company_id, account_id, partner_id, currency_id, month)
+            SELECT aml.company_id, aml.account_id, aml.partner_id,
+                   COALESCE(aml.currency_id, aml.company_currency_id),
+                   date_trunc('month', MIN(aml.date))::date
+            FROM account_move_line aml
+            WHERE aml.move_id = ANY(%s)
+            GROUP BY 1, 2, 3, 4
+        """, [moves.ids])
+        if self.env.cr.rowcount:
+            cron = self.env.ref('digits_ledger_balance_snapshot.ir_cron_refresh_ledger_balance_snapshots',
+                                raise_if_not_found=False)
+            if cron:
+                cron._trigger()
+
+    @api.model
+    def _cron_refresh_snapshots(self):
+        """Recompute the snapshot rows of the dirty keys"""
+        if not self._lock_maintenance():
+            _logger.info("Ledger balance snapshots are being rebuilt, refresh postponed")
+            return
+        self.env.cr.execute("""
+            DELETE FROM digits_ledger_balance_snapshot_dirty
+            RETURNING company_id, account_id, partner_id, currency_id, month
+        """)
+        months = {}
+        for company_id, account_id, partner_id, currency_id, month in self.env.cr.fetchall():
+            key = (company_id, account_id, partner_id, currency_id)
+            months[key] = min(month, months.get(key, month))
+        if months:
+            self._refresh_keys([key + (month,) for key, month in months.items()])
+            _logger.info("Refreshed the ledger balance snapshots of %s keys", len(months))
+
+    @api.model
+    def _refresh_keys(self, affected):
+        """Recompute the rows of the given keys from their month onwards.
+
+        :param affected: list of (company_id, account_id, partner_id, currency_id, month)
+        """
+        company_ids, account_ids, partner_ids, currency_ids, months = (list(column) for column in zip(*affected))
+        params = {
+            'company_ids': company_ids,
+            'account_ids': account_ids,
+            'partner_ids': partner_ids,
+            'currency_ids': currency_ids,
+            'months': months,
+        }
+        affected_cte = """
+            affected AS (
+                SELECT * FROM unnest(
+                    %(company_ids)s::int[], %(account_ids)s::int[], %(partner_ids)s::int[],
+                    %(currency_ids)s::int[], %(months)s::date[]
+                ) AS a(company_id, account_id, partner_id, currency_id, month)
+            )
+        """
+        key_match = """
+            {0}.company_id = a.company_id AND {0}.account_id = a.account_id
+            AND {0}.partner_id IS NOT DISTINCT FROM a.partner_id AND {0}.currency_id = a.currency_id
+        """
+        self.env.cr.execute("""
+            WITH {affected}
+            DELETE FROM digits_ledger_balance_snapshot snap
+            USING affected a
+            WHERE {match} AND snap.month >= a.month
+        """.format(affected=affected_cte, match=key_match.format('snap')), params)
+        self.env.cr.execute("""
+            WITH {affected},
+            monthly AS (
+                SELECT a.company_id, a.account_id, a.partner_id, a.currency_id, a.month AS from_month,
+                       date_trunc('month', aml.date)::date AS month,
+                       {amounts}
+                FROM affected a
+                JOIN account_move_line aml
+                    ON aml.company_id = a.company_id AND aml.account_id = a.account_id
+                    AND aml.partner_id IS NOT DISTINCT FROM a.partner_id
+                    AND COALESCE(aml.currency_id, aml.company_currency_id) = a.currency_id
+                    AND aml.date >= a.month
+                    AND aml.parent_state = 'posted'
+                GROUP BY 1, 2, 3, 4, 5, 6
+            )
+            INSERT INTO digits_ledger_balance_snapshot
+                (company_id, account_id, partner_id, currency_id, month, {columns})
+            SELECT m.company_id, m.account_id, m.partner_id, m.currency_id, m.month, {cumulated}
+            FROM monthly m
+            LEFT JOIN LATERAL (
+                SELECT {columns}
+                FROM digits_ledger_balance_snapshot snap
+                WHERE snap.company_id = m.company_id AND snap.account_id = m.account_id
+                AND snap.partner_id IS NOT DISTINCT FROM m.partner_id AND snap.currency_id = m.currency_id
+                AND snap.month < m.from_month
+                ORDER BY snap.month DESC
+                LIMIT 1
+            ) base ON TRUE
+            WINDOW w AS (PARTITION BY m.company_id, m.account_id, m.partner_id, m.currency_id ORDER BY m.month)
+        """.format(
+            affected=affected_cte,
+            amounts=MONTHLY_AMOUNTS,
+            columns=", ".join(SNAPSHOT_AMOUNT_FIELDS),
+            cumulated=", ".join(
+                "COALESCE(base.{0}, 0) + SUM(m.{0}) OVER w".format(name) for name in SNAPSHOT_AMOUNT_FIELDS),
+        ), params)
+        self.invalidate_model()
+
+
+class LedgerBalanceSnapshotDirty(models.Model):
+    """Append-only log of the snapshot keys changed since their last refresh.
+
+    Posting journal entries only inserts rows here, so concurrent postings on
+    the same key never conflict. The snapshot rows of a key are stale from the
+    earliest ``month`` logged for it until the refresh removes its rows.
+    """
+    _name = 'digits.ledger.balance.snapshot.dirty'
+    _description = 'Ledger Balance Snapshot Dirty Key'
+    _log_access = False
+
+    company_id = fields.Many2one('res.company', required=True, readonly=True, index=True, ondelete='cascade')
+    account_id = fields.Many2one('account.account', required=True, readonly=True, ondelete='cascade')
+    partner_id = fields.Many2one('res.partner', readonly=True, ondelete='cascade')
+    currency_id = fields.Many2one('res.currency', required=True, readonly=True, ondelete='cascade')
+    month = fields.Date(required=True, readonly=True, help="First day of the first changed month")
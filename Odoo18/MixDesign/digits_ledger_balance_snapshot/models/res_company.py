@@ -0,0 +1,20 @@
+# -*- coding: utf-8 -*-
+###############################################################################
+#
+#    Digital Integrated Transformation Solutions (DigitsCode)
+#    Copyright (C) 2025-TODAY Digital Integrated Transformation Solutions (<https://www.digitscode.com>).
+#    Author: Digital Integrated Transformation Solutions (<https://www.digitscode.com>)
+#
+###############################################################################
+
+from odoo import fields, models
+
+
+class ResCompany(models.Model):
+    _inherit = 'res.company'
+
+    ledger_snapshot_date = fields.Datetime(
+        string='Ledger Snapshot Date', readonly=True, copy=False,
+        help="Last full materialization of the ledger balance snapshots. "
+             "The ledgers only read the snapshots once it is set."
+    )
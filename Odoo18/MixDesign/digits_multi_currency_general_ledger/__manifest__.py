@@ -26,7 +26,7 @@ Technical Features
 * PDF report with QWeb templates
 * [2025-05-04] Direct Excel export and currency handling improvements. Removed report_xlsx dependency. Ensured Excel matches PDF structure and values are in selected currency.
     """,
-    'version': '18.0.1.1.0',
+    'version': '18.0.1.2.0',
     'author': 'Digital Integrated Transformation Solutions (DigitsCode)',
     'maintainer': 'Digital Integrated Transformation Solutions (DigitsCode)',
     'website': 'https://www.digitscode.com',
@@ -37,6 +37,7 @@ Technical Features
     'depends': [
         'account',
         'web',
+        'digits_ledger_balance_snapshot',
     ],
     'data': [
         'security/ir.model.access.csv',
@@ -0,0 +1,35 @@
+# -*- coding: utf-8 -*-
+###############################################################################
+#
+#    Digital Integrated Transformation Solutions (DigitsCode)
+#    Copyright (C) 2025-TODAY Digital Integrated Transformation Solutions (<https://www.digitscode.com>).
+#    Author: Digital Integrated Transformation Solutions (<https://www.digitscode.com>)
+#
+###############################################################################
+
+import os
+
+from werkzeug.wsgi import wrap_file
+
+from odoo import http
+from odoo.http import Response, content_disposition, request
+
+XLSX_MIMETYPE = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+
+
+class MultiCurrencyGeneralLedgerController(http.Controller):
+
+    @http.route('/digits_multi_currency_general_ledger/xlsx/<int:wizard_id>', type='http', auth='user')
+    def download_xlsx(self, wizard_id, **kwargs):
+        """Stream a large general ledger export from its temporary file"""
+        wizard = request.env['multi.currency.general.ledger.wizard'].browse(wizard_id).exists()
+        if not wizard:
+            raise request.not_found()
+        xlsx_file, filename = wizard._export_xlsx_file()
+        headers = [
+            ('Content-Type', XLSX_MIMETYPE),
+            ('Content-Length', os.fstat(xlsx_file.fileno()).st_size),
+            ('Content-Disposition', content_disposition(filename)),
+        ]
+        return Response(wrap_file(request.httprequest.environ, xlsx_file),
+                        headers=headers, direct_passthrough=True)
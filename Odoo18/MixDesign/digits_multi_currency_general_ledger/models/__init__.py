@@ -9,3 +9,4 @@
 
 from . import account_move_line
 from . import multi_currency_general_ledger
+from . import ledger_engine
@@ -0,0 +1,358 @@
+# -*- coding: utf-8 -*-
+###############################################################################
+#
+#    Digital Integrated Transformation Solutions (DigitsCode)
+#    Copyright (C) 2025-TODAY Digital Integrated Transformation Solutions (<https://www.digitscode.com>).
+#    Author: Digital Integrated Transformation Solutions (<https://www.digitscode.com>)
+#
+###############################################################################
+
+from odoo import api, models
+from datetime import datetime
+from itertools import groupby
+import logging
+
+_logger = logging.getLogger(__name__)
+
+# Number of rows fetched per round trip from the server-side cursor
+LEDGER_CURSOR_ITERSIZE = 2000
+
+# Company currency lines are valued in company currency, the others in their own currency
+AMOUNT_COLUMNS = """
+    CASE WHEN COALESCE(aml.currency_id, %(company_currency_id)s) = %(company_currency_id)s
+         THEN aml.debit ELSE GREATEST(aml.amount_currency, 0) END AS debit,
+    CASE WHEN COALESCE(aml.currency_id, %(company_currency_id)s) = %(company_currency_id)s
+         THEN aml.credit ELSE GREATEST(-aml.amount_currency, 0) END AS credit,
+    CASE WHEN COALESCE(aml.currency_id, %(company_currency_id)s) = %(company_currency_id)s
+         THEN aml.balance ELSE aml.amount_currency END AS balance
+"""
+
+ACCOUNT_TYPE_FILTERS = {
+    'account_type_asset': ['asset_receivable', 'asset_cash', 'asset_current', 'asset_non_current', 'asset_fixed'],
+    'account_type_liability': ['liability_payable', 'liability_current', 'liability_non_current'],
+    'account_type_equity': ['equity'],
+    'account_type_income': ['income'],
+    'account_type_expense': ['expense'],
+    'account_type_other': ['off_balance'],
+}
+
+
+class MultiCurrencyGeneralLedgerEngine(models.AbstractModel):
+    _name = 'multi.currency.general.ledger.engine'
+    _description = 'Multi Currency General Ledger Engine'
+
+    # ------------------------------------------------------------------
+    # Options
+    # ------------------------------------------------------------------
+
+    @api.model
+    def _prepare_options(self, form):
+        """Normalize the wizard form into the options used by the engine"""
+        company_id = form.get('company_id') or self.env.company.id
+        date_from = self._to_date(form.get('date_from'))
+        date_to = self._to_date(form.get('date_to'))
+
+        if form.get('account_ids'):
+            accounts = self.env['account.account'].browse(form['account_ids'])
+        else:
+            account_type_filters = []
+            for key, account_types in ACCOUNT_TYPE_FILTERS.items():
+                if form.get(key):
+                    account_type_filters.extend(account_types)
+            accounts = self.env['multi.currency.general.ledger']._get_company_accounts(
+                company_id, account_type_filters or None)
+
+        if form.get('currency_ids'):
+            currencies = self.env['res.currency'].browse(form['currency_ids'])
+        else:
+            currencies = self.env['res.currency'].search([])
+
+        return {
+            'company': self.env['res.company'].browse(company_id),
+            'accounts': accounts,
+            'currencies': currencies,
+            'journal_ids': form.get('journal_ids') or [],
+            'date_from': date_from,
+            'date_to': date_to,
+            'target_move': form.get('target_move', 'posted'),
+            'display_account': form.get('display_account', 'movement'),
+            'show_init_balance': form.get('show_init_balance', True),
+        }
+
+    @api.model
+    def _to_date(self, value):
+        """Convert a string date coming from a serialized report action"""
+        if isinstance(value, str):
+            try:
+                return datetime.strptime(value, '%Y-%m-%d').date()
+            except ValueError as e:
+                _logger.error("Error converting date %s: %s", value, e)
+                return False
+        return value
+
+    # ------------------------------------------------------------------
+    # SQL
+    # ------------------------------------------------------------------
+
+    @api.model
+    def _get_where_clause(self, options):
+        """Return the WHERE clause and params shared by the opening and period queries.
+
+        Lines are bucketed per currency: lines without a foreign currency belong
+        to the company currency bucket and are valued in company currency, all
+        other lines are valued in their own currency through amount_currency.
+        """
+        params = {
+            'company_id': options['company'].id,
+            'company_currency_id': options['company'].currency_id.id,
+            'account_ids': options['accounts'].ids,
+            'currency_ids': options['currencies'].ids,
+        }
+        where = [
+            "aml.company_id = %(company_id)s",
+            "aml.account_id = ANY(%(account_ids)s)",
+            "COALESCE(aml.currency_id, %(company_currency_id)s) = ANY(%(currency_ids)s)",
+        ]
+        if options['journal_ids']:
+            where.append("aml.journal_id = ANY(%(journal_ids)s)")
+            params['journal_ids'] = list(options['journal_ids'])
+        if options['target_move'] == 'posted':
+            where.append("aml.parent_state = 'posted'")
+        return where, params
+
+    @api.model
+    def _get_initial_balances(self, options):
+        """Return the opening balances of every (account, currency) pair in one grouped query.
+
+        :return: dict {(account_id, currency_id): {'debit', 'credit', 'balance', 'amount_currency'}}
+        """
+        if not options['date_from'] or not options['accounts'] or not options['currencies']:
+            return {}
+        snapshot = self.env['digits.ledger.balance.snapshot']
+        if (options['target_move'] == 'posted' and not options['journal_ids']
+                and snapshot._is_available(options['company'])):
+            return self._get_initial_balances_from_snapshots(options)
+        where, params = self._get_where_clause(options)
+        where.append("aml.date < %(date_from)s")
+        params['date_from'] = options['date_from']
+        query = """
+            SELECT sub.account_id, sub.currency_id,
+                   COALESCE(SUM(sub.debit), 0) AS debit,
+                   COALESCE(SUM(sub.credit), 0) AS credit,
+                   COALESCE(SUM(sub.balance), 0) AS balance
+            FROM (
+                SELECT aml.account_id,
+                       COALESCE(aml.currency_id, %(company_currency_id)s) AS currency_id,
+                       {amounts}
+                FROM account_move_line aml
+                WHERE {where}
+            ) sub
+            GROUP BY sub.account_id, sub.currency_id
+        """.format(amounts=AMOUNT_COLUMNS, where=" AND ".join(where))
+        self.env.cr.execute(query, params)
+        return {
+            (row['account_id'], row['currency_id']): {
+                'debit': row['debit'],
+                'credit': row['credit'],
+                'balance': row['balance'],
+                'amount_currency': row['balance'],
+            }
+            for row in self.env.cr.dictfetchall()
+        }
+
+    @api.model
+    def _get_initial_balances_from_snapshots(self, options):
+        """Same as _get_initial_balances, read from the monthly balance snapshots.
+
+        Snapshots are not split per journal, callers must only use them for
+        posted ledgers without journal filter.
+        """
+        snapshot = self.env['digits.ledger.balance.snapshot']
+        params = {
+            'company_currency_id': options['company'].currency_id.id,
+            'account_ids': options['accounts'].ids,
+            'currency_ids': options['currencies'].ids,
+        }
+        opening_query, opening_params = snapshot._get_opening_query(
+            options['company'], options['date_from'], where=[
+                "src.account_id = ANY(%(account_ids)s)",
+                "src.currency_id = ANY(%(currency_ids)s)",
+            ])
+        params.update(opening_params)
+        query = """
+            SELECT opening.account_id, opening.currency_id,
+                   COALESCE(SUM(CASE WHEN opening.currency_id = %(company_currency_id)s
+                                THEN opening.debit ELSE opening.amount_currency_debit END), 0) AS debit,
+                   COALESCE(SUM(CASE WHEN opening.currency_id = %(company_currency_id)s
+                                THEN opening.credit ELSE opening.amount_currency_credit END), 0) AS credit,
+                   COALESCE(SUM(CASE WHEN opening.currency_id = %(company_currency_id)s
+                                THEN opening.balance ELSE opening.amount_currency END), 0) AS balance
+            FROM ({opening_query}) opening
+            GROUP BY opening.account_id, opening.currency_id
+        """.format(opening_query=opening_query)
+        self.env.cr.execute(query, params)
+        return {
+            (row['account_id'], row['currency_id']): {
+                'debit': row['debit'],
+                'credit': row['credit'],
+                'balance': row['balance'],
+                'amount_currency': row['balance'],
+            }
+            for row in self.env.cr.dictfetchall()
+        }
+
+    @api.model
+    def _count_period_lines(self, options):
+        """Return the number of period lines the report would stream"""
+        if not options['accounts'] or not options['currencies']:
+            return 0
+        where, params = self._get_period_where_clause(options)
+        self.env.cr.execute(
+            "SELECT COUNT(*) FROM account_move_line aml WHERE %s" % " AND ".join(where), params)
+        return self.env.cr.fetchone()[0]
+
+    @api.model
+    def _get_period_where_clause(self, options):
+        where, params = self._get_where_clause(options)
+        if options['date_from']:
+            where.append("aml.date >= %(date_from)s")
+            params['date_from'] = options['date_from']
+        if options['date_to']:
+            where.append("aml.date <= %(date_to)s")
+            params['date_to'] = options['date_to']
+        return where, params
+
+    @api.model
+    def _iter_period_lines(self, options):
+        """Stream the period lines of every selected pair, ordered like the report.
+
+        The lines are read through a server-side cursor so that only
+        LEDGER_CURSOR_ITERSIZE rows are held in memory at once.
+        """
+        if not options['accounts'] or not options['currencies']:
+            return
+        where, params = self._get_period_where_clause(options)
+        params['lang'] = self.env.lang or 'en_US'
+        query = """
+            SELECT aml.id,
+                   aml.account_id,
+                   COALESCE(aml.currency_id, %(company_currency_id)s) AS currency_id,
+                   aml.date,
+                   aml.move_id,
+                   am.name AS move_name,
+                   aml.journal_id,
+                   aj.code AS journal,
+                   COALESCE(aj.name->>%(lang)s, aj.name->>'en_US') AS journal_name,
+                   COALESCE(am.ref, '') AS ref,
+                   COALESCE(aml.name, '') AS name,
+                   aml.partner_id,
+                   COALESCE(rp.name, '') AS partner_name,
+                   {amounts}
+            FROM account_move_line aml
+            JOIN account_move am ON am.id = aml.move_id
+            JOIN account_journal aj ON aj.id = aml.journal_id
+            LEFT JOIN res_partner rp ON rp.id = aml.partner_id
+            WHERE {where}
+            ORDER BY array_position(%(account_ids)s, aml.account_id),
+                     array_position(%(currency_ids)s, COALESCE(aml.currency_id, %(company_currency_id)s)),
+                     aml.date, aml.move_id, aml.id
+        """.format(amounts=AMOUNT_COLUMNS, where=" AND ".join(where))
+
+        # Named cursors run inside the current transaction, make sure pending
+        # ORM writes are visible to them.
+        self.env['account.move.line'].flush_model()
+        self.env['account.move'].flush_model(['name', 'ref'])
+        cursor = self.env.cr._cnx.cursor('mcgl_period_lines_%s' % id(options))
+        cursor.itersize = LEDGER_CURSOR_ITERSIZE
+        try:
+            cursor.execute(query, params)
+            columns = None
+            for row in cursor:
+                if columns is None:
+                    columns = [desc[0] for desc in cursor.description]
+                line = dict(zip(columns, row))
+                line['amount_currency'] = line['balance']
+                yield line
+        finally:
+            cursor.close()
+
+    # ------------------------------------------------------------------
+    # Grouping
+    # ------------------------------------------------------------------
+
+    @api.model
+    def _is_pair_displayed(self, options, init_balance, has_lines):
+        """Apply the display_account filter to a single (account, currency) pair"""
+        display_account = options['display_account']
+        if display_account == 'all' or has_lines:
+            return True
+        if display_account == 'movement':
+            return bool(init_balance['debit'] or init_balance['credit'])
+        return bool(init_balance['balance'])
+
+    @api.model
+    def _iter_ledger(self, options):
+        """Yield (account, currency, init_balance, lines) for every pair to display.
+
+        Pairs come out in the order of options['accounts'] then
+        options['currencies']. ``lines`` is an iterator over the streamed
+        period lines of the pair and must be consumed before moving to the
+        next pair. Pairs without opening balance nor period lines are never
+        queried individually.
+        """
+        init_balances = self._get_initial_balances(options) if options['show_init_balance'] else {}
+        empty_balance = {'debit': 0.0, 'credit': 0.0, 'balance': 0.0, 'amount_currency': 0.0}
+        accounts = {account.id: account for account in options['accounts']}
+        currencies = {currency.id: currency for currency in options['currencies']}
+        sort_key = self._pair_sort_key(options)
+
+        if options['display_account'] == 'all':
+            pair_keys = [(a, c) for a in accounts for c in currencies]
+        else:
+            # Only pairs with an opening balance can show up without period lines
+            pair_keys = sorted(init_balances, key=sort_key)
+        pair_index = 0
+
+        def flush_until(key):
+            """Emit the pairs without period lines sorted before ``key``"""
+            nonlocal pair_index
+            while pair_index < len(pair_keys) and (key is None or sort_key(pair_keys[pair_index]) < sort_key(key)):
+                pending = pair_keys[pair_index]
+                pair_index += 1
+                init_balance = init_balances.get(pending, empty_balance)
+                if self._is_pair_displayed(options, init_balance, False):
+                    yield accounts[pending[0]], currencies[pending[1]], init_balance, []
+
+        for key, lines in groupby(self._iter_period_lines(options),
+                                  key=lambda line: (line['account_id'], line['currency_id'])):
+            yield from flush_until(key)
+            # The pair is served with its lines, skip its opening-only entry
+            if pair_index < len(pair_keys) and pair_keys[pair_index] == key:
+                pair_index += 1
+            yield accounts[key[0]], currencies[key[1]], init_balances.get(key, empty_balance), lines
+        yield from flush_until(None)
+
+    @api.model
+    def _pair_sort_key(self, options):
+        """Return a key function sorting (account_id, currency_id) pairs in report order"""
+        account_pos = {account_id: pos for pos, account_id in enumerate(options['accounts'].ids)}
+        currency_pos = {currency_id: pos for pos, currency_id in enumerate(options['currencies'].ids)}
+        return lambda key: (account_pos[key[0]], currency_pos[key[1]])
+
+    @api.model
+    def _get_ledger_results(self, options):
+        """Return the whole ledger as {account_id: {currency_id: values}} for the PDF report"""
+        results = {account.id: {} for account in options['accounts']}
+        for account, currency, init_balance, lines in self._iter_ledger(options):
+            lines = list(lines)
+            total_debit = sum(line['debit'] for line in lines)
+            total_credit = sum(line['credit'] for line in lines)
+            results[account.id][currency.id] = {
+                'init_balance': init_balance['balance'],
+                'init_balance_values': init_balance,
+                'lines': lines,
+                'total_debit': total_debit,
+                'total_credit': total_credit,
+                'balance': init_balance['balance'] + sum(line['balance'] for line in lines),
+            }
+        return results
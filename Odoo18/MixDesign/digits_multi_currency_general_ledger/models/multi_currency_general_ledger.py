@@ -152,7 +152,7 @@ class MultiCurrencyGeneralLedger(models.AbstractModel):
         _logger.info("Selected currencies: %s", currencies)
         
         # Prepare report data
-        results = {}
+        results = {account.id: {} for account in accounts}
         company_id = form.get('company_id', self.env.company.id)
         company = self.env['res.company'].browse(company_id)
         
@@ -166,39 +166,28 @@ class MultiCurrencyGeneralLedger(models.AbstractModel):
         _logger.info("Report parameters: from=%s, to=%s, target_move=%s, display_account=%s", 
                     date_from, date_to, target_move, display_account)
         
-        for account in accounts:
-            results[account.id] = {}
-            for currency in currencies:
-                results[account.id][currency.id] = {
-                    'debit': 0.0,
-                    'credit': 0.0,
-                    'balance': 0.0,
-                    'init_balance': 0.0,
-                    'lines': []
-                }
-                
-                # Compute initial balance if needed
-                if date_from and show_init_balance:
-                    init_balance = self._get_initial_balance(
-                        account, currency, journals, date_from, target_move, company_id
-                    )
-                    results[account.id][currency.id]['init_balance'] = init_balance
-                
-                # Get move lines
-                move_lines = self._get_move_lines(
-                    account, currency, journals, date_from, date_to, 
-                    target_move, company_id
-                )
-                
-                _logger.info("Account %s, Currency %s: found %s move lines", 
-                           account.name, currency.name, len(move_lines))
-                
-                # Process move lines
-                for line in move_lines:
-                    results[account.id][currency.id]['lines'].append(line)
-                    results[account.id][currency.id]['debit'] += line['debit']
-                    results[account.id][currency.id]['credit'] += line['credit']
-                    results[account.id][currency.id]['balance'] += line['balance']
+        engine = self.env['multi.currency.general.ledger.engine']
+        options = {
+            'company': company,
+            'accounts': accounts,
+            'currencies': currencies,
+            'journal_ids': journals.ids if form.get('journal_ids') else [],
+            'date_from': engine._to_date(date_from),
+            'date_to': engine._to_date(date_to),
+            'target_move': target_move,
+            # Every pair is kept, the template decides what to print
+            'display_account': 'all',
+            'show_init_balance': bool(date_from and show_init_balance),
+        }
+        for account, currency, init_balance, lines in engine._iter_ledger(options):
+            lines = list(lines)
+            results[account.id][currency.id] = {
+                'debit': sum(line['debit'] for line in lines),
+                'credit': sum(line['credit'] for line in lines),
+                'balance': sum(line['balance'] for line in lines),
+                'init_balance': init_balance['balance'],
+                'lines': lines,
+            }
         
         return {
             'doc_ids': accounts.ids,
@@ -210,151 +199,3 @@ class MultiCurrencyGeneralLedger(models.AbstractModel):
             'form': form,
             'results': results,
         }
-        
-    def _get_initial_balance(self, account, currency, journals, date_from, target_move, company_id):
-        """Calculate initial balance for an account in a specific currency"""
-        company = self.env['res.company'].browse(company_id)
-        company_currency = company.currency_id
-        
-        try:
-            # For company currency use balance field
-            # For foreign currency use amount_currency field with currency filter
-            if currency.id == company_currency.id:
-                query = """
-                    SELECT COALESCE(SUM(aml.balance), 0) as initial_balance
-                    FROM account_move_line aml
-                    JOIN account_move am ON aml.move_id = am.id
-                    WHERE aml.account_id = %s
-                    AND aml.company_id = %s
-                    AND aml.date < %s
-                """
-                params = [
-                    account.id,
-                    company_id,
-                    date_from,
-                ]
-            else:
-                # For foreign currency, we need to filter by currency_id and use amount_currency
-                query = """
-                    SELECT COALESCE(SUM(aml.amount_currency), 0) as initial_balance
-                    FROM account_move_line aml
-                    JOIN account_move am ON aml.move_id = am.id
-                    WHERE aml.account_id = %s
-                    AND aml.currency_id = %s
-                    AND am.company_id = %s
-                    AND aml.date < %s
-                """
-                params = [
-                    account.id,
-                    currency.id,
-                    company_id,
-                    date_from,
-                ]
-            
-            # Add journal filter if specified
-            if journals and journals.ids:
-                query += " AND aml.journal_id IN %s"
-                params.append(tuple(journals.ids))
-            
-            # Add target move filter
-            if target_move == 'posted':
-                query += " AND aml.parent_state = 'posted'"
-            
-            _logger.error("DEBUG: Initial balance query: %s, params: %s", query, params)
-            
-            self.env.cr.execute(query, params)
-            result = self.env.cr.dictfetchone()
-            return result['initial_balance'] if result else 0.0
-        except Exception as e:
-            _logger.error("Error calculating initial balance: %s", e)
-            return 0.0
-    
-    def _get_move_lines(self, account, currency, journals, date_from, date_to, target_move, company_id):
-        """Get move lines for an account in a specific currency within date range"""
-        company = self.env['res.company'].browse(company_id)
-        company_currency = company.currency_id
-        
-        # Build domain for move lines search
-        domain = [
-            ('account_id', '=', account.id),
-            ('company_id', 'in', [company_id]),
-        ]
-        
-        # Add journal filter if specified
-        if journals and journals.ids:
-            domain.append(('journal_id', 'in', journals.ids))
-        
-        # Add date filters
-        if date_from:
-            domain.append(('date', '>=', date_from))
-        if date_to:
-            domain.append(('date', '<=', date_to))
-            
-        # Add target move filter
-        if target_move == 'posted':
-            domain.append(('parent_state', '=', 'posted'))
-        
-        # CRITICAL: The approach to currency filtering needs to be different
-        # For company currency (base currency), remove currency filter OR check if it's NULL/company currency
-        # For foreign currencies, only get lines with that specific currency
-        if currency.id == company_currency.id:
-            # For company currency, use a special filter that gets lines
-            # with NO currency OR with company currency
-            domain.extend(['|', ('currency_id', '=', False), ('currency_id', '=', company_currency.id)])
-        else:
-            # For foreign currency, only lines with this specific currency
-            domain.append(('currency_id', '=', currency.id))
-        
-        _logger.error("DEBUG: Move lines search domain: %s", domain)
-        
-        try:
-            # Search for move lines
-            move_lines = self.env['account.move.line'].search(domain, order='date, move_id, id')
-            
-            _logger.error("DEBUG: Found %s move lines for account %s and currency %s", 
-                        len(move_lines), account.name, currency.name)
-            
-            # If we found any move lines, log the first one as sample
-            if move_lines:
-                sample = move_lines[0]
-                _logger.error("DEBUG: Sample move line - ID: %s, Date: %s, Debit: %s, Credit: %s, Amount Currency: %s, Currency: %s", 
-                           sample.id, sample.date, sample.debit, sample.credit, 
-                           sample.amount_currency, sample.currency_id.name if sample.currency_id else "None")
-            
-            # Process move lines
-            result = []
-            for line in move_lines:
-                # Determine debit/credit/balance based on currency
-                if currency.id == company_currency.id:
-                    # For company currency
-                    debit = line.debit
-                    credit = line.credit
-                    balance = line.balance
-                else:
-                    # For foreign currency, use amount_currency with appropriate sign
-                    debit = abs(line.amount_currency) if line.amount_currency > 0 else 0.0
-                    credit = abs(line.amount_currency) if line.amount_currency < 0 else 0.0
-                    balance = line.amount_currency
-                
-                # Add line data
-                result.append({
-                    'id': line.id,
-                    'date': line.date,
-                    'move_id': line.move_id.id,
-                    'move_name': line.move_id.name,
-                    'journal_id': line.journal_id.id,
-                    'journal_name': line.journal_id.name,
-                    'ref': line.move_id.ref or '',
-                    'name': line.name or '',
-                    'partner_id': line.partner_id.id if line.partner_id else False,
-                    'partner_name': line.partner_id.name if line.partner_id else '',
-                    'debit': debit,
-                    'credit': credit,
-                    'balance': balance,
-                })
-            
-            return result
-            
-        except Exception as e:
-            _logger.error("Error retrieving move lines: %s", e)
-            return []
@@ -88,7 +88,7 @@ class MultiCurrencyGeneralLedgerXlsx(models.AbstractModel):
             data = {'form': form}
             
             # Get data from the report model
-            report = self.env['report.mcgl_pdf']
+            report = self.env['report.digits_multi_currency_general_ledger.mcgl_pdf']
             result = report._get_report_values([], data)
             _logger.info("Successfully retrieved report data")
             return result
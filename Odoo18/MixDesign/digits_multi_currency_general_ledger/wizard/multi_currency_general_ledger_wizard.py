@@ -10,11 +10,18 @@
 from odoo import api, fields, models, _
 from odoo.exceptions import UserError
 from datetime import datetime, date
+import base64
+import io
 import json
 import logging
+import os
+import tempfile
 
 _logger = logging.getLogger(__name__)
 
+# Default number of move lines above which the XLSX export switches to streaming
+XLSX_STREAMING_THRESHOLD = 50000
+
 
 class MultiCurrencyGeneralLedgerWizard(models.TransientModel):
     _name = 'multi.currency.general.ledger.wizard'
@@ -97,88 +104,95 @@ class MultiCurrencyGeneralLedgerWizard(models.TransientModel):
     
     def action_export_xlsx(self):
         """Export XLSX report directly using xlsxwriter - matching PDF report format"""
-        import base64
-        import io
-        import logging
-        try:
-            import xlsxwriter
-        except ImportError:
-            raise UserError(_("The xlsxwriter library is not installed. Please install it using 'pip install xlsxwriter'."))
+        xlsxwriter = self._import_xlsxwriter()
         
         self.ensure_one()
-        _logger = logging.getLogger(__name__)
         _logger.info("Starting direct XLSX Export for Multi Currency General Ledger")
         
-        # Prepare data using same method as PDF report
-        form_data = self._prepare_report_data()['form']
+        # Opening balances and period lines come from the shared ledger engine
+        engine = self.env['multi.currency.general.ledger.engine']
+        options = engine._prepare_options(self._prepare_report_data()['form'])
+        
+        # Large ledgers are written to a temporary file and streamed by the controller
+        line_count = engine._count_period_lines(options)
+        if line_count > self._get_xlsx_streaming_threshold():
+            _logger.info("Streaming XLSX Export for %s move lines", line_count)
+            return {
+                'type': 'ir.actions.act_url',
+                'url': '/digits_multi_currency_general_ledger/xlsx/%s' % self.id,
+                'target': 'self',
+            }
         
-        # Get the report model to use its data processing methods
-        report_model = self.env['report.digits_multi_currency_general_ledger.mcgl_pdf']
+        # Create in-memory Excel file
+        output = io.BytesIO()
+        workbook = xlsxwriter.Workbook(output)
+        self._write_xlsx_workbook(workbook, options)
         
-        # Get accounts
-        account_ids = form_data.get('account_ids', [])
-        if account_ids:
-            accounts = self.env['account.account'].browse(account_ids)
-        else:
-            # Get accounts based on selected types
-            company_id = form_data.get('company_id')
-            
-            # Build account type filters
-            account_type_filters = []
-            if form_data.get('account_type_asset'):
-                account_type_filters.extend(['asset_receivable', 'asset_cash', 'asset_current', 'asset_non_current', 'asset_fixed'])
-            if form_data.get('account_type_liability'):
-                account_type_filters.extend(['liability_payable', 'liability_current', 'liability_non_current'])
-            if form_data.get('account_type_equity'):
-                account_type_filters.append('equity')
-            if form_data.get('account_type_income'):
-                account_type_filters.append('income')
-            if form_data.get('account_type_expense'):
-                account_type_filters.append('expense')
-            if form_data.get('account_type_other'):
-                account_type_filters.append('off_balance')
-            
-            # Use helper method to get company accounts
-            accounts = self.env['multi.currency.general.ledger']._get_company_accounts(
-                company_id, account_type_filters if account_type_filters else None)
+        # Finalize the workbook
+        workbook.close()
         
-        # Get currencies
-        currency_ids = form_data.get('currency_ids', [])
-        currencies = self.env['res.currency'].browse(currency_ids) if currency_ids else self.env['res.currency'].search([])
+        # Get the Excel data
+        xlsx_data = output.getvalue()
         
-        # Get other parameters
-        date_from = form_data.get('date_from')
-        date_to = form_data.get('date_to')
-        target_move = form_data.get('target_move', 'posted')
-        display_account = form_data.get('display_account', 'movement')
-        show_init_balance = form_data.get('show_init_balance', True)
+        # Create attachment
+        attachment = self.env['ir.attachment'].create({
+            'name': self._get_xlsx_filename(),
+            'datas': base64.b64encode(xlsx_data),
+            'res_model': self._name,
+            'res_id': self.id,
+        })
         
-        # Process accounts and currencies to get data
-        # This should mirror the logic in the PDF report
-        results = {}
-        for account in accounts:
-            results[account.id] = {}
-            for currency in currencies:
-                # Get move lines for this account and currency
-                move_lines, init_balance = self._get_account_move_lines(
-                    account, currency, date_from, date_to, target_move, form_data.get('journal_ids', [])
-                )
-                
-                # Skip if no data based on display_account setting
-                if display_account == 'movement' and not move_lines:
-                    continue
-                if display_account == 'not_zero' and not move_lines and init_balance['balance'] == 0:
-                    continue
-                
-                # Store data
-                results[account.id][currency.id] = {
-                    'move_lines': move_lines,
-                    'init_balance': init_balance,
-                }
+        # Return action to download the file
+        return {
+            'type': 'ir.actions.act_url',
+            'url': '/web/content/%s?download=true' % attachment.id,
+            'target': 'self',
+        }
+    
+    def _export_xlsx_file(self):
+        """Write the report to a temporary file in constant memory mode.
+
+        Rows are written as they come off the ledger engine cursor, so memory
+        does not grow with the number of move lines. The file is unlinked
+        right away and only lives as long as the returned file object.
+
+        :return: (binary file object positioned at the start, filename)
+        """
+        xlsxwriter = self._import_xlsxwriter()
+        self.ensure_one()
+        engine = self.env['multi.currency.general.ledger.engine']
+        options = engine._prepare_options(self._prepare_report_data()['form'])
         
-        # Create in-memory Excel file
-        output = io.BytesIO()
-        workbook = xlsxwriter.Workbook(output)
+        fd, path = tempfile.mkstemp(prefix='mcgl_', suffix='.xlsx')
+        os.close(fd)
+        try:
+            workbook = xlsxwriter.Workbook(path, {'constant_memory': True})
+            self._write_xlsx_workbook(workbook, options)
+            workbook.close()
+            xlsx_file = open(path, 'rb')
+        finally:
+            os.unlink(path)
+        return xlsx_file, self._get_xlsx_filename()
+    
+    def _get_xlsx_streaming_threshold(self):
+        """Number of move lines above which the XLSX export is streamed"""
+        return int(self.env['ir.config_parameter'].sudo().get_param(
+            'digits_multi_currency_general_ledger.xlsx_streaming_threshold',
+            XLSX_STREAMING_THRESHOLD))
+    
+    def _get_xlsx_filename(self):
+        return f"Multi_Currency_General_Ledger_{self.date_from.strftime('%Y%m%d')}_to_{self.date_to.strftime('%Y%m%d')}.xlsx"
+    
+    def _import_xlsxwriter(self):
+        try:
+            import xlsxwriter
+        except ImportError:
+            raise UserError(_("The xlsxwriter library is not installed. Please install it using 'pip install xlsxwriter'."))
+        return xlsxwriter
+    
+    def _write_xlsx_workbook(self, workbook, options):
+        """Write the ledger sheet, rows are always written in increasing order"""
+        engine = self.env['multi.currency.general.ledger.engine']
         
         # Create formats
         formats = self._create_xlsx_formats(workbook)
@@ -229,301 +243,70 @@ class MultiCurrencyGeneralLedgerWizard(models.TransientModel):
         sheet.write(f'B{row}', 'Yes' if self.show_init_balance else 'No', formats['filter_text'])
         row += 2
         
-        # Process each account with data
-        for account in accounts:
-            account_id = account.id
-            if account_id not in results:
-                continue
-            
-            # Check if account has any data in any currency
-            account_has_data = False
-            account_total_balance = 0.0
-            
-            # First check if this account has any data worth showing based on display_account setting
-            for currency in currencies:
-                currency_id = currency.id
-                if currency_id not in results[account_id]:
-                    continue
-                
-                # Get data for this account and currency
-                account_data = results[account_id][currency_id]
-                move_lines = account_data.get('move_lines', [])
-                init_balance = account_data.get('init_balance', {'balance': 0.0})
-                
-                # Check if this currency has any data
-                if display_account == 'all':
-                    account_has_data = True
-                    break
-                elif display_account == 'movement' and move_lines:
-                    account_has_data = True
-                    break
-                elif display_account == 'not_zero' and (move_lines or init_balance['balance'] != 0):
-                    account_has_data = True
-                    break
-                
-                # Add to total balance (for not_zero check)
-                account_total_balance += init_balance['balance']
+        # Process each (account, currency) pair with data, in account order
+        current_account = None
+        for account, currency, init_balance, move_lines in engine._iter_ledger(options):
+            if account != current_account:
+                if current_account is not None:
+                    # Add a space between accounts
+                    row += 1
+                # Account header
+                sheet.merge_range(f'A{row}:J{row}', f"{account.code} - {account.name}", formats['account_header'])
+                row += 1
+                current_account = account
             
-            # Skip account completely if it has no data to show
-            if not account_has_data:
-                if display_account == 'not_zero' and account_total_balance == 0:
-                    continue
-                elif display_account == 'movement':
-                    continue
+            # Currency header
+            sheet.merge_range(f'A{row}:J{row}', f"Currency: {currency.name}", formats['currency_header'])
+            row += 1
             
-            # Account header
-            sheet.merge_range(f'A{row}:J{row}', f"{account.code} - {account.name}", formats['account_header'])
+            # Table Headers
+            headers = ['Date', 'Journal', 'Partner/Label', 'Reference', 'Debit', 'Credit', 'Balance', 'Amount in Currency']
+            for i, header in enumerate(headers):
+                sheet.write(row, i, header, formats['table_header'])
             row += 1
             
-            # Process each currency for this account
-            for currency in currencies:
-                currency_id = currency.id
-                if currency_id not in results[account_id]:
-                    continue
-                
-                # Currency header
-                sheet.merge_range(f'A{row}:J{row}', f"Currency: {currency.name}", formats['currency_header'])
-                row += 1
-                
-                # Table Headers
-                headers = ['Date', 'Journal', 'Partner/Label', 'Reference', 'Debit', 'Credit', 'Balance', 'Amount in Currency']
-                for i, header in enumerate(headers):
-                    sheet.write(row, i, header, formats['table_header'])
+            # Initial balance line if enabled
+            if self.show_init_balance:
+                sheet.write(row, 0, "Initial Balance", formats['init_balance'])
+                sheet.write(row, 4, init_balance.get('debit', 0.0), formats['number'])
+                sheet.write(row, 5, init_balance.get('credit', 0.0), formats['number'])
+                sheet.write(row, 6, init_balance.get('balance', 0.0), formats['number'])
+                sheet.write(row, 7, init_balance.get('amount_currency', 0.0), formats['number'])
                 row += 1
+            
+            # Process move lines
+            running_balance = init_balance.get('balance', 0.0)
+            total_debit = init_balance.get('debit', 0.0)
+            total_credit = init_balance.get('credit', 0.0)
+            total_amount_currency = init_balance.get('amount_currency', 0.0)
+            for line in move_lines:
+                sheet.write(row, 0, line['date'], formats['date'])
+                sheet.write(row, 1, line['journal'] or '', formats['text'])
+                sheet.write(row, 2, line['partner_name'] or line['name'], formats['text'])
+                sheet.write(row, 3, line['ref'], formats['text'])
                 
-                # Get data for this account and currency
-                account_data = results[account_id][currency_id]
-                init_balance = account_data.get('init_balance', {'debit': 0, 'credit': 0, 'balance': 0, 'amount_currency': 0})
-                move_lines = account_data.get('move_lines', [])
+                debit = line['debit']
+                credit = line['credit']
                 
-                # Initial balance line if enabled
-                if self.show_init_balance:
-                    sheet.write(row, 0, "Initial Balance", formats['init_balance'])
-                    sheet.write(row, 4, init_balance.get('debit', 0.0), formats['number'])
-                    sheet.write(row, 5, init_balance.get('credit', 0.0), formats['number'])
-                    sheet.write(row, 6, init_balance.get('balance', 0.0), formats['number'])
-                    sheet.write(row, 7, init_balance.get('amount_currency', 0.0), formats['number'])
-                    row += 1
+                sheet.write(row, 4, debit, formats['number'])
+                sheet.write(row, 5, credit, formats['number'])
                 
-                # Process move lines
-                running_balance = init_balance.get('balance', 0.0)
-                for line in move_lines:
-                    sheet.write(row, 0, line.get('date', ''), formats['date'])
-                    sheet.write(row, 1, line.get('journal', ''), formats['text'])
-                    sheet.write(row, 2, line.get('partner_name', line.get('name', '')), formats['text'])
-                    sheet.write(row, 3, line.get('ref', ''), formats['text'])
-                    
-                    debit = line.get('debit', 0.0)
-                    credit = line.get('credit', 0.0)
-                    
-                    sheet.write(row, 4, debit, formats['number'])
-                    sheet.write(row, 5, credit, formats['number'])
-                    
-                    running_balance += debit - credit
-                    sheet.write(row, 6, running_balance, formats['number'])
-                    sheet.write(row, 7, line.get('amount_currency', 0.0), formats['number'])
-                    
-                    row += 1
+                running_balance += debit - credit
+                total_debit += debit
+                total_credit += credit
+                total_amount_currency += line['amount_currency']
+                sheet.write(row, 6, running_balance, formats['number'])
+                sheet.write(row, 7, line['amount_currency'], formats['number'])
                 
-                # Currency total
-                total_debit = init_balance.get('debit', 0.0) + sum(line.get('debit', 0.0) for line in move_lines)
-                total_credit = init_balance.get('credit', 0.0) + sum(line.get('credit', 0.0) for line in move_lines)
-                total_balance = total_debit - total_credit
-                total_amount_currency = init_balance.get('amount_currency', 0.0) + sum(line.get('amount_currency', 0.0) for line in move_lines)
-                
-                sheet.write(row, 2, 'Total', formats['total_label'])
-                sheet.write(row, 4, total_debit, formats['total_number'])
-                sheet.write(row, 5, total_credit, formats['total_number'])
-                sheet.write(row, 6, total_balance, formats['total_number'])
-                sheet.write(row, 7, total_amount_currency, formats['total_number'])
-                row += 2
-            
-            # Add a space between accounts
-            row += 1
-        
-        # Finalize the workbook
-        workbook.close()
-        
-        # Get the Excel data
-        xlsx_data = output.getvalue()
-        
-        # Create attachment
-        filename = f"Multi_Currency_General_Ledger_{self.date_from.strftime('%Y%m%d')}_to_{self.date_to.strftime('%Y%m%d')}.xlsx"
-        attachment = self.env['ir.attachment'].create({
-            'name': filename,
-            'datas': base64.b64encode(xlsx_data),
-            'res_model': self._name,
-            'res_id': self.id,
-        })
-        
-        # Return action to download the file
-        return {
-            'type': 'ir.actions.act_url',
-            'url': '/web/content/%s?download=true' % attachment.id,
-            'target': 'self',
-        }
-    
-    def _get_account_move_lines(self, account, currency, date_from, date_to, target_move, journal_ids=None):
-        """Get move lines for an account and currency"""
-        company_id = self.company_id.id
-        company = self.env['res.company'].browse(company_id)
-        company_currency = company.currency_id
-        
-        # Build domain for move lines search
-        domain = [
-            ('account_id', '=', account.id),
-            ('move_id.company_id', '=', company_id),
-        ]
-        
-        # Add journal filter if specified
-        if journal_ids:
-            domain.append(('journal_id', 'in', journal_ids))
-        
-        # Add date filters for period lines
-        # Date filter for initial balance is handled separately
-        if date_from:
-            domain.append(('date', '>=', date_from))
-        if date_to:
-            domain.append(('date', '<=', date_to))
-            
-        # Add target move filter
-        if target_move == 'posted':
-            domain.append(('parent_state', '=', 'posted'))
-        
-        # CRITICAL: The approach to currency filtering needs to be different
-        # For company currency (base currency), remove currency filter OR check if it's NULL/company currency
-        # For foreign currencies, only get lines with that specific currency
-        if currency.id == company_currency.id:
-            # For company currency, use a special filter that gets lines
-            # with NO currency OR with company currency
-            domain.extend(['|', ('currency_id', '=', False), ('currency_id', '=', company_currency.id)])
-        else:
-            # For foreign currency, only lines with this specific currency
-            domain.append(('currency_id', '=', currency.id))
-        
-        _logger.info("Move lines search domain: %s", domain)
-        
-        try:
-            # Get period move lines
-            move_lines = self.env['account.move.line'].search(domain, order='date, move_id, id')
-            
-            # Process period move lines
-            result = []
-            for line in move_lines:
-                # Determine debit/credit/balance based on currency
-                if currency.id == company_currency.id:
-                    # For company currency
-                    debit = line.debit
-                    credit = line.credit
-                    balance = line.balance
-                else:
-                    # For foreign currency, use amount_currency with appropriate sign
-                    amount_currency = line.amount_currency or 0.0
-                    debit = abs(amount_currency) if amount_currency > 0 else 0.0
-                    credit = abs(amount_currency) if amount_currency < 0 else 0.0
-                    balance = amount_currency
-                
-                # Add line data
-                result.append({
-                    'id': line.id,
-                    'date': line.date,
-                    'move_id': line.move_id.id,
-                    'move_name': line.move_id.name,
-                    'journal_id': line.journal_id.id,
-                    'journal': line.journal_id.code,
-                    'journal_name': line.journal_id.name,
-                    'ref': line.move_id.ref or '',
-                    'name': line.name or '',
-                    'partner_id': line.partner_id.id if line.partner_id else False,
-                    'partner_name': line.partner_id.name if line.partner_id else '',
-                    'debit': debit,
-                    'credit': credit,
-                    'balance': balance,
-                    'amount_currency': balance,  # Using the computed balance as amount_currency
-                })
-            
-            # Get initial balance using same method as PDF report
-            init_balance = self._get_initial_balance(account, currency, journal_ids, date_from, target_move, company_id)
-            
-            return result, init_balance
-            
-        except Exception as e:
-            _logger.error("Error retrieving move lines: %s", e)
-            return [], {'debit': 0.0, 'credit': 0.0, 'balance': 0.0, 'amount_currency': 0.0}
-            
-    def _get_initial_balance(self, account, currency, journal_ids, date_from, target_move, company_id):
-        """Calculate initial balance for an account in a specific currency - same method as PDF report"""
-        company = self.env['res.company'].browse(company_id)
-        company_currency = company.currency_id
-        
-        try:
-            # For company currency use balance field
-            # For foreign currency use amount_currency field with currency filter
-            if currency.id == company_currency.id:
-                query = """
-                    SELECT 
-                        COALESCE(SUM(aml.debit), 0) as debit,
-                        COALESCE(SUM(aml.credit), 0) as credit,
-                        COALESCE(SUM(aml.balance), 0) as balance,
-                        COALESCE(SUM(aml.balance), 0) as amount_currency
-                    FROM account_move_line aml
-                    JOIN account_move am ON aml.move_id = am.id
-                    WHERE aml.account_id = %s
-                    AND am.company_id = %s
-                    AND aml.date < %s
-                """
-                params = [
-                    account.id,
-                    company_id,
-                    date_from,
-                ]
-            else:
-                # For foreign currency, we need to filter by currency_id and use amount_currency
-                query = """
-                    SELECT 
-                        COALESCE(SUM(CASE WHEN aml.amount_currency > 0 THEN ABS(aml.amount_currency) ELSE 0 END), 0) as debit,
-                        COALESCE(SUM(CASE WHEN aml.amount_currency < 0 THEN ABS(aml.amount_currency) ELSE 0 END), 0) as credit,
-                        COALESCE(SUM(aml.amount_currency), 0) as balance,
-                        COALESCE(SUM(aml.amount_currency), 0) as amount_currency
-                    FROM account_move_line aml
-                    JOIN account_move am ON aml.move_id = am.id
-                    WHERE aml.account_id = %s
-                    AND aml.currency_id = %s
-                    AND am.company_id = %s
-                    AND aml.date < %s
-                """
-                params = [
-                    account.id,
-                    currency.id,
-                    company_id,
-                    date_from,
-                ]
-            
-            # Add journal filter if specified
-            if journal_ids:
-                query += " AND aml.journal_id IN %s"
-                params.append(tuple(journal_ids))
-            
-            # Add target move filter
-            if target_move == 'posted':
-                query += " AND aml.parent_state = 'posted'"
-            
-            _logger.info("Initial balance query: %s, params: %s", query, params)
+                row += 1
             
-            self.env.cr.execute(query, params)
-            result = self.env.cr.dictfetchone()
-            if result:
-                return {
-                    'debit': result['debit'],
-                    'credit': result['credit'],
-                    'balance': result['balance'],
-                    'amount_currency': result['amount_currency']
-                }
-            else:
-                return {'debit': 0.0, 'credit': 0.0, 'balance': 0.0, 'amount_currency': 0.0}
-        except Exception as e:
-            _logger.error("Error calculating initial balance: %s", e)
-            return {'debit': 0.0, 'credit': 0.0, 'balance': 0.0, 'amount_currency': 0.0}
+            # Currency total
+            sheet.write(row, 2, 'Total', formats['total_label'])
+            sheet.write(row, 4, total_debit, formats['total_number'])
+            sheet.write(row, 5, total_credit, formats['total_number'])
+            sheet.write(row, 6, total_debit - total_credit, formats['total_number'])
+            sheet.write(row, 7, total_amount_currency, formats['total_number'])
+            row += 2
     
     def _create_xlsx_formats(self, workbook):
         """Create formats for the Excel report"""
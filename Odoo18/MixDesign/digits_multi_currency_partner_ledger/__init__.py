@@ -7,6 +7,7 @@
 #
 ###############################################################################
 
+from . import controllers
 from . import models
 from . import wizard
 from . import report
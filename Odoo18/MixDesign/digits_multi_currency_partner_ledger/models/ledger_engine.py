@@ -0,0 +1,372 @@
+# -*- coding: utf-8 -*-
+###############################################################################
+#
+#    Digital Integrated Transformation Solutions (DigitsCode)
+#    Copyright (C) 2025-TODAY Digital Integrated Transformation Solutions (<https://www.digitscode.com>).
+#    Author: Digital Integrated Transformation Solutions (<https://www.digitscode.com>)
+#
+###############################################################################
+
+from odoo import api, models, _
+from datetime import datetime
+from itertools import groupby
+import logging
+
+_logger = logging.getLogger(__name__)
+
+# Number of rows fetched per round trip from the server-side cursor
+LEDGER_CURSOR_ITERSIZE = 2000
+
+ACCOUNT_TYPE_FILTERS = {
+    'account_type_receivable': 'asset_receivable',
+    'account_type_non_trade_receivable': 'asset_receivable_non_trade',
+    'account_type_payable': 'liability_payable',
+    'account_type_non_trade_payable': 'liability_payable_non_trade',
+}
+
+
+class MultiCurrencyPartnerLedgerEngine(models.AbstractModel):
+    _name = 'multi.currency.partner.ledger.engine'
+    _description = 'Multi Currency Partner Ledger Engine'
+
+    # ------------------------------------------------------------------
+    # Options
+    # ------------------------------------------------------------------
+
+    @api.model
+    def _prepare_options(self, form):
+        """Normalize the wizard form into the options used by the engine"""
+        company_id = form.get('company_id') or self.env.company.id
+
+        account_types = [account_type for key, account_type in ACCOUNT_TYPE_FILTERS.items() if form.get(key)]
+        if not account_types:
+            account_types = ['asset_receivable', 'liability_payable']
+        accounts = self.env['account.account'].search([
+            ('account_type', 'in', account_types),
+            ('company_ids', 'in', company_id),
+        ])
+
+        if form.get('currency_ids'):
+            currencies = self.env['res.currency'].browse(form['currency_ids'])
+        else:
+            currencies = self.env['res.currency'].search([])
+
+        return {
+            'company': self.env['res.company'].browse(company_id),
+            'accounts': accounts,
+            'account_types': account_types,
+            'currencies': currencies,
+            'partner_ids': form.get('partner_ids') or [],
+            'partner_tag_ids': form.get('partner_tags') or [],
+            'date_from': self._to_date(form.get('date_from')),
+            'date_to': self._to_date(form.get('date_to')),
+            'target_move': form.get('target_move', 'posted'),
+            'display_account': form.get('display_account', 'movement'),
+            'show_init_balance': form.get('show_init_balance', True),
+        }
+
+    @api.model
+    def _to_date(self, value):
+        """Convert a string date coming from a serialized report action"""
+        if isinstance(value, str):
+            try:
+                return datetime.strptime(value, '%Y-%m-%d').date()
+            except ValueError as e:
+                _logger.error("Error converting date %s: %s", value, e)
+                return False
+        return value
+
+    # ------------------------------------------------------------------
+    # SQL
+    # ------------------------------------------------------------------
+
+    @api.model
+    def _get_partner_conditions(self, alias, options, params):
+        """Return the partner and partner tag conditions on ``alias``"""
+        conditions = ["{0}.partner_id IS NOT NULL".format(alias)]
+        if options['partner_ids']:
+            conditions.append("{0}.partner_id = ANY(%(partner_ids)s)".format(alias))
+            params['partner_ids'] = list(options['partner_ids'])
+        if options['partner_tag_ids']:
+            conditions.append("""
+                EXISTS (
+                    SELECT 1 FROM res_partner_res_partner_category_rel tag_rel
+                    WHERE tag_rel.partner_id = {0}.partner_id
+                    AND tag_rel.category_id = ANY(%(partner_tag_ids)s)
+                )
+            """.format(alias))
+            params['partner_tag_ids'] = list(options['partner_tag_ids'])
+        return conditions
+
+    @api.model
+    def _get_where_clause(self, options):
+        """Return the WHERE clause and params shared by every ledger query"""
+        params = {
+            'company_id': options['company'].id,
+            'account_ids': options['accounts'].ids,
+            'currency_ids': options['currencies'].ids,
+        }
+        where = [
+            "aml.company_id = %(company_id)s",
+            "aml.account_id = ANY(%(account_ids)s)",
+            "aml.currency_id = ANY(%(currency_ids)s)",
+        ] + self._get_partner_conditions('aml', options, params)
+        if options['target_move'] == 'posted':
+            where.append("aml.parent_state = 'posted'")
+        if options['date_to']:
+            where.append("aml.date <= %(date_to)s")
+            params['date_to'] = options['date_to']
+        return where, params
+
+    @api.model
+    def _get_period_where_clause(self, options):
+        where, params = self._get_where_clause(options)
+        if options['date_from']:
+            where.append("aml.date >= %(date_from)s")
+            params['date_from'] = options['date_from']
+        return where, params
+
+    @api.model
+    def _get_opening_balances(self, options):
+        """Return the opening balance of every (partner, currency) pair in one grouped query.
+
+        Posted-only ledgers read the monthly balance snapshots when they are
+        available, so only the lines of the first month of the period are
+        scanned on top of one snapshot row per key.
+
+        :return: dict {(partner_id, currency_id): balance}
+        """
+        if (not options['show_init_balance'] or not options['date_from']
+                or not options['accounts'] or not options['currencies']):
+            return {}
+        snapshot = self.env['digits.ledger.balance.snapshot']
+        if options['target_move'] == 'posted' and snapshot._is_available(options['company']):
+            params = {
+                'account_ids': options['accounts'].ids,
+                'currency_ids': options['currencies'].ids,
+            }
+            conditions = [
+                "src.account_id = ANY(%(account_ids)s)",
+                "src.currency_id = ANY(%(currency_ids)s)",
+            ] + self._get_partner_conditions('src', options, params)
+            opening_query, opening_params = snapshot._get_opening_query(
+                options['company'], options['date_from'], where=conditions)
+            params.update(opening_params)
+            query = """
+                SELECT opening.partner_id, opening.currency_id, SUM(opening.amount_currency)
+                FROM ({opening_query}) opening
+                GROUP BY opening.partner_id, opening.currency_id
+            """.format(opening_query=opening_query)
+        else:
+            where, params = self._get_where_clause(options)
+            where.append("aml.date < %(date_from)s")
+            params['date_from'] = options['date_from']
+            query = """
+                SELECT aml.partner_id, aml.currency_id, SUM(aml.amount_currency)
+                FROM account_move_line aml
+                WHERE {where}
+                GROUP BY aml.partner_id, aml.currency_id
+            """.format(where=" AND ".join(where))
+        self.env.cr.execute(query, params)
+        return {
+            (partner_id, currency_id): balance
+            for partner_id, currency_id, balance in self.env.cr.fetchall()
+        }
+
+    @api.model
+    def _get_opening_params(self, opening):
+        """Pass the opening balances to SQL as parallel arrays"""
+        keys = list(opening)
+        return {
+            'opening_partner_ids': [partner_id for partner_id, currency_id in keys],
+            'opening_currency_ids': [currency_id for partner_id, currency_id in keys],
+            'opening_balances': [opening[key] for key in keys],
+        }
+
+    @api.model
+    def _get_pairs(self, options, opening):
+        """Return the (partner, currency) pairs having activity.
+
+        A single grouped query discovers the pairs with period lines and
+        merges them with the pairs having an opening balance, so currencies a
+        partner never used cost nothing.
+
+        :return: list of (partner_id, currency_id) in report order and
+                 dict {(partner_id, currency_id): {'init_balance', 'line_count'}}
+        """
+        if not options['accounts'] or not options['currencies']:
+            return [], {}
+        where, params = self._get_period_where_clause(options)
+        params.update(self._get_opening_params(opening))
+        query = """
+            SELECT pair.partner_id, pair.currency_id, SUM(pair.line_count)
+            FROM (
+                SELECT aml.partner_id, aml.currency_id, COUNT(*) AS line_count
+                FROM account_move_line aml
+                WHERE {where}
+                GROUP BY aml.partner_id, aml.currency_id
+                UNION ALL
+                SELECT opening.partner_id, opening.currency_id, 0
+                FROM unnest(%(opening_partner_ids)s::int[], %(opening_currency_ids)s::int[])
+                    AS opening(partner_id, currency_id)
+            ) pair
+            JOIN res_partner rp ON rp.id = pair.partner_id
+            GROUP BY pair.partner_id, pair.currency_id, rp.complete_name
+            ORDER BY rp.complete_name, pair.partner_id,
+                     array_position(%(currency_ids)s, pair.currency_id)
+        """.format(where=" AND ".join(where))
+        self.env.cr.execute(query, params)
+        keys = []
+        values = {}
+        for partner_id, currency_id, line_count in self.env.cr.fetchall():
+            keys.append((partner_id, currency_id))
+            values[(partner_id, currency_id)] = {
+                'init_balance': opening.get((partner_id, currency_id), 0.0),
+                'line_count': line_count,
+            }
+        return keys, values
+
+    @api.model
+    def _iter_period_lines(self, options, opening):
+        """Stream the period lines of every pair with their running balance.
+
+        The running balance is computed by a window function over each
+        (partner, currency) partition, starting from the opening balance.
+        Lines are read through a server-side cursor.
+        """
+        if not options['accounts'] or not options['currencies']:
+            return
+        where, params = self._get_period_where_clause(options)
+        params.update(self._get_opening_params(opening))
+        params['lang'] = self.env.lang or 'en_US'
+        params['company_key'] = str(options['company'].id)
+        query = """
+            SELECT aml.id,
+                   aml.partner_id,
+                   aml.currency_id,
+                   aml.date,
+                   aml.move_id,
+                   am.name AS move_name,
+                   am.move_type,
+                   COALESCE(am.ref, '') AS ref,
+                   COALESCE(aml.name, '') AS name,
+                   aml.account_id,
+                   acc.code_store->>%(company_key)s AS account_code,
+                   COALESCE(acc.name->>%(lang)s, acc.name->>'en_US') AS account_name,
+                   aj.code AS journal_code,
+                   COALESCE(aj.name->>%(lang)s, aj.name->>'en_US') AS journal_name,
+                   GREATEST(aml.amount_currency, 0) AS debit,
+                   GREATEST(-aml.amount_currency, 0) AS credit,
+                   aml.amount_currency AS balance,
+                   COALESCE(opening.balance, 0) + SUM(aml.amount_currency) OVER (
+                       PARTITION BY aml.partner_id, aml.currency_id
+                       ORDER BY aml.date, aml.move_id, aml.id
+                       ROWS BETWEEN UNBOUNDED PRECEDING AND CURRENT ROW
+                   ) AS running_balance
+            FROM account_move_line aml
+            JOIN account_move am ON am.id = aml.move_id
+            JOIN account_journal aj ON aj.id = aml.journal_id
+            JOIN account_account acc ON acc.id = aml.account_id
+            JOIN res_partner rp ON rp.id = aml.partner_id
+            LEFT JOIN unnest(
+                %(opening_partner_ids)s::int[], %(opening_currency_ids)s::int[], %(opening_balances)s::numeric[]
+            ) AS opening(partner_id, currency_id, balance)
+                ON opening.partner_id = aml.partner_id AND opening.currency_id = aml.currency_id
+            WHERE {where}
+            ORDER BY rp.complete_name, aml.partner_id,
+                     array_position(%(currency_ids)s, aml.currency_id),
+                     aml.date, aml.move_id, aml.id
+        """.format(where=" AND ".join(where))
+
+        # Named cursors run inside the current transaction, make sure pending
+        # ORM writes are visible to them.
+        self.env['account.move.line'].flush_model()
+        self.env['account.move'].flush_model(['name', 'ref', 'move_type'])
+        cursor = self.env.cr._cnx.cursor('mcpl_period_lines_%s' % id(options))
+        cursor.itersize = LEDGER_CURSOR_ITERSIZE
+        try:
+            cursor.execute(query, params)
+            columns = None
+            for row in cursor:
+                if columns is None:
+                    columns = [desc[0] for desc in cursor.description]
+                line = dict(zip(columns, row))
+                line['name'] = self._get_line_description(line)
+                yield line
+        finally:
+            cursor.close()
+
+    @api.model
+    def _get_line_description(self, line):
+        """Append the customer/vendor reference of invoices to the line label"""
+        description = line['name']
+        reference = line['ref']
+        if not reference or reference == line['move_name']:
+            return description
+        if line['move_type'] in ('in_invoice', 'in_refund'):
+            label = _('Vendor Ref')
+        elif line['move_type'] in ('out_invoice', 'out_refund'):
+            label = _('Customer Ref')
+        else:
+            return description
+        if description:
+            return f"{description} - {label}: {reference}"
+        return f"{label}: {reference}"
+
+    @api.model
+    def _get_ordered_partner_ids(self, partner_ids):
+        """Return partner ids sorted like the ledger queries"""
+        if not partner_ids:
+            return []
+        self.env['res.partner'].flush_model(['complete_name'])
+        self.env.cr.execute("""
+            SELECT id FROM res_partner WHERE id = ANY(%s) ORDER BY complete_name, id
+        """, [list(partner_ids)])
+        return [row[0] for row in self.env.cr.fetchall()]
+
+    # ------------------------------------------------------------------
+    # Grouping
+    # ------------------------------------------------------------------
+
+    @api.model
+    def _iter_ledger(self, options):
+        """Yield (partner, currency, init_balance, lines) for every pair to display.
+
+        ``lines`` is an iterator over the streamed period lines of the pair
+        and must be consumed before moving to the next pair. Each line carries
+        its ``running_balance``.
+        """
+        opening = self._get_opening_balances(options)
+        pair_keys, pair_values = self._get_pairs(options, opening)
+        if options['display_account'] == 'all':
+            partner_ids = options['partner_ids'] or {partner_id for partner_id, currency_id in pair_keys}
+            pair_keys = [
+                (partner_id, currency_id)
+                for partner_id in self._get_ordered_partner_ids(partner_ids)
+                for currency_id in options['currencies'].ids
+            ]
+        else:
+            pair_keys = [
+                key for key in pair_keys
+                if pair_values[key]['line_count'] or pair_values[key]['init_balance']
+            ]
+        partners = self.env['res.partner'].browse({partner_id for partner_id, currency_id in pair_keys})
+        partners = {partner.id: partner for partner in partners}
+        currencies = {currency.id: currency for currency in options['currencies']}
+        pair_index = 0
+
+        def flush_until(key):
+            """Emit the pairs without period lines sorted before ``key``"""
+            nonlocal pair_index
+            while pair_index < len(pair_keys) and pair_keys[pair_index] != key:
+                pending = pair_keys[pair_index]
+                pair_index += 1
+                init_balance = pair_values.get(pending, {}).get('init_balance', 0.0)
+                yield partners[pending[0]], currencies[pending[1]], init_balance, iter(())
+
+        for key, lines in groupby(self._iter_period_lines(options, opening),
+                                  key=lambda line: (line['partner_id'], line['currency_id'])):
+            yield from flush_until(key)
+            pair_index += 1
+            yield partners[key[0]], currencies[key[1]], pair_values[key]['init_balance'], lines
+        yield from flush_until(None)
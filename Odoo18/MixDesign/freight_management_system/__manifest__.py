@@ -21,7 +21,7 @@
 ################################################################################
 {
     'name': 'Freight Management',
-    'version': '18.0.1.0.1',
+    'version': '18.0.1.2.0',
     'category': 'Industries',
     'summary': 'Module for Managing All Freight Operations',
     'description': 'From efficient order creation and dynamic shipment planning'
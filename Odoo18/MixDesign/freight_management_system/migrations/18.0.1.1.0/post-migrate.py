@@ -0,0 +1,24 @@
+# -*- coding: utf-8 -*-
+
+
+def migrate(cr, version):
+    """Link the invoices generated before freight_order_id existed to their
+    freight order, from the reference they were created with"""
+    for suffix, invoice_type in ((' - 1/1000 Tax', 'one_thousand'), (' - 2/100 Tax', 'gafi')):
+        cr.execute("""
+            UPDATE account_move m
+               SET freight_order_id = f.id,
+                   freight_invoice_type = %s
+              FROM freight_order f
+             WHERE m.freight_order_id IS NULL
+               AND m.ref = f.name || %s
+        """, [invoice_type, suffix])
+    cr.execute("""
+        UPDATE account_move m
+           SET freight_order_id = f.id,
+               freight_invoice_type = CASE WHEN m.move_type = 'in_invoice' THEN 'bill' ELSE 'freight' END
+          FROM freight_order f
+         WHERE m.freight_order_id IS NULL
+           AND m.ref = f.name
+           AND m.invoice_origin = f.name
+    """)
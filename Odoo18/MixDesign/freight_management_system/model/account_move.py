@@ -12,3 +12,9 @@ class AccountMove(models.Model):
         domain="[('account_type', 'in', ['asset_cash'])]",
         help="Select the bank or cash account for this invoice"
     )
+    freight_order_id = fields.Many2one('freight.order', string='Freight Order', copy=False, index='btree_not_null',
+                                       help='Freight order this invoice was generated from')
+    freight_invoice_type = fields.Selection([('freight', 'Freight'),
+                                             ('bill', 'Vendor Bill'),
+                                             ('one_thousand', '1/1000 Tax'),
+                                             ('gafi', '2/100 Tax')], string='Freight Invoice Type', copy=False)
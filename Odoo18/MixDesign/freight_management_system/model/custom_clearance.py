@@ -21,8 +21,9 @@
 ################################################################################
 from werkzeug import urls
 from odoo import api, fields, models, _
+from odoo.tools import SQL
 from datetime import date, datetime, timedelta
-from odoo.exceptions import ValidationError
+from odoo.exceptions import UserError, ValidationError
 import logging
 
 _logger = logging.getLogger(__name__)
@@ -94,8 +95,10 @@ class CustomClearance(models.Model):
     final_declaration = fields.Char('Final Declaration', store=True, readonly=False)
     gafi_received_date = fields.Date(string="Form 46 Date", readonly=True,
                                      help="Date when received GAFI state was set")
+    gafi_deadline = fields.Date(string="Form 46 Deadline", compute="_compute_gafi_deadline", store=True,
+                                index=True, help="Export declaration date + 90 days")
     gafi_remaining_days = fields.Integer(string="Days Remaining", compute="_compute_gafi_remaining_days",
-                                         store=True)
+                                         search="_search_gafi_remaining_days")
     one_thousand = fields.Float(string="1/1000", compute="_compute_one_thousand", required=False)
     one_thousand_bank = fields.Many2one('managing.bank', string="1/1000 Bank",
                                         help="Select the bank for tracking 1/1000 tax")
@@ -127,33 +130,48 @@ class CustomClearance(models.Model):
             else:
                 rec.clearance_days = "0 Days"
 
-    @api.depends('export_declaration_date', 'gafi_received_date', 'state', 'last_computed_date')
+    @api.depends('export_declaration_date')
+    def _compute_gafi_deadline(self):
+        for rec in self:
+            rec.gafi_deadline = rec.export_declaration_date and rec.export_declaration_date + timedelta(days=90)
+
+    @api.depends('gafi_deadline', 'gafi_received_date')
     def _compute_gafi_remaining_days(self):
+        today = fields.Date.today()
         for rec in self:
             rec.gafi_remaining_days = 0
-            if rec.export_declaration_date:
-                start_date = rec.export_declaration_date
-                deadline = start_date + timedelta(days=90)
-                end_date = rec.gafi_received_date or fields.Date.today()
-                delta = (deadline - end_date).days
-                rec.gafi_remaining_days = max(delta, 0)
+            if rec.gafi_deadline:
+                end_date = rec.gafi_received_date or today
+                rec.gafi_remaining_days = max((rec.gafi_deadline - end_date).days, 0)
+
+    def _gafi_remaining_days_sql(self, alias):
+        """SQL expression of gafi_remaining_days for the table ``alias``"""
+        return SQL(
+            "GREATEST(COALESCE(%s - COALESCE(%s, %s::date), 0), 0)",
+            SQL.identifier(alias, 'gafi_deadline'),
+            SQL.identifier(alias, 'gafi_received_date'),
+            fields.Date.today(),
+        )
+
+    def _search_gafi_remaining_days(self, operator, value):
+        if operator not in ('=', '!=', '<', '<=', '>', '>='):
+            raise UserError(_("Unsupported operator %s for the Form 46 remaining days", operator))
+        query = self.with_context(active_test=False)._search([])
+        query.add_where(SQL(
+            "%s %s %s", self._gafi_remaining_days_sql(query.table), SQL(operator), int(value or 0),
+        ))
+        return [('id', 'in', query)]
+
+    def _order_field_to_sql(self, alias, field_name, direction, nulls, query):
+        if field_name == 'gafi_remaining_days':
+            return SQL("%s %s %s", self._gafi_remaining_days_sql(alias), direction, nulls)
+        return super()._order_field_to_sql(alias, field_name, direction, nulls, query)
 
     @api.model
     def update_gafi_remaining_days_computation(self):
-        """Cron job method to trigger recomputation of GAFI remaining days"""
-        today = fields.Date.today()
-        # Find all active custom clearance records that need updating
-        clearances = self.search([
-            ('export_declaration_date', '!=', False),
-            ('gafi_received_date', '=', False),  # Only for records without gafi_received_date
-            ('last_computed_date', '!=', today)
-        ])
-
-        if clearances:
-            # Update the trigger field to force recomputation
-            clearances.write({'last_computed_date': today})
-            _logger.info(
-                f"Updated {len(clearances)} custom clearance records for daily GAFI remaining days computation")
+        """Kept for the scheduled action: the remaining days are computed at
+        read time from the stored deadline, there is nothing to update"""
+        return True
 
     @api.depends('freight_id')
     def _compute_name(self):
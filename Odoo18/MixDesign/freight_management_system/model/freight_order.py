@@ -22,12 +22,26 @@
 from werkzeug import urls
 from odoo import api, fields, models, _
 from odoo.exceptions import ValidationError
+from collections import defaultdict
 from datetime import timedelta
 from odoo.exceptions import UserError
+from odoo.osv import expression
+from odoo.tools import SQL
 import logging
+import operator as py_operator
 
 _logger = logging.getLogger(__name__)
 
+# Operators supported by the search on the remaining free days
+REMAINING_DAYS_OPERATORS = {
+    '=': py_operator.eq,
+    '!=': py_operator.ne,
+    '<': py_operator.lt,
+    '<=': py_operator.le,
+    '>': py_operator.gt,
+    '>=': py_operator.ge,
+}
+
 
 class FreightOrder(models.Model):
     """Model for creating freight orders"""
@@ -58,8 +72,8 @@ class FreightOrder(models.Model):
                              ],
                             string='Import/Export', tracking=True, required=True,
                             help="Type of freight operation")
-    sale_order_names = fields.Char(string="Sale Order", compute="_compute_sale_order_names", store=False)
-    purchase_order_names = fields.Char(string="Purchase Order", compute="_compute_purchase_order_names", store=False)
+    sale_order_names = fields.Char(string="Sale Order", compute="_compute_sale_orders", store=False)
+    purchase_order_names = fields.Char(string="Purchase Order", compute="_compute_purchase_orders", store=False)
     import_type = fields.Selection(string="Import Type",
                                    selection=[('import_egypt_free_zone', 'Import Egypt Free Zone'),
                                               ('import_offshore', 'Import OffShore'), ], tracking=True, required=False)
@@ -164,9 +178,9 @@ class FreightOrder(models.Model):
     project_count = fields.Integer(string='Projects', compute='_compute_project_count')
     show_project_button = fields.Boolean(compute='_compute_project_button')
     purchase_order_id = fields.Many2one('purchase.order', string='Purchase Order', help='Related Purchase Order')
-    purchase_count = fields.Integer(compute='_compute_purchase_count', string="Purchase Orders")
+    purchase_count = fields.Integer(compute='_compute_purchase_orders', string="Purchase Orders")
     sale_order_id = fields.Many2one('sale.order', string='Sale Order', help='Related Sales Order')
-    sales_count = fields.Integer(compute='_compute_sales_count', string="Sale Orders")
+    sales_count = fields.Integer(compute='_compute_sale_orders', string="Sale Orders")
     acid_number = fields.Char(string="ACID Number", tracking=True, required=False)
     bill_of_lading = fields.Char(string="Bill Of Lading", tracking=True, required=False)
     # file_upload = fields.Binary(string="File Upload", required=False)
@@ -178,8 +192,12 @@ class FreightOrder(models.Model):
     receiving_date = fields.Date(string="ATA", tracking=True, required=False, help='The actual time of arrival')
     actual_transit_days = fields.Integer(string="ATT Days", compute='_compute_actual_transit_days',
                                          store=True, tracking=True, help='The actual transit days')
-    end_date = fields.Date(string="Free Days Remaining", compute="_compute_end_date", required=False)
+    end_date = fields.Date(string="Free Days Remaining", compute="_compute_end_date", store=True, index=True,
+                           required=False, help='Deadline of the free days: ATA + free days')
     end_date_date = fields.Char(string="Free Days End Date", compute="_compute_end_date_date", required=False)
+    remaining_days = fields.Integer(string="Remaining Free Days", compute="_compute_remaining_days",
+                                    search="_search_remaining_days",
+                                    help='Days left until the free days deadline, negative once it is passed')
     remaining_days_text = fields.Char(string="Days Remaining", compute="_compute_remaining_days_text", required=False)
     analytic_account_id = fields.Many2one('account.analytic.account', string="Analytic Account")
     # import_declaration = fields.Integer(string="Import Declaration", required=False, )
@@ -191,11 +209,11 @@ class FreightOrder(models.Model):
                                   help="This field is calculating 2/100 of total invoice for Gafi")
     gafi_invoice_count = fields.Integer(
         string="Gafi Invoice Count",
-        compute="_compute_gafi_invoice_count"
+        compute="_compute_tax_invoice_count"
     )
     one_thousand_invoice_count = fields.Integer(
         string="1/1000 Invoice Count",
-        compute="_compute_one_thousand_invoice_count"
+        compute="_compute_tax_invoice_count"
     )
     incoterm = fields.Many2one('account.incoterms', 'Incoterm',
                                help="International Commercial Terms are a series of predefined commercial terms used in international transactions.")
@@ -209,58 +227,95 @@ class FreightOrder(models.Model):
 
     @api.model
     def update_remaining_days_computation(self):
-        """Cron job method to trigger recomputation of remaining days"""
-        today = fields.Date.today()
-        # Find all active freight orders that need updating
-        orders = self.search([
-            ('receiving_date', '!=', False),
-            ('free_days', '>', 0),
-            ('last_computed_date', '!=', today)
-        ])
-
-        if orders:
-            # Update the trigger field to force recomputation
-            orders.write({'last_computed_date': today})
-            _logger.info(f"Updated {len(orders)} freight orders for daily remaining days computation")
-
-    @api.depends('name')
-    def _compute_one_thousand_invoice_count(self):
+        """Kept for the scheduled action: the remaining days are computed at
+        read time from the stored deadline, there is nothing to update"""
+        return True
+
+    def _search_remaining_days(self, operator, value):
+        """remaining_days <op> N is end_date <op> today + N, which uses the
+        index of end_date, e.g. [('remaining_days', '<=', 7)] gives the
+        orders whose free days end within a week. The orders without
+        deadline have 0 remaining days, as computed."""
+        if operator not in REMAINING_DAYS_OPERATORS:
+            raise UserError(_("Unsupported operator %s for the remaining free days", operator))
+        value = int(value or 0)
+        domain = [('end_date', '!=', False),
+                  ('end_date', operator, fields.Date.today() + timedelta(days=value))]
+        if REMAINING_DAYS_OPERATORS[operator](0, value):
+            domain = expression.OR([domain, [('end_date', '=', False)]])
+        return domain
+
+    def _order_field_to_sql(self, alias, field_name, direction, nulls, query):
+        # Sorting on the remaining days is sorting on the deadline, today
+        # for the orders without deadline
+        if field_name == 'remaining_days':
+            return SQL("COALESCE(%s, %s::date) %s %s", self._field_to_sql(alias, 'end_date', query),
+                       fields.Date.today(), direction, nulls)
+        return super()._order_field_to_sql(alias, field_name, direction, nulls, query)
+
+    def _compute_tax_invoice_count(self):
+        """Count the 1/1000 and 2/100 tax invoices with one grouped read"""
+        counts = {
+            (freight.id, invoice_type): count
+            for freight, invoice_type, count in self.env['account.move']._read_group(
+                [('freight_order_id', 'in', self.ids), ('freight_invoice_type', 'in', ('one_thousand', 'gafi'))],
+                ['freight_order_id', 'freight_invoice_type'], ['__count'])
+        }
         for rec in self:
-            rec.one_thousand_invoice_count = self.env['account.move'].search_count([
-                ('ref', '=', f"{rec.name} - 1/1000 Tax")
-            ])
+            rec.one_thousand_invoice_count = counts.get((rec.id, 'one_thousand'), 0)
+            rec.gafi_invoice_count = counts.get((rec.id, 'gafi'), 0)
+
+    def _get_tax_invoices(self, invoice_type):
+        return self.env['account.move'].search([
+            ('freight_order_id', '=', self.id), ('freight_invoice_type', '=', invoice_type)
+        ])
 
     def action_view_one_thousand_invoices(self):
         self.ensure_one()
-        invoices = self.env['account.move'].search([
-            ('ref', '=', f"{self.name} - 1/1000 Tax")
-        ])
+        invoices = self._get_tax_invoices('one_thousand')
         action = self.env.ref('account.action_move_out_invoice_type').read()[0]
         action['domain'] = [('id', 'in', invoices.ids)]
         action['context'] = {'create': False}
         return action
 
-    def _compute_sale_order_names(self):  # Add this method if you have a similar field for sales
+    def _get_related_orders(self, model):
+        """Return {freight order id: orders} of the orders of ``model`` linked to the
+        freight orders, either by their freight_order_id or by the direct reference of
+        the freight order, in one search"""
+        direct_field = 'sale_order_id' if model == 'sale.order' else 'purchase_order_id'
+        direct_ids = set(self.mapped(direct_field).ids)
+        orders = self.env[model].search_fetch([
+            '|',
+            ('freight_order_id', 'in', self.ids),
+            ('id', 'in', list(direct_ids))
+        ], ['name', 'freight_order_id'])
+        freights_by_direct = {}
+        for rec in self:
+            freights_by_direct.setdefault(rec[direct_field].id, []).append(rec.id)
+        orders_by_freight = {rec.id: self.env[model] for rec in self}
+        for order in orders:
+            freight_ids = set(freights_by_direct.get(order.id, []))
+            if order.freight_order_id.id in orders_by_freight:
+                freight_ids.add(order.freight_order_id.id)
+            for freight_id in freight_ids:
+                orders_by_freight[freight_id] |= order
+        return orders_by_freight
+
+    def _compute_sale_orders(self):
+        orders_by_freight = self._get_related_orders('sale.order')
         for rec in self:
-            orders = self.env['sale.order'].search([
-                '|',
-                ('freight_order_id', '=', rec.id),
-                ('id', '=', rec.sale_order_id.id if rec.sale_order_id else False)
-            ])
+            orders = orders_by_freight[rec.id]
+            rec.sales_count = len(orders)
             rec.sale_order_names = ', '.join(orders.mapped('name')) if orders else ''
 
-    def _compute_purchase_order_names(self):
+    def _compute_purchase_orders(self):
+        # Purchase orders related to the freight order in two ways:
+        # 1. Purchase orders that have this freight as their main freight_order_id
+        # 2. The purchase order referenced directly in this freight's purchase_order_id field
+        orders_by_freight = self._get_related_orders('purchase.order')
         for rec in self:
-            # Find purchase orders related to this freight order in two ways:
-            # 1. Purchase orders that have this freight as their main freight_order_id
-            # 2. The purchase order referenced directly in this freight's purchase_order_id field
-
-            orders = self.env['purchase.order'].search([
-                '|',
-                ('freight_order_id', '=', rec.id),  # Main freight reference
-                ('id', '=', rec.purchase_order_id.id if rec.purchase_order_id else False)  # Direct reference
-            ])
-
+            orders = orders_by_freight[rec.id]
+            rec.purchase_count = len(orders)
             rec.purchase_order_names = ', '.join(orders.mapped('name')) if orders else ''
 
     def action_create_one_thousand_tax_invoice(self):
@@ -282,6 +337,8 @@ class FreightOrder(models.Model):
             'invoice_origin': self.name,
             'ref': f"{self.name} - 1/1000 Tax",
             'invoice_line_ids': lines,
+            'freight_order_id': self.id,
+            'freight_invoice_type': 'one_thousand',
         }
 
         inv = self.env['account.move'].create(invoice_vals)
@@ -295,18 +352,9 @@ class FreightOrder(models.Model):
             'res_model': 'account.move',
         }
 
-    @api.depends('name')
-    def _compute_gafi_invoice_count(self):
-        for rec in self:
-            rec.gafi_invoice_count = self.env['account.move'].search_count([
-                ('ref', '=', f"{rec.name} - 2/100 Tax")
-            ])
-
     def action_view_gafi_invoices(self):
         self.ensure_one()
-        invoices = self.env['account.move'].search([
-            ('ref', '=', f"{self.name} - 2/100 Tax")
-        ])
+        invoices = self._get_tax_invoices('gafi')
         action = self.env.ref('account.action_move_out_invoice_type').read()[0]
         action['domain'] = [('id', 'in', invoices.ids)]
         action['context'] = {'create': False}
@@ -325,24 +373,26 @@ class FreightOrder(models.Model):
             else:
                 record.end_date = False
 
-    @api.depends('receiving_date', 'free_days')
+    @api.depends('end_date')
     def _compute_end_date_date(self):
-        """Compute End Date as receiving_date + free_days and format as MM/DD/YYYY"""
+        """Format the free days deadline as MM/DD/YYYY"""
         for record in self:
-            if record.receiving_date and record.free_days:
-                end_date = record.receiving_date + timedelta(days=record.free_days)
-                record.end_date_date = end_date.strftime('%m/%d/%Y')  # Format as MM/DD/YYYY
-            else:
-                record.end_date_date = ''
+            record.end_date_date = record.end_date.strftime('%m/%d/%Y') if record.end_date else ''
 
-    @api.depends('receiving_date', 'free_days')
+    @api.depends('end_date')
+    def _compute_remaining_days(self):
+        """Days left until the free days deadline, relative to today"""
+        today = fields.Date.today()
+        for record in self:
+            record.remaining_days = (record.end_date - today).days if record.end_date else 0
+
+    @api.depends('end_date')
     def _compute_remaining_days_text(self):
         """Compute remaining days as text - always shows days regardless of threshold"""
+        today = fields.Date.today()
         for record in self:
-            if record.receiving_date and record.free_days:
-                end_date = record.receiving_date + timedelta(days=record.free_days)
-                today = fields.Date.today()
-                days_diff = (end_date - today).days
+            if record.end_date:
+                days_diff = (record.end_date - today).days
 
                 if days_diff > 0:
                     record.remaining_days_text = f"{days_diff} days remaining"
@@ -374,22 +424,6 @@ class FreightOrder(models.Model):
     def _default_stage(self):
         return self.env['freight.order.stage'].search([], order='sequence', limit=1)
 
-    # def _compute_purchase_count(self):
-    #     for record in self:
-    #         record.purchase_count = self.env['purchase.order'].search_count([('freight_order_id', '=', record.id)])
-
-    def _compute_purchase_count(self):
-        for record in self:
-            # Count purchase orders related to this freight order in two ways:
-            # 1. Purchase orders that have this freight as their main freight_order_id
-            # 2. The purchase order referenced directly in this freight's purchase_order_id field
-
-            record.purchase_count = self.env['purchase.order'].search_count([
-                '|',
-                ('freight_order_id', '=', record.id),  # Main freight reference
-                ('id', '=', record.purchase_order_id.id if record.purchase_order_id else False)  # Direct reference
-            ])
-
     # @api.depends('total_order_price')
     # def _compute_insurance(self):
     #     for record in self:
@@ -400,28 +434,12 @@ class FreightOrder(models.Model):
         for record in self:
             record.one_thousand = record.insurance / 1000 if record.insurance else 0.0
 
-    # def _compute_sales_count(self):
-    #     for record in self:
-    #         record.sales_count = self.env['sale.order'].search_count([('freight_order_id', '=', record.id)])
-
-    def _compute_sales_count(self):
-        for record in self:
-            record.sales_count = self.env['sale.order'].search_count([
-                '|',
-                ('freight_order_id', '=', record.id),
-                ('id', '=', record.sale_order_id.id if record.sale_order_id else False)
-            ])
-
     def action_view_purchase_orders(self):
         # Find purchase orders related to this freight order in two ways:
         # 1. Purchase orders that have this freight as their main freight_order_id
         # 2. The purchase order referenced directly in this freight's purchase_order_id field
 
-        purchase_orders = self.env['purchase.order'].search([
-            '|',
-            ('freight_order_id', '=', self.id),  # Main freight reference
-            ('id', '=', self.purchase_order_id.id if self.purchase_order_id else False)  # Direct reference
-        ])
+        purchase_orders = self._get_related_orders('purchase.order')[self.id]
 
         if len(purchase_orders) == 1:
             return {
@@ -465,11 +483,7 @@ class FreightOrder(models.Model):
         # 1. Sales orders that have this freight as their main freight_order_id
         # 2. The sales order referenced directly in this freight's sale_order_id field
 
-        sales_orders = self.env['sale.order'].search([
-            '|',
-            ('freight_order_id', '=', self.id),  # Main freight reference
-            ('id', '=', self.sale_order_id.id if self.sale_order_id else False)  # Direct reference
-        ])
+        sales_orders = self._get_related_orders('sale.order')[self.id]
 
         if len(sales_orders) == 1:
             return {
@@ -489,8 +503,10 @@ class FreightOrder(models.Model):
         }
 
     def _compute_project_count(self):
+        counts = dict(self.env['project.project']._read_group(
+            [('name', 'in', [name for name in self.mapped('name') if name])], ['name'], ['__count']))
         for rec in self:
-            rec.project_count = self.env['project.project'].search_count([('name', '=', rec.name)])
+            rec.project_count = counts.get(rec.name, 0)
 
     def _compute_project_button(self):
         for rec in self:
@@ -596,6 +612,8 @@ class FreightOrder(models.Model):
             'invoice_origin': self.name,  # Reference
             'ref': self.name,  # Reference field
             'invoice_line_ids': [],  # ✅ Create an EMPTY Bill (No lines)
+            'freight_order_id': self.id,
+            'freight_invoice_type': 'bill',
         }
 
         bill = self.env['account.move'].create(bill_data)
@@ -645,6 +663,8 @@ class FreightOrder(models.Model):
             'invoice_origin': self.name,
             'ref': self.name,
             'invoice_line_ids': lines,
+            'freight_order_id': self.id,
+            'freight_invoice_type': 'freight',
         }
         inv = self.env['account.move'].create(invoice_line)
         result = {
@@ -731,6 +751,8 @@ class FreightOrder(models.Model):
             'invoice_origin': self.name,
             'ref': f"{self.name} - 2/100 Tax",
             'invoice_line_ids': lines,
+            'freight_order_id': self.id,
+            'freight_invoice_type': 'gafi',
         }
 
         inv = self.env['account.move'].create(invoice_vals)
@@ -766,18 +788,13 @@ class FreightOrder(models.Model):
     @api.depends('name')
     def _compute_count(self):
         """Compute custom clearance and account move's count"""
+        clearance_counts = dict(self.env['custom.clearance']._read_group(
+            [('freight_id', 'in', self.ids)], ['freight_id'], ['__count']))
+        invoice_counts = dict(self.env['account.move']._read_group(
+            [('ref', 'in', [name for name in self.mapped('name') if name])], ['ref'], ['__count']))
         for rec in self:
-            if rec.env['custom.clearance'].search(
-                    [('freight_id', '=', rec.id)]):
-                rec.clearance_count = rec.env['custom.clearance'].search_count(
-                    [('freight_id', '=', rec.id)])
-            else:
-                rec.clearance_count = 0
-            if rec.env['account.move'].search([('ref', '=', rec.name)]):
-                rec.invoice_count = rec.env['account.move'].search_count(
-                    [('ref', '=', rec.name)])
-            else:
-                rec.invoice_count = 0
+            rec.clearance_count = clearance_counts.get(rec, 0)
+            rec.invoice_count = invoice_counts.get(rec.name, 0)
 
     def action_submit(self):
         """Submitting order and confirming the linked freight record"""
@@ -854,14 +871,54 @@ class FreightOrderLine(models.Model):
 
     item_number = fields.Char(string='Item', readonly=True)
 
+    @api.model_create_multi
+    def create(self, vals_list):
+        order_ids = {vals['order_id'] for vals in vals_list if 'order_id' in vals}
+        if order_ids:
+            # Number the lines of each order after its existing lines
+            counts = {
+                order.id: count
+                for order, count in self._read_group(
+                    [('order_id', 'in', list(order_ids))], ['order_id'], ['__count'])
+            }
+            for vals in vals_list:
+                if 'order_id' in vals:
+                    counts[vals['order_id']] = counts.get(vals['order_id'], 0) + 1
+                    vals['item_number'] = str(counts[vals['order_id']]).zfill(3)  # '001', '002', etc.
+        return super(FreightOrderLine, self).create(vals_list)
+
     @api.model
-    def create(self, vals):
-        if 'order_id' in vals:
-            order_id = vals['order_id']
-            order = self.env['freight.order'].browse(order_id)
-            existing_lines = self.search_count([('order_id', '=', order.id)])
-            vals['item_number'] = str(existing_lines + 1).zfill(3)  # '001', '002', etc.
-        return super(FreightOrderLine, self).create(vals)
+    def _add_shipment_lines(self, vals_list):
+        """Add shipped goods to freight orders.
+
+        The quantity of a product already on the freight order is added to
+        its line, the other products get new lines created with one create
+        call. The existing lines are loaded with one query.
+
+        :param vals_list: values of freight order lines, with order_id and
+            product_id
+        :return: the created lines
+        """
+        existing = {}
+        lines = self.search_fetch([
+            ('order_id', 'in', list({vals['order_id'] for vals in vals_list})),
+            ('product_id', 'in', list({vals['product_id'] for vals in vals_list})),
+        ], ['order_id', 'product_id', 'product_qty'], order='id')
+        for line in lines:
+            existing.setdefault((line.order_id.id, line.product_id.id), line)
+        added = defaultdict(float)
+        to_create = {}
+        for vals in vals_list:
+            key = (vals['order_id'], vals['product_id'])
+            if key in existing:
+                added[existing[key]] += vals['product_qty']
+            elif key in to_create:
+                to_create[key]['product_qty'] += vals['product_qty']
+            else:
+                to_create[key] = dict(vals)
+        for line, quantity in added.items():
+            line.product_qty += quantity
+        return self.create(list(to_create.values()))
 
     order_id = fields.Many2one('freight.order', string="Freight Order",
                                help="Reference from freight order")
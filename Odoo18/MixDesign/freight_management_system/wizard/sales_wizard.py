@@ -1,3 +1,5 @@
+from collections import defaultdict
+
 from odoo import models, fields, api, _
 from odoo.exceptions import ValidationError
 
@@ -36,40 +38,55 @@ class SaleOrderLineWizard(models.TransientModel):
 
     def action_confirm_lines(self):
         """ Confirm and update Sales Order Lines """
-        FreightOrder = self.env['freight.order']
-        FreightOrderLine = self.env['freight.order.line']
-
-        new_freight = False
-
-        if self.existing_freight == 'new':
-            # Create a new freight order with sales order reference
-            new_freight = FreightOrder.create({
-                'shipper_id': self.shipper_id.id,
-                'agent_id': self.agent_id.id,
-                'type': self.type,
-                'import_type': self.import_type,
-                'export_type': self.export_type,
-                'transport_type': self.transport_type,
-                'loading_port_id': self.loading_port_id.id,
-                # 'product_display_name': self.product_display_name,
-                'incoterm': self.incoterm.id,
-                'incoterm_location': self.incoterm_location,
-                'discharging_port_id': self.discharging_port_id.id,
-                'plan_field': self.plan_field.id,
-                # Add sales order reference to the freight order
-                'sale_order_id': self.sale_order_id.id,  # Make sure your freight.order model has this field
-            })
-            # Don't automatically link to sales order anymore - allow multiple freights
-            # self.freight_order_id = new_freight.id
-
-        elif self.existing_freight == 'existing' and self.freight_order_id:
-            new_freight = self.freight_order_id
+        # Validate all lines before processing
+        self._check_shipment_quantities()
 
-        # ✅ Only link the Sales Order to the FIRST freight order created (for main reference)
-        if new_freight and not self.sale_order_id.freight_order_id:
-            self.sale_order_id.freight_order_id = new_freight.id
+        freights = self._get_freight_orders()
+        for wizard, freight in freights.items():
+            # ✅ Only link the Sales Order to the FIRST freight order created (for main reference)
+            if not wizard.sale_order_id.freight_order_id:
+                wizard.sale_order_id.freight_order_id = freight.id
 
-        # Validate all lines before processing
+        # Process all lines after validation passes
+        order_line_vals = {}
+        freight_line_vals = []
+        for line in self.line_ids:
+            order_line = line.order_line_id
+            # Update the related sales order line's shipment quantity (accumulate, don't replace)
+            vals = order_line_vals.setdefault(order_line, {
+                'shipment_quantity': order_line.shipment_quantity or 0,
+            })
+            vals.update({
+                'shipment_quantity': vals['shipment_quantity'] + line.shipment_quantity,
+                'gross_weight': line.gross_weight,
+                'net_weight': line.net_weight,
+                'secondary_uom_id': line.secondary_uom_id.id,
+                'secondary_quantity': line.secondary_quantity,
+                'pre_quantity': line.pre_quantity,
+                'price_unit': line.price_unit,
+            })
+            freight = freights.get(line.wizard_id)
+            if freight:
+                freight_line_vals.append({
+                    'order_id': freight.id,
+                    'product_id': order_line.product_id.id,
+                    'product_display_name': line.product_display_name,
+                    'secondary_uom_id': line.secondary_uom_id.id,
+                    'secondary_quantity': line.secondary_quantity,
+                    'product_qty': line.shipment_quantity,
+                    'price': line.price_unit,
+                    'weight': line.gross_weight,
+                    'net_weight': line.net_weight,
+                })
+        for order_line, vals in order_line_vals.items():
+            order_line.write(vals)
+        if freight_line_vals:
+            self.env['freight.order.line']._add_shipment_lines(freight_line_vals)
+
+    def _check_shipment_quantities(self):
+        """Check the shipment quantities of the lines against the remaining
+        quantities of their sales order lines, in memory"""
+        shipped = defaultdict(float)
         for line in self.line_ids:
             # Check if shipment quantity is set and greater than zero
             if not line.shipment_quantity or line.shipment_quantity <= 0:
@@ -77,46 +94,45 @@ class SaleOrderLineWizard(models.TransientModel):
                     "Shipment Quantity must be set and greater than zero for all lines before confirming."
                 ))
 
-            # Check if shipment quantity exceeds remaining quantity (if you have remaining_qty field)
-            # Adjust this validation based on your sales order line fields
-            remaining_qty = line.order_line_id.product_uom_qty - (line.order_line_id.shipment_quantity or 0)
+            # Check if shipment quantity exceeds remaining quantity, including
+            # the quantities of the previous lines of the same sales order line
+            order_line = line.order_line_id
+            remaining_qty = order_line.product_uom_qty - (order_line.shipment_quantity or 0) - shipped[order_line]
             if line.shipment_quantity > remaining_qty:
                 raise ValidationError(_(
                     "Shipment Quantity (%.2f) cannot exceed the remaining quantity (%.2f) for product '%s'."
-                ) % (line.shipment_quantity, remaining_qty, line.order_line_id.product_id.name))
+                ) % (line.shipment_quantity, remaining_qty, order_line.product_id.name))
+            shipped[order_line] += line.shipment_quantity
 
-        # Process all lines after validation passes
-        for line in self.line_ids:
-            if line.shipment_quantity:
-                # Update the related sales order line's shipment quantity (accumulate, don't replace)
-                line.order_line_id.shipment_quantity = (
-                                                               line.order_line_id.shipment_quantity or 0) + line.shipment_quantity
-                line.order_line_id.gross_weight = line.gross_weight
-                line.order_line_id.net_weight = line.net_weight
-                line.order_line_id.secondary_uom_id = line.secondary_uom_id
-                line.order_line_id.secondary_quantity = line.secondary_quantity
-                line.order_line_id.pre_quantity = line.pre_quantity
-                line.order_line_id.price_unit = line.price_unit
-
-                existing_line = FreightOrderLine.search([
-                    ('order_id', '=', new_freight.id),
-                    ('product_id', '=', line.order_line_id.product_id.id)
-                ], limit=1)
-
-                if existing_line:
-                    existing_line.product_qty += line.shipment_quantity
-                else:
-                    FreightOrderLine.create({
-                        'order_id': new_freight.id,
-                        'product_id': line.order_line_id.product_id.id,
-                        'product_display_name': line.product_display_name,
-                        'secondary_uom_id': line.secondary_uom_id.id,
-                        'secondary_quantity': line.secondary_quantity,
-                        'product_qty': line.shipment_quantity,
-                        'price': line.price_unit,
-                        'weight': line.gross_weight,
-                        'net_weight': line.net_weight,
-                    })
+    def _prepare_freight_order_vals(self):
+        return {
+            'shipper_id': self.shipper_id.id,
+            'agent_id': self.agent_id.id,
+            'type': self.type,
+            'import_type': self.import_type,
+            'export_type': self.export_type,
+            'transport_type': self.transport_type,
+            'loading_port_id': self.loading_port_id.id,
+            'incoterm': self.incoterm.id,
+            'incoterm_location': self.incoterm_location,
+            'discharging_port_id': self.discharging_port_id.id,
+            'plan_field': self.plan_field.id,
+            # Add sales order reference to the freight order
+            'sale_order_id': self.sale_order_id.id,
+        }
+
+    def _get_freight_orders(self):
+        """Return {wizard: freight order}, the new freight orders of all the
+        wizards being created with one create call"""
+        to_create = self.filtered(lambda wizard: wizard.existing_freight == 'new')
+        new_freights = self.env['freight.order'].create([
+            wizard._prepare_freight_order_vals() for wizard in to_create
+        ])
+        freights = dict(zip(to_create, new_freights))
+        for wizard in self - to_create:
+            if wizard.existing_freight == 'existing' and wizard.freight_order_id:
+                freights[wizard] = wizard.freight_order_id
+        return freights
 
     # def action_confirm_lines(self):
     #     """ Confirm and update Sales Order Lines """
@@ -1,8 +1,25 @@
 # -*- coding: utf-8 -*-
 
 from odoo import models, fields
+from odoo.tools import SQL
 from datetime import datetime
-from collections import defaultdict
+from collections import defaultdict, namedtuple
+
+# Rows of the data-gathering queries, shared by the PDF and the XLSX report
+SaleLineRow = namedtuple('SaleLineRow', [
+    'id', 'order_id', 'product_id', 'uom_id', 'display_type', 'product_type',
+    'product_uom_qty', 'qty_delivered', 'qty_invoiced', 'price_unit', 'price_subtotal',
+    'price_total', 'discount', 'tax_amount', 'purchase_price', 'margin', 'margin_percent',
+    'is_delivery', 'demand_qty', 'matches_filters',
+])
+PurchaseLineRow = namedtuple('PurchaseLineRow', [
+    'id', 'order_id', 'product_id', 'uom_id', 'product_qty', 'qty_received', 'qty_invoiced',
+    'price_unit', 'price_subtotal', 'matches_filters',
+])
+PickingRow = namedtuple('PickingRow', [
+    'id', 'order_id', 'state', 'scheduled_date', 'date_done', 'location_usage', 'location_dest_usage',
+    'quantities',
+])
 
 
 class ReportOperations(models.AbstractModel):
@@ -93,7 +110,7 @@ class ReportOperations(models.AbstractModel):
             'o': self.env.company,
         }
 
-    def _get_sales_data(self, data):
+    def _get_sales_data(self, data, with_pickings=False):
         SaleOrder = self.env['sale.order']
 
         # Build domain for sales orders
@@ -116,6 +133,17 @@ class ReportOperations(models.AbstractModel):
             domain.append(('warehouse_id', '=', data['warehouse_id']))
 
         orders = SaleOrder.search(domain)
+        rows_by_order = defaultdict(list)
+        for row in self._query_sale_lines(orders.ids, data):
+            rows_by_order[row.order_id].append(row)
+        pickings_by_order = self._query_sale_pickings(orders.ids) if with_pickings else {}
+        costs = None
+        if data.get('cost_method') == 'delivery' and 'stock.valuation.layer' in self.env:
+            costs = self._query_delivered_costs([row.id for rows in rows_by_order.values() for row in rows])
+        products = self._get_product_info(
+            {row.product_id for rows in rows_by_order.values() for row in rows if row.product_id},
+            data['company_id'])
+        uom_names = self._get_names('uom.uom', {row.uom_id for rows in rows_by_order.values() for row in rows})
 
         report_orders = []
         total_amount = total_qty = total_cost = total_profit = 0.0
@@ -123,42 +151,44 @@ class ReportOperations(models.AbstractModel):
         for order in orders:
             order_total_cost = order_total_profit = 0.0
             lines_data = []
+            rows = rows_by_order[order.id]
 
-            for line in order.order_line:
-                # Apply product filters if specified
-                if data.get('product_id') and line.product_id.id != data['product_id']:
-                    continue
-                if data.get('product_category_id') and line.product_id.categ_id.id != data['product_category_id']:
+            for row in rows:
+                # Product filters are applied by the query
+                if not row.matches_filters:
                     continue
+                product = products.get(row.product_id, {})
 
-                # Calculate costs and profits
-                standard_cost = line.product_id.standard_price
-                line_cost = standard_cost * line.qty_delivered
-                line_profit = line.price_subtotal - line_cost
+                # Calculate costs and profits, at delivery or at the current cost
+                if costs is not None:
+                    line_cost = costs.get(row.id, 0.0)
+                else:
+                    line_cost = product.get('standard_price', 0.0) * row.qty_delivered
+                line_profit = row.price_subtotal - line_cost
 
                 order_total_cost += line_cost
                 order_total_profit += line_profit
 
                 lines_data.append({
                     'type': 'sale',
-                    'product_name': line.product_id.display_name,
-                    'product_code': line.product_id.default_code or '',
-                    'product_category': line.product_id.categ_id.name,
-                    'ordered_qty': line.product_uom_qty,
-                    'delivered_qty': line.qty_delivered,
-                    'invoiced_qty': line.qty_invoiced,
-                    'unit_price': line.price_unit,
-                    'subtotal': line.price_subtotal,
-                    'discount': line.discount,
+                    'product_name': product.get('display_name', ''),
+                    'product_code': product.get('default_code', ''),
+                    'product_category': product.get('category', ''),
+                    'ordered_qty': row.product_uom_qty,
+                    'delivered_qty': row.qty_delivered,
+                    'invoiced_qty': row.qty_invoiced,
+                    'unit_price': row.price_unit,
+                    'subtotal': row.price_subtotal,
+                    'discount': row.discount,
                     'cost': line_cost,
                     'profit': line_profit,
-                    'profit_margin': (line_profit / line.price_subtotal * 100) if line.price_subtotal > 0 else 0,
-                    'uom': line.product_uom.name,
-                    'tax_amount': sum(line.tax_id.mapped('amount')),
+                    'profit_margin': (line_profit / row.price_subtotal * 100) if row.price_subtotal > 0 else 0,
+                    'uom': uom_names.get(row.uom_id, ''),
+                    'tax_amount': row.tax_amount,
                 })
 
             total_amount += order.amount_total
-            total_qty += sum(order.order_line.mapped('product_uom_qty'))
+            total_qty += sum(row.product_uom_qty for row in rows)
             total_cost += order_total_cost
             total_profit += order_total_profit
 
@@ -166,6 +196,8 @@ class ReportOperations(models.AbstractModel):
                 'type': 'sale',
                 'order': order,
                 'lines': lines_data,
+                'rows': rows,
+                'pickings': pickings_by_order.get(order.id, []),
                 'total_cost': order_total_cost,
                 'total_profit': order_total_profit,
                 'profit_margin': (order_total_profit / order.amount_total * 100) if order.amount_total > 0 else 0,
@@ -182,6 +214,8 @@ class ReportOperations(models.AbstractModel):
 
         return {
             'orders': report_orders,
+            'products': products,
+            'costs': costs,
             'summary': {
                 'total_amount': total_amount,
                 'total_qty': total_qty,
@@ -208,34 +242,41 @@ class ReportOperations(models.AbstractModel):
             domain.append(('state', 'in', ['purchase', 'done']))
 
         orders = PurchaseOrder.search(domain)
+        rows_by_order = defaultdict(list)
+        for row in self._query_purchase_lines(orders.ids, data):
+            rows_by_order[row.order_id].append(row)
+        products = self._get_product_info(
+            {row.product_id for rows in rows_by_order.values() for row in rows if row.product_id},
+            data['company_id'])
+        uom_names = self._get_names('uom.uom', {row.uom_id for rows in rows_by_order.values() for row in rows})
 
         report_orders = []
         total_amount = total_qty = 0.0
 
         for order in orders:
             lines_data = []
+            rows = rows_by_order[order.id]
 
-            for line in order.order_line:
-                if data.get('product_id') and line.product_id.id != data['product_id']:
-                    continue
-                if data.get('product_category_id') and line.product_id.categ_id.id != data['product_category_id']:
+            for row in rows:
+                if not row.matches_filters:
                     continue
+                product = products.get(row.product_id, {})
 
                 lines_data.append({
                     'type': 'purchase',
-                    'product_name': line.product_id.display_name,
-                    'product_code': line.product_id.default_code or '',
-                    'product_category': line.product_id.categ_id.name,
-                    'ordered_qty': line.product_qty,
-                    'received_qty': line.qty_received,
-                    'invoiced_qty': line.qty_invoiced,
-                    'unit_price': line.price_unit,
-                    'subtotal': line.price_subtotal,
-                    'uom': line.product_uom.name,
+                    'product_name': product.get('display_name', ''),
+                    'product_code': product.get('default_code', ''),
+                    'product_category': product.get('category', ''),
+                    'ordered_qty': row.product_qty,
+                    'received_qty': row.qty_received,
+                    'invoiced_qty': row.qty_invoiced,
+                    'unit_price': row.price_unit,
+                    'subtotal': row.price_subtotal,
+                    'uom': uom_names.get(row.uom_id, ''),
                 })
 
             total_amount += order.amount_total
-            total_qty += sum(order.order_line.mapped('product_qty'))
+            total_qty += sum(row.product_qty for row in rows)
 
             report_orders.append({
                 'type': 'purchase',
@@ -272,43 +313,207 @@ class ReportOperations(models.AbstractModel):
         if data.get('partner_id'):
             domain.append(('partner_id', '=', data['partner_id']))
 
-        invoices = AccountMove.search(domain)
-
-        total_invoiced = sum(invoices.mapped('amount_total'))
-        total_paid = sum(invoices.filtered(lambda inv: inv.payment_state == 'paid').mapped('amount_total'))
+        total_invoiced = total_paid = 0.0
+        count = 0
+        for payment_state, amount_total, move_count in AccountMove._read_group(
+                domain, ['payment_state'], ['amount_total:sum', '__count']):
+            total_invoiced += amount_total
+            count += move_count
+            if payment_state == 'paid':
+                total_paid += amount_total
 
         return {
             'total_invoiced': total_invoiced,
             'total_paid': total_paid,
-            'count': len(invoices)
+            'count': count
         }
 
     def _get_stock_data(self, data):
         StockMove = self.env['stock.move']
-
-        domain = [
-            ('date', '>=', data['date_from']),
-            ('date', '<=', data['date_to']),
-            ('company_id', '=', data['company_id']),
-            ('state', '=', 'done')
+        StockMove.flush_model(['date', 'company_id', 'state', 'product_id', 'product_qty',
+                               'location_id', 'location_dest_id'])
+        self.env['stock.location'].flush_model(['usage'])
+
+        conditions = [
+            SQL("sm.date >= %s", data['date_from']),
+            SQL("sm.date <= %s", data['date_to']),
+            SQL("sm.company_id = %s", data['company_id']),
+            SQL("sm.state = 'done'"),
         ]
-
         if data.get('product_id'):
-            domain.append(('product_id', '=', data['product_id']))
+            conditions.append(SQL("sm.product_id = %s", data['product_id']))
         if data.get('warehouse_id'):
             warehouse = self.env['stock.warehouse'].browse(data['warehouse_id'])
-            location_ids = warehouse.view_location_id.child_ids.ids + [warehouse.view_location_id.id]
-            domain.append(('|'))
-            domain.append(('location_id', 'in', location_ids))
-            domain.append(('location_dest_id', 'in', location_ids))
-
-        moves = StockMove.search(domain)
-
-        stock_in = sum(moves.filtered(lambda m: m.location_dest_id.usage == 'internal').mapped('product_qty'))
-        stock_out = sum(moves.filtered(lambda m: m.location_id.usage == 'internal').mapped('product_qty'))
+            location_ids = tuple(warehouse.view_location_id.child_ids.ids + [warehouse.view_location_id.id])
+            conditions.append(SQL("(sm.location_id IN %s OR sm.location_dest_id IN %s)", location_ids, location_ids))
+
+        self.env.cr.execute(SQL("""
+            SELECT COUNT(*),
+                   COALESCE(SUM(sm.product_qty) FILTER (WHERE dest.usage = 'internal'), 0),
+                   COALESCE(SUM(sm.product_qty) FILTER (WHERE src.usage = 'internal'), 0)
+              FROM stock_move sm
+              JOIN stock_location src ON src.id = sm.location_id
+              JOIN stock_location dest ON dest.id = sm.location_dest_id
+             WHERE %s
+        """, SQL(" AND ").join(conditions)))
+        total_moves, stock_in, stock_out = self.env.cr.fetchone()
 
         return {
-            'total_moves': len(moves),
+            'total_moves': total_moves,
             'stock_in': stock_in,
             'stock_out': stock_out
         }
+
+    # Data-gathering layer: one query per document type, the product and
+    # category filters are evaluated by the database
+
+    def _optional_column(self, model_name, alias, field_name, default='NULL'):
+        """Column ``alias.field_name`` if the field is stored on the model
+        (it may come from an optional module), ``default`` otherwise"""
+        field = self.env[model_name]._fields.get(field_name)
+        if field and field.store and field.column_type:
+            if default == 'NULL':
+                return SQL.identifier(alias, field_name)
+            return SQL("COALESCE(%s, %s)", SQL.identifier(alias, field_name), SQL(default))
+        return SQL(default)
+
+    def _filters_sql(self, data, alias):
+        """Whether the line ``alias`` matches the product and category filters"""
+        return SQL(
+            "(%s::int IS NULL OR %s = %s) AND (%s::int IS NULL OR pt.categ_id = %s)",
+            data.get('product_id') or None, SQL.identifier(alias, 'product_id'), data.get('product_id') or None,
+            data.get('product_category_id') or None, data.get('product_category_id') or None,
+        )
+
+    def _query_sale_lines(self, order_ids, data, only_matching=False):
+        """Return the lines of the sale orders as SaleLineRow tuples, in the
+        order of the lines of each order"""
+        if not order_ids:
+            return []
+        SaleLine = self.env['sale.order.line']
+        SaleLine.flush_model()
+        self.env['product.product'].flush_model(['product_tmpl_id'])
+        self.env['product.template'].flush_model(['categ_id', 'type'])
+        tax_field = SaleLine._fields['tax_id']
+        where = SQL("sol.order_id IN %s", tuple(order_ids))
+        if only_matching:
+            where = SQL("%s AND %s", where, self._filters_sql(data, 'sol'))
+        self.env.cr.execute(SQL("""
+            SELECT sol.id, sol.order_id, sol.product_id, sol.product_uom, sol.display_type, pt.type,
+                   COALESCE(sol.product_uom_qty, 0), COALESCE(sol.qty_delivered, 0),
+                   COALESCE(sol.qty_invoiced, 0), COALESCE(sol.price_unit, 0),
+                   COALESCE(sol.price_subtotal, 0), COALESCE(sol.price_total, 0), COALESCE(sol.discount, 0),
+                   (SELECT COALESCE(SUM(tax.amount), 0)
+                      FROM %(tax_rel)s rel
+                      JOIN account_tax tax ON tax.id = rel.%(tax_col)s
+                     WHERE rel.%(line_col)s = sol.id),
+                   %(purchase_price)s, %(margin)s, %(margin_percent)s, %(is_delivery)s, %(demand_qty)s,
+                   %(filters)s
+              FROM sale_order_line sol
+         LEFT JOIN product_product pp ON pp.id = sol.product_id
+         LEFT JOIN product_template pt ON pt.id = pp.product_tmpl_id
+             WHERE %(where)s
+          ORDER BY sol.order_id, sol.sequence, sol.id
+        """,
+            tax_rel=SQL.identifier(tax_field.relation),
+            tax_col=SQL.identifier(tax_field.column2),
+            line_col=SQL.identifier(tax_field.column1),
+            purchase_price=self._optional_column('sale.order.line', 'sol', 'purchase_price', '0'),
+            margin=self._optional_column('sale.order.line', 'sol', 'margin', '0'),
+            margin_percent=self._optional_column('sale.order.line', 'sol', 'margin_percent', '0'),
+            is_delivery=self._optional_column('sale.order.line', 'sol', 'is_delivery', 'FALSE'),
+            demand_qty=self._optional_column('sale.order.line', 'sol', 'demand_qty', '0'),
+            filters=self._filters_sql(data, 'sol'),
+            where=where,
+        ))
+        return [SaleLineRow(*values) for values in self.env.cr.fetchall()]
+
+    def _query_purchase_lines(self, order_ids, data):
+        """Return the lines of the purchase orders as PurchaseLineRow tuples"""
+        if not order_ids:
+            return []
+        self.env['purchase.order.line'].flush_model()
+        self.env['product.product'].flush_model(['product_tmpl_id'])
+        self.env['product.template'].flush_model(['categ_id'])
+        self.env.cr.execute(SQL("""
+            SELECT pol.id, pol.order_id, pol.product_id, pol.product_uom,
+                   COALESCE(pol.product_qty, 0), COALESCE(pol.qty_received, 0), COALESCE(pol.qty_invoiced, 0),
+                   COALESCE(pol.price_unit, 0), COALESCE(pol.price_subtotal, 0),
+                   %s
+              FROM purchase_order_line pol
+         LEFT JOIN product_product pp ON pp.id = pol.product_id
+         LEFT JOIN product_template pt ON pt.id = pp.product_tmpl_id
+             WHERE pol.order_id IN %s
+          ORDER BY pol.order_id, pol.sequence, pol.id
+        """, self._filters_sql(data, 'pol'), tuple(order_ids)))
+        return [PurchaseLineRow(*values) for values in self.env.cr.fetchall()]
+
+    def _query_sale_pickings(self, order_ids):
+        """Return {sale order id: [PickingRow]} sorted by scheduled date, the
+        quantities being {product id: quantity} of the moves of the picking
+        that are not in an entire package"""
+        if not order_ids:
+            return {}
+        self.env['stock.picking'].flush_model()
+        self.env['stock.move'].flush_model(['picking_id', 'product_id', 'product_uom_qty', 'package_level_id'])
+        self.env['stock.location'].flush_model(['usage'])
+        self.env['stock.picking.type'].flush_model(['show_entire_packs'])
+        self.env.cr.execute(SQL("""
+            SELECT sp.sale_id, sp.id, sp.state, sp.scheduled_date, sp.date_done, src.usage, dest.usage,
+                   sm.product_id, SUM(sm.product_uom_qty)
+              FROM stock_picking sp
+              JOIN stock_location src ON src.id = sp.location_id
+              JOIN stock_location dest ON dest.id = sp.location_dest_id
+         LEFT JOIN stock_picking_type spt ON spt.id = sp.picking_type_id
+         LEFT JOIN stock_move sm ON sm.picking_id = sp.id
+                   AND (sm.package_level_id IS NULL OR NOT COALESCE(spt.show_entire_packs, FALSE))
+             WHERE sp.sale_id IN %s
+          GROUP BY sp.sale_id, sp.id, src.usage, dest.usage, sm.product_id
+          ORDER BY sp.scheduled_date, sp.id
+        """, tuple(order_ids)))
+        pickings = {}
+        for order_id, picking_id, state, scheduled_date, date_done, usage, dest_usage, product_id, qty \
+                in self.env.cr.fetchall():
+            if picking_id not in pickings:
+                pickings[picking_id] = PickingRow(
+                    picking_id, order_id, state, scheduled_date, date_done, usage, dest_usage, {})
+            if product_id:
+                pickings[picking_id].quantities[product_id] = qty or 0.0
+        result = defaultdict(list)
+        for picking in pickings.values():
+            result[picking.order_id].append(picking)
+        return result
+
+    def _query_delivered_costs(self, sale_line_ids):
+        """Return {sale line id: cost of the delivered quantity}, the value of
+        the stock valuation layers of the moves of the sale lines at the
+        time they were done. Deliveries have negative layers and returns
+        positive ones, the cost is the opposite of their sum."""
+        if not sale_line_ids:
+            return {}
+        self.env['stock.valuation.layer'].flush_model(['stock_move_id', 'value'])
+        self.env['stock.move'].flush_model(['sale_line_id'])
+        self.env.cr.execute(SQL("""
+            SELECT sm.sale_line_id, -SUM(svl.value)
+              FROM stock_valuation_layer svl
+              JOIN stock_move sm ON sm.id = svl.stock_move_id
+             WHERE sm.sale_line_id IN %s
+          GROUP BY sm.sale_line_id
+        """, tuple(sale_line_ids)))
+        return dict(self.env.cr.fetchall())
+
+    def _get_product_info(self, product_ids, company_id):
+        """Names, codes, categories and costs of the products, read in batch"""
+        products = self.env['product.product'].with_company(company_id).browse(list(product_ids))
+        return {
+            product.id: {
+                'display_name': product.display_name,
+                'default_code': product.default_code or '',
+                'category': product.categ_id.name,
+                'standard_price': product.standard_price,
+            }
+            for product in products
+        }
+
+    def _get_names(self, model_name, ids):
+        return {record.id: record.name for record in self.env[model_name].browse([id_ for id_ in ids if id_])}
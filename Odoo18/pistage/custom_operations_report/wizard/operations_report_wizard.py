@@ -1,5 +1,6 @@
 from odoo import models, fields
 from odoo.exceptions import ValidationError
+from collections import defaultdict
 import base64
 import io
 import xlsxwriter
@@ -62,6 +63,15 @@ class OperationsReportWizard(models.TransientModel):
     group_by_category = fields.Boolean(string='Group by Category', default=False)
     show_cost_analysis = fields.Boolean(string='Show Cost Analysis', default=True)
     show_profit_analysis = fields.Boolean(string='Show Profit Analysis', default=True)
+    cost_method = fields.Selection(
+        [('standard', 'Current Cost'), ('delivery', 'Cost at Delivery')],
+        string='Cost Method',
+        default='standard',
+        required=True,
+        help='Current Cost: current cost of the products. '
+             'Cost at Delivery: value of the stock valuation layers of the deliveries, '
+             'requires the inventory valuation (stock_account).',
+    )
     print_type = fields.Selection(
         [('pdf', 'PDF'), ('xlsx', 'Excel')],
         string='Print Type',
@@ -74,7 +84,7 @@ class OperationsReportWizard(models.TransientModel):
     show_delivery_to_customer_section = fields.Boolean(string='ما تم تسليمه للعملاء', default=True)
     show_daily_quotes_section = fields.Boolean(string='الطلبات الجديده (يومي)', default=True)
 
-    def action_print_report(self):
+    def _check_sections(self):
         if not (
             self.show_sales_section
             or self.show_delivery_to_carrier_section
@@ -83,7 +93,9 @@ class OperationsReportWizard(models.TransientModel):
             or self.show_daily_quotes_section
         ):
             raise ValidationError('Please select at least one section to print.')
-        data = {
+
+    def _prepare_report_data(self):
+        return {
             'date_from': self.date_from,
             'date_to': self.date_to,
             'partner_id': self.partner_id.id if self.partner_id else False,
@@ -104,46 +116,45 @@ class OperationsReportWizard(models.TransientModel):
             'group_by_category': self.group_by_category,
             'show_cost_analysis': self.show_cost_analysis,
             'show_profit_analysis': self.show_profit_analysis,
+            'cost_method': self.cost_method,
         }
+
+    def action_print_report(self):
+        self._check_sections()
+        data = self._prepare_report_data()
         return self.env.ref(
             'custom_operations_report.action_operations_report'
         ).report_action(self, data=data)
 
+    @staticmethod
+    def _is_stockable_row(row):
+        return not row.display_type and row.product_id and row.product_type != 'service'
+
     def action_print_xlsx(self):
         self.ensure_one()
-        if not (
-            self.show_sales_section
-            or self.show_delivery_to_carrier_section
-            or self.show_returns_section
-            or self.show_delivery_to_customer_section
-            or self.show_daily_quotes_section
-        ):
-            raise ValidationError('Please select at least one section to print.')
-        data = {
-            'date_from': self.date_from,
-            'date_to': self.date_to,
-            'partner_id': self.partner_id.id if self.partner_id else False,
-            'vendor_id': self.vendor_id.id if self.vendor_id else False,
-            'product_id': self.product_id.id if self.product_id else False,
-            'product_category_id': self.product_category_id.id if self.product_category_id else False,
-            'company_id': self.company_id.id,
-            'warehouse_id': self.warehouse_id.id if self.warehouse_id else False,
-            'salesperson_id': self.salesperson_id.id if self.salesperson_id else False,
-            'include_sales': self.include_sales,
-            'include_purchases': self.include_purchases,
-            'include_invoices': self.include_invoices,
-            'include_stock_moves': self.include_stock_moves,
-            'sale_states': self.sale_states,
-            'purchase_states': self.purchase_states,
-            'group_by_partner': self.group_by_partner,
-            'group_by_product': self.group_by_product,
-            'group_by_category': self.group_by_category,
-            'show_cost_analysis': self.show_cost_analysis,
-            'show_profit_analysis': self.show_profit_analysis,
-        }
+        self._check_sections()
+        data = self._prepare_report_data()
 
+        # The orders, their lines and their pickings are read once and shared
+        # by all the sheets
         report_model = self.env['report.custom_operations_report.operations_report_template']
-        sales_data = report_model._get_sales_data(data) if data.get('include_sales') else {'orders': []}
+        if data.get('include_sales'):
+            sales_data = report_model._get_sales_data(data, with_pickings=True)
+        else:
+            sales_data = {'orders': [], 'products': {}, 'costs': None}
+        products = sales_data['products']
+        costs = sales_data.get('costs')
+
+        def unit_cost(row):
+            if costs is not None:
+                delivered_qty = row.qty_delivered
+                return costs.get(row.id, 0.0) / delivered_qty if delivered_qty else 0.0
+            if 'purchase_price' in self.env['sale.order.line']._fields:
+                return row.purchase_price
+            return products.get(row.product_id, {}).get('standard_price', 0.0)
+
+        def product_name(row):
+            return products.get(row.product_id, {}).get('display_name', '')
 
         output = io.BytesIO()
         workbook = xlsxwriter.Workbook(output, {'in_memory': True})
@@ -173,15 +184,10 @@ class OperationsReportWizard(models.TransientModel):
 
             for entry in sales_data.get('orders', []):
                 order = entry['order']
-                non_service_lines = order.order_line.filtered(
-                    lambda l: not l.display_type and l.product_id and l.product_id.type != 'service'
-                )
-                qty = sum(non_service_lines.mapped('product_uom_qty'))
+                non_service_lines = [line for line in entry['rows'] if self._is_stockable_row(line)]
+                qty = sum(line.product_uom_qty for line in non_service_lines)
                 total = order.amount_total
-                cost = 0.0
-                for line in non_service_lines:
-                    unit_cost = line.purchase_price if hasattr(line, 'purchase_price') else line.product_id.standard_price
-                    cost += unit_cost * line.product_uom_qty
+                cost = sum(unit_cost(line) * line.product_uom_qty for line in non_service_lines)
                 margin = total - cost
                 margin_pct = (margin / total * 100) if total else 0.0
 
@@ -217,43 +223,35 @@ class OperationsReportWizard(models.TransientModel):
 
             for entry in sales_data.get('orders', []):
                 order = entry['order']
-                pickings = order.picking_ids.sorted('scheduled_date')
+                pickings = entry['pickings']
                 if not pickings:
                     continue
 
-                first_picking = pickings[:1]
-                delivered_to_customer = pickings.filtered(
-                    lambda p: p.state == 'done' and p.location_dest_id.usage == 'customer'
+                first_picking = pickings[0]
+                delivered_to_customer = any(
+                    p.state == 'done' and p.location_dest_usage == 'customer' for p in pickings
                 )
                 delivery_status = 'تم التسليم' if delivered_to_customer else 'لم يتم التسليم'
                 delivery_date = first_picking.scheduled_date or first_picking.date_done
 
-                non_service_lines = order.order_line.filtered(
-                    lambda l: not l.display_type and l.product_id and l.product_id.type != 'service'
-                )
-                for line in non_service_lines:
-                    moves = first_picking.move_ids_without_package.filtered(lambda m: m.product_id == line.product_id)
-                    qty = 0.0
-                    if moves:
-                        if 'quantity_done' in moves._fields:
-                            qty = sum(moves.mapped('quantity_done'))
-                        else:
-                            qty = sum(moves.mapped('product_uom_qty'))
-                    if not qty:
-                        qty = line.product_uom_qty
+                for line in entry['rows']:
+                    if not self._is_stockable_row(line):
+                        continue
+                    qty = first_picking.quantities.get(line.product_id) or line.product_uom_qty
 
                     value = line.price_subtotal
-                    unit_cost = line.purchase_price if hasattr(line, 'purchase_price') else line.product_id.standard_price
-                    cost = unit_cost * qty
-                    # margin = value - cost
-                    # margin_pct = (margin / value * 100) if value else 0.0
-                    margin = line.margin
-                    margin_pct = line.margin_percent * 100
+                    cost = unit_cost(line) * qty
+                    if 'margin' in self.env['sale.order.line']._fields:
+                        margin = line.margin
+                        margin_pct = line.margin_percent * 100
+                    else:
+                        margin = value - cost
+                        margin_pct = (margin / value * 100) if value else 0.0
 
                     sheet.write(row, 0, fields.Datetime.to_string(delivery_date) if delivery_date else '', cell_format)
                     sheet.write(row, 1, order.name, cell_format)
                     sheet.write_number(row, 2, qty, num_format)
-                    sheet.write(row, 3, line.product_id.display_name, cell_format)
+                    sheet.write(row, 3, product_name(line), cell_format)
                     sheet.write_number(row, 4, value, num_format)
                     sheet.write(row, 5, delivery_status, cell_format)
                     sheet.write_number(row, 6, cost, num_format)
@@ -280,27 +278,19 @@ class OperationsReportWizard(models.TransientModel):
 
             for entry in sales_data.get('orders', []):
                 order = entry['order']
-                return_pickings = order.picking_ids.filtered(
-                    lambda p: p.location_id.usage == 'customer'
-                    and p.location_dest_id.usage == 'internal'
-                )
+                return_pickings = [
+                    p for p in entry['pickings']
+                    if p.location_usage == 'customer' and p.location_dest_usage == 'internal'
+                ]
                 if not return_pickings:
                     continue
 
-                non_service_lines = order.order_line.filtered(
-                    lambda l: not l.display_type and l.product_id and l.product_id.type != 'service'
-                )
+                non_service_lines = [line for line in entry['rows'] if self._is_stockable_row(line)]
                 for picking in return_pickings:
                     receipt_date = picking.scheduled_date
                     return_date = picking.date_done or picking.scheduled_date
                     for line in non_service_lines:
-                        moves = picking.move_ids_without_package.filtered(lambda m: m.product_id == line.product_id)
-                        qty = 0.0
-                        if moves:
-                            if 'quantity_done' in moves._fields:
-                                qty = sum(moves.mapped('quantity_done'))
-                            else:
-                                qty = sum(moves.mapped('product_uom_qty'))
+                        qty = picking.quantities.get(line.product_id, 0.0)
                         if not qty:
                             continue
 
@@ -310,7 +300,7 @@ class OperationsReportWizard(models.TransientModel):
                         sheet.write(row, 0, fields.Datetime.to_string(receipt_date) if receipt_date else '', cell_format)
                         sheet.write(row, 1, fields.Datetime.to_string(return_date) if return_date else '', cell_format)
                         sheet.write(row, 2, order.name, cell_format)
-                        sheet.write(row, 3, line.product_id.display_name, cell_format)
+                        sheet.write(row, 3, product_name(line), cell_format)
                         sheet.write_number(row, 4, qty, num_format)
                         sheet.write_number(row, 5, value, num_format)
                         row += 1
@@ -335,31 +325,23 @@ class OperationsReportWizard(models.TransientModel):
 
             for entry in sales_data.get('orders', []):
                 order = entry['order']
-                customer_pickings = order.picking_ids.filtered(
-                    lambda p: p.location_dest_id.usage == 'customer' and p.state == 'done'
-                ).sorted('scheduled_date')
+                customer_pickings = [
+                    p for p in entry['pickings']
+                    if p.location_dest_usage == 'customer' and p.state == 'done'
+                ]
                 if not customer_pickings:
                     continue
 
-                non_service_lines = order.order_line.filtered(
-                    lambda l: not l.display_type and l.product_id and l.product_id.type != 'service'
-                )
+                non_service_lines = [line for line in entry['rows'] if self._is_stockable_row(line)]
+                shipping_cost = sum(
+                    line.price_total for line in entry['rows'] if not line.display_type and line.is_delivery
+                ) or 0.0
                 for picking in customer_pickings:
                     delivery_status = 'تم التسليم' if picking.state == 'done' else 'لم يتم التسليم'
                     delivery_date = picking.scheduled_date or picking.date_done
-                    delivery_lines = order.order_line.filtered(
-                        lambda l: not l.display_type and getattr(l, 'is_delivery', False)
-                    )
-                    shipping_cost = sum(delivery_lines.mapped('price_total')) or 0.0
 
                     for line in non_service_lines:
-                        moves = picking.move_ids_without_package.filtered(lambda m: m.product_id == line.product_id)
-                        qty = 0.0
-                        if moves:
-                            if 'quantity_done' in moves._fields:
-                                qty = sum(moves.mapped('quantity_done'))
-                            else:
-                                qty = sum(moves.mapped('product_uom_qty'))
+                        qty = picking.quantities.get(line.product_id, 0.0)
                         if not qty:
                             continue
 
@@ -369,7 +351,7 @@ class OperationsReportWizard(models.TransientModel):
                         sheet.write(row, 0, fields.Datetime.to_string(delivery_date) if delivery_date else '', cell_format)
                         sheet.write(row, 1, order.name, cell_format)
                         sheet.write_number(row, 2, qty, num_format)
-                        sheet.write(row, 3, line.product_id.display_name, cell_format)
+                        sheet.write(row, 3, product_name(line), cell_format)
                         sheet.write_number(row, 4, value, num_format)
                         sheet.write_number(row, 5, shipping_cost, num_format)
                     sheet.write(row, 6, delivery_status, cell_format)
@@ -407,34 +389,24 @@ class OperationsReportWizard(models.TransientModel):
                 quotation_domain.append(('warehouse_id', '=', data['warehouse_id']))
 
             quotations = self.env['sale.order'].search(quotation_domain)
+            # The product filters are applied by the query
+            quote_lines = defaultdict(list)
+            for line in report_model._query_sale_lines(quotations.ids, data, only_matching=True):
+                if self._is_stockable_row(line):
+                    quote_lines[line.order_id].append(line)
+            quote_products = report_model._get_product_info(
+                {line.product_id for lines in quote_lines.values() for line in lines}, data['company_id'])
+            stock_quantities = self._get_quote_stock_quantities(quotations, quote_lines)
+
             for order in quotations:
-                location = order.warehouse_id.lot_stock_id if order.warehouse_id else False
-                order_lines = order.order_line.filtered(
-                    lambda l: not l.display_type and l.product_id and l.product_id.type != 'service'
-                )
-                if data.get('product_id'):
-                    order_lines = order_lines.filtered(lambda l: l.product_id.id == data['product_id'])
-                if data.get('product_category_id'):
-                    order_lines = order_lines.filtered(
-                        lambda l: l.product_id.categ_id.id == data['product_category_id']
-                    )
-
-                for line in order_lines:
-                    product = line.product_id
-                    stock_in_location = (
-                        product.with_context(location=location.id).qty_available if location else product.qty_available
-                    )
-                    available_qty = (
-                        product.with_context(warehouse=order.warehouse_id.id).qty_available
-                        if order.warehouse_id
-                        else product.qty_available
-                    )
+                for line in quote_lines[order.id]:
+                    stock_in_location, available_qty = stock_quantities[order.warehouse_id.id, line.product_id]
 
                     sheet.write(row, 0, fields.Datetime.to_string(order.date_order) if order.date_order else '', cell_format)
                     sheet.write(row, 1, order.partner_id.name or '', cell_format)
-                    sheet.write(row, 2, product.display_name, cell_format)
+                    sheet.write(row, 2, quote_products[line.product_id]['display_name'], cell_format)
                     sheet.write_number(row, 3, line.product_uom_qty, num_format)
-                    sheet.write_number(row, 4, getattr(line, 'demand_qty', 0.0) or 0.0, num_format)
+                    sheet.write_number(row, 4, line.demand_qty or 0.0, num_format)
                     sheet.write_number(row, 5, stock_in_location, num_format)
                     sheet.write_number(row, 6, available_qty, num_format)
                     row += 1
@@ -459,3 +431,23 @@ class OperationsReportWizard(models.TransientModel):
             'url': '/web/content/%s?download=true' % attachment.id,
             'target': 'self',
         }
+
+    def _get_quote_stock_quantities(self, quotations, quote_lines):
+        """Return {(warehouse id, product id): (quantity in the stock location
+        of the warehouse, quantity in the warehouse)}, computed once per
+        warehouse for all the products quoted from it"""
+        product_ids_by_warehouse = defaultdict(set)
+        for order in quotations:
+            product_ids_by_warehouse[order.warehouse_id].update(line.product_id for line in quote_lines[order.id])
+        quantities = {}
+        for warehouse, product_ids in product_ids_by_warehouse.items():
+            products = self.env['product.product'].browse(list(product_ids))
+            if warehouse:
+                in_location = products.with_context(location=warehouse.lot_stock_id.id)
+                in_warehouse = products.with_context(warehouse=warehouse.id)
+            else:
+                in_location = in_warehouse = products
+            available = dict(zip(in_warehouse.ids, in_warehouse.mapped('qty_available')))
+            for product in in_location:
+                quantities[warehouse.id, product.id] = (product.qty_available, available[product.id])
+        return quantities